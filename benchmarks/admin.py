@@ -0,0 +1,72 @@
+"""Admin changelist load time for the log tables, stock vs performance mode.
+
+Seeds ``--rows`` activity rows (and a tenth as many errors) with
+``seed_logs`` and renders changelist pages: the first page, a drilldown to
+one month and one day, and a status filter. "stock" is Django's default
+behaviour (``LOG_ADMIN_PERFORMANCE_MODE=False``): exact counts and
+DISTINCT scans for the filters and the date hierarchy.
+
+    python -m benchmarks.admin --rows 1000000 [--skip-stock]
+"""
+import argparse
+import io
+import time
+
+from .common import report, setup_django
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-stock', action='store_true', help='only measure performance mode')
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False, LOG_BUFFER_ENABLED=False, LOG_CACHE_TIMEOUT=0)
+    try:
+        from django.contrib.auth.models import User
+        from django.core.management import call_command
+        from django.db import connection
+        from django.test import Client, override_settings
+        from django.test.utils import CaptureQueriesContext
+        from django.utils import timezone
+
+        call_command('seed_logs', activities=args.rows, errors=args.rows // 10, days=60,
+                     end=timezone.now().date().isoformat(), stdout=io.StringIO())
+        admin = User.objects.create_superuser('bench-admin', password='pass')
+        client = Client()
+        client.force_login(admin)
+        day = timezone.localtime() - timezone.timedelta(days=10)
+        pages = {
+            'activity.first_page': '/admin/monitoring/activitylog/',
+            'activity.month': f'/admin/monitoring/activitylog/?timestamp__year={day.year}&timestamp__month={day.month}',
+            'activity.day': f'/admin/monitoring/activitylog/?timestamp__year={day.year}'
+                            f'&timestamp__month={day.month}&timestamp__day={day.day}',
+            'activity.action': '/admin/monitoring/activitylog/?action__exact=delete',
+            'error.first_page': '/admin/monitoring/errorlog/',
+            'error.status': '/admin/monitoring/errorlog/?{}=503',
+        }
+        # The rollup-backed status filter has its own parameter.
+        status_param = {'stock': 'status_code__exact', 'performance': 'status'}
+        modes = {'performance': True} if args.skip_stock else {'stock': False, 'performance': True}
+        results = {'rows': args.rows}
+        for mode, enabled in modes.items():
+            with override_settings(LOG_ADMIN_PERFORMANCE_MODE=enabled):
+                for name, url in pages.items():
+                    url = url.format(status_param[mode])
+                    times = []
+                    for _ in range(args.repeat):
+                        with CaptureQueriesContext(connection) as queries:
+                            start = time.perf_counter()
+                            response = client.get(url)
+                            times.append(time.perf_counter() - start)
+                        assert response.status_code == 200, (url, response.status_code)
+                    results.setdefault(name, {})[f'{mode}_ms'] = round(min(times) * 1000, 1)
+                    results[name][f'{mode}_queries'] = len(queries)
+    finally:
+        teardown()
+    return report('admin', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Error-rate anomaly detection cost per event.
+
+Feeds ``anomaly.RateDetector`` events spread over ``--keys`` endpoints or
+fingerprints (Zipf-skewed, as real error traffic is) across ten windows,
+and reports microseconds per ``observe`` call and per
+``utils.track_error_rate`` call (detector plus the alert path). With more
+keys than ``max_keys`` the LRU eviction is included.
+
+    python -m benchmarks.anomaly --events 200000 --keys 100 10000 50000
+"""
+import argparse
+import random
+import time
+from itertools import accumulate
+
+from .common import report, setup_django
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000)
+    parser.add_argument('--keys', type=int, nargs='+', default=[100, 10000, 50000])
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False)
+    try:
+        from monitoring import anomaly, utils
+        from monitoring.seeding import zipf
+
+        results = {'events': args.events}
+        for keys in args.keys:
+            rng = random.Random(keys)
+            names = [f'fingerprint-{i}' for i in range(keys)]
+            picked = rng.choices(names, cum_weights=list(accumulate(zipf(keys, 1.1))), k=args.events)
+            # Ten one-minute windows of simulated time.
+            step = 600.0 / args.events
+            detector = anomaly.RateDetector()
+            start = time.perf_counter()
+            for i, name in enumerate(picked):
+                detector.observe(('fingerprint', name), i * step)
+            observe_us = (time.perf_counter() - start) / args.events * 1e6
+
+            anomaly.detector = anomaly.RateDetector()
+            start = time.perf_counter()
+            for name in picked:
+                utils.track_error_rate('fingerprint', name)
+            track_us = (time.perf_counter() - start) / args.events * 1e6
+            results[f'keys_{keys}'] = {
+                'observe_us': round(observe_us, 3),
+                'track_us': round(track_us, 3),
+                'tracked_keys': detector.stats()['keys'],
+                'spikes': detector.stats()['spikes'],
+            }
+    finally:
+        teardown()
+    return report('anomaly', results)
+
+
+if __name__ == '__main__':
+    main()
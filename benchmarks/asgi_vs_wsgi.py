@@ -0,0 +1,125 @@
+"""Requests/sec through the full middleware stack under ASGI and WSGI.
+
+Both handlers are driven in-process so the numbers measure Django and the
+logging middleware rather than a particular server: the ASGI side issues
+concurrent requests on one event loop the way uvicorn would, the WSGI side
+uses a thread pool the way a threaded WSGI server would.
+
+    python -m benchmarks.asgi_vs_wsgi --requests 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import report, setup_django
+
+PATH = '/api/items/'
+
+
+def asgi_scope(path):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'user-agent', b'bench')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+
+
+async def run_asgi(app, requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            sent = False
+
+            async def receive():
+                nonlocal sent
+                if sent:
+                    await asyncio.sleep(3600)
+                sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                pass
+
+            await app(asgi_scope(PATH), receive, send)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return time.perf_counter() - start
+
+
+def wsgi_environ(path):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_USER_AGENT': 'bench',
+        'wsgi.input': io.BytesIO(b''),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def run_wsgi(app, requests, concurrency):
+    from django.db import connections
+
+    def one(_):
+        b''.join(app(wsgi_environ(PATH), lambda status, headers: None))
+        connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--buffered', action='store_true', help='enable LOG_BUFFER_ENABLED')
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(LOG_BUFFER_ENABLED=args.buffered, DEBUG=False)
+    try:
+        from django.core.asgi import get_asgi_application
+        from django.core.wsgi import get_wsgi_application
+
+        asgi_seconds = asyncio.run(run_asgi(get_asgi_application(), args.requests, args.concurrency))
+        wsgi_seconds = run_wsgi(get_wsgi_application(), args.requests, args.concurrency)
+        from monitoring import buffer
+        buffer.shutdown()
+    finally:
+        teardown()
+
+    return report('asgi_vs_wsgi', {
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'buffered': args.buffered,
+        'asgi_rps': round(args.requests / asgi_seconds, 1),
+        'wsgi_rps': round(args.requests / wsgi_seconds, 1),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Request body capture: the old read-everything path vs ``BodyCapture``.
+
+"legacy" is what the middleware used to do with ``LOG_REQUEST_BODY=1``:
+read the whole body, ``json.loads`` it and redact top-level keys into a
+copy. "capture" is ``capture.BodyCapture`` with the default limits. For each
+payload shape it reports microseconds per request and the peak memory
+allocated while capturing one request (tracemalloc).
+
+    python -m benchmarks.body_capture --requests 200
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from .common import report, setup_django
+
+
+def payloads():
+    nested = {'password': 'p'}
+    for depth in range(60):
+        nested = {'level': depth, 'child': nested, 'tags': ['a', 'b']}
+    return {
+        'small': {'name': 'item', 'description': 'd' * 200, 'password': 'p'},
+        'nested_60': nested,
+        'wide_list': {'items': [{'id': i, 'token': 't', 'note': 'n' * 20} for i in range(200)]},
+        'long_strings': {f'field{i}': 'x' * 4000 for i in range(3)},
+        # Just under Django's DATA_UPLOAD_MAX_MEMORY_SIZE, which the legacy path hits.
+        'upload_2mb': {'blob': 'x' * 2 * 1024 * 1024},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False)
+    try:
+        from django.test import RequestFactory
+        from monitoring import capture
+
+        factory = RequestFactory()
+        body_capture = capture.BodyCapture.from_settings()
+        sensitive = body_capture.sensitive
+
+        def legacy(request):
+            data = json.loads(request.body.decode('utf-8') or '{}')
+            if not isinstance(data, dict):
+                return None
+            return {k: '***' if k.lower() in sensitive else v for k, v in data.items()}
+
+        results = {'requests': args.requests, 'max_bytes': body_capture.max_bytes}
+        for name, payload in payloads().items():
+            body = json.dumps(payload).encode()
+            # Fewer requests for the upload; each one holds its own copy of the body.
+            n = max(1, args.requests // 20) if len(body) > 1024 * 1024 else args.requests
+            row = {'bytes': len(body)}
+            for label, fn in (('legacy', legacy), ('capture', body_capture.capture)):
+                requests = [factory.generic('POST', '/api/items/', body, content_type='application/json')
+                            for _ in range(n + 1)]
+                tracemalloc.start()
+                fn(requests.pop())
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                start = time.perf_counter()
+                for request in requests:
+                    fn(request)
+                row[f'{label}_us'] = round((time.perf_counter() - start) / n * 1e6, 1)
+                row[f'{label}_peak_kb'] = round(peak / 1024, 1)
+            row['speedup'] = round(row['legacy_us'] / row['capture_us'], 2)
+            results[name] = row
+    finally:
+        teardown()
+    return report('body_capture', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(**overrides):
+    """Configure Django against throwaway SQLite files and create the tables.
+
+    Returns a callable that destroys the databases again.
+    """
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'monitor_project.settings')
+
+    from django.conf import settings
+    for name, value in overrides.items():
+        os.environ[name] = str(value)
+    import django
+    django.setup()
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+
+    from django.db import connections
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    tmpdir = tempfile.mkdtemp(prefix='monitoring-bench-')
+    created = []
+    for connection in connections.all():
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, f'bench-{connection.alias}.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=False)
+        created.append((connection, old_name))
+
+    def teardown():
+        for connection, old_name in reversed(created):
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    return teardown
+
+
+def report(name, results):
+    """Print one benchmark's results as a JSON line."""
+    print(json.dumps({'benchmark': name, **results}, sort_keys=True))
+    return results
@@ -0,0 +1,72 @@
+"""Peak Python heap while streaming exports of growing size.
+
+A streaming export should have the same peak no matter how many rows it
+writes; the numbers are reported per format for each row count.
+
+    python -m benchmarks.export_memory --rows 10000 100000
+"""
+import argparse
+import time
+import tracemalloc
+
+from .common import report, setup_django
+
+
+def seed(total, batch=5000):
+    from monitoring.models import ActivityLog
+    have = ActivityLog.objects.count()
+    while have < total:
+        n = min(batch, total - have)
+        ActivityLog.objects.bulk_create(
+            ActivityLog(action='read', method='GET', path=f'/api/items/{have + i}', status_code=200,
+                        ip_address='10.0.0.1', user_agent='bench', extra={})
+            for i in range(n)
+        )
+        have += n
+
+
+def measure(fmt, gzip):
+    from django.contrib.auth.models import User
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from monitoring.views import ActivityLogListView
+
+    params = {'export': fmt}
+    if gzip:
+        params['gzip'] = '1'
+    request = APIRequestFactory().get('/api/logs/activities', params)
+    force_authenticate(request, user=User(is_staff=True))
+
+    tracemalloc.reset_peak()
+    start_mem = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    response = ActivityLogListView.as_view()(request)
+    size = sum(len(chunk) for chunk in response.streaming_content)
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - start_mem
+    return {'bytes': size, 'seconds': round(seconds, 3), 'peak_kib': round(peak / 1024, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--formats', nargs='+', default=['csv', 'ndjson', 'json'])
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False, LOG_BUFFER_ENABLED=False)
+    results = {}
+    try:
+        tracemalloc.start()
+        for rows in sorted(args.rows):
+            seed(rows)
+            for fmt in args.formats:
+                for gzip in (False, True):
+                    key = f'{fmt}{".gz" if gzip else ""}@{rows}'
+                    results[key] = measure(fmt, gzip)
+        tracemalloc.stop()
+    finally:
+        teardown()
+    return report('export_memory', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Records per second loaded by the NDJSON bulk ingest into a WAL-mode SQLite file.
+
+    python -m benchmarks.ingest --records 200000 [--gzip]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+
+from .common import report, setup_django
+from .storage import USER_AGENTS
+
+
+def write_ndjson(path, total, compress=False, seed=0):
+    rng = random.Random(seed)
+    methods = ['GET'] * 8 + ['POST', 'PUT', 'DELETE']
+    actions = {'GET': 'read', 'POST': 'create', 'PUT': 'update', 'DELETE': 'delete'}
+    opener = gzip.open if compress else open
+    with opener(path, 'wt') as out:
+        for i in range(total):
+            method = rng.choice(methods)
+            out.write(json.dumps({
+                'action': actions[method], 'method': method, 'path': f'/api/items/{rng.randrange(10000)}/',
+                'ip_address': f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+                'user_agent': rng.choice(USER_AGENTS), 'status_code': 200,
+                'timestamp': f'2026-01-01T00:{i // 60000 % 60:02d}:{i // 1000 % 60:02d}.{i % 1000:03d}Z',
+                'duration_ms': round(rng.random() * 50, 3),
+            }) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False, LOG_BUFFER_ENABLED=False)
+    path = tempfile.mktemp(suffix='.ndjson.gz' if args.gzip else '.ndjson')
+    try:
+        from django.db import connection
+        from monitoring import ingest
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        write_ndjson(path, args.records, compress=args.gzip)
+        with open(path, 'rb') as raw:
+            result = ingest.ActivityIngest(chunk_size=args.chunk_size).run(ingest.open_input(raw))
+        seconds = result.seconds
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+        teardown()
+    return report('ingest', {
+        'records': args.records,
+        'gzip': args.gzip,
+        'accepted': result.accepted,
+        'rejected': result.rejected,
+        'seconds': round(seconds, 2),
+        'records_per_second': round(result.accepted / seconds),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Latency of ``?q=`` error searches against LIKE scans as the table grows.
+
+    python -m benchmarks.search --rows 100000 1000000
+"""
+import argparse
+import random
+import time
+
+from .common import report, setup_django
+
+WORDS = ('timeout', 'invoice', 'database', 'permission', 'denied', 'missing', 'user', 'order',
+         'payment', 'gateway', 'connection', 'reset', 'serializer', 'validation', 'cache')
+# Common words match a quarter of the table; ``ref`` tokens a handful of rows.
+QUERIES = ('gateway', 'invoice timeout', 'ref4242', 'ref4242 gateway', 'nomatch')
+
+
+def seed(total, batch=10000):
+    from monitoring.models import ErrorLog
+    rng = random.Random(0)
+    have = ErrorLog.objects.count()
+    while have < total:
+        n = min(batch, total - have)
+        ErrorLog.objects.bulk_create(
+            ErrorLog(message=' '.join(rng.sample(WORDS, 4)) + f' ref{rng.randrange(100000)}',
+                     endpoint=f'/api/items/{have + i}', stack_trace='', status_code=500)
+            for i in range(n)
+        )
+        have += n
+
+
+def timed(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 2)
+
+
+def measure(q, page_size=50):
+    from django.db.models import Q
+    from monitoring import search
+    from monitoring.models import ErrorLog
+
+    def indexed():
+        list(search.errors.filter(ErrorLog.objects.all(), q)[:page_size])
+
+    def like():
+        qs = ErrorLog.objects.all()
+        for word in q.split():
+            qs = qs.filter(Q(message__icontains=word) | Q(endpoint__icontains=word)
+                           | Q(stack_trace__icontains=word))
+        list(qs[:page_size])
+
+    matches = search.errors.filter(ErrorLog.objects.all(), q, rank=False).count()
+    return {'matches': matches, 'fts_ms': timed(indexed), 'like_ms': timed(like, repeat=1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False, LOG_BUFFER_ENABLED=False)
+    results = {}
+    try:
+        for rows in sorted(args.rows):
+            seed(rows)
+            for q in QUERIES:
+                results[f'{q}@{rows}'] = measure(q)
+    finally:
+        teardown()
+    return report('search', results)
+
+
+if __name__ == '__main__':
+    main()
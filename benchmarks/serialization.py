@@ -0,0 +1,95 @@
+"""Rows per second of the values_list row path vs the DRF serializers.
+
+"serializer" loads model instances with the user joined and runs
+``ActivityLogSerializer``; "rows" reads ``values_list`` tuples through the
+export ``RowFormat``. Both produce the same dicts. A list page is one
+``--page-size`` slice; the JSON export encodes every row.
+
+    python -m benchmarks.serialization --rows 50000 --page-size 500
+"""
+import argparse
+import time
+
+from .common import report, setup_django
+
+
+def seed(total, batch=5000):
+    from django.contrib.auth.models import User
+    from monitoring.fields import intern_all
+    from monitoring.models import ActivityLog
+
+    users = User.objects.bulk_create(User(username=f'user{i}', email=f'user{i}@example.com') for i in range(50))
+    for start in range(0, total, batch):
+        chunk = [
+            ActivityLog(user=users[i % len(users)] if i % 4 else None, action='read', method='GET',
+                        path=f'/api/items/{i}', status_code=200, ip_address=f'10.0.{i % 256}.1',
+                        user_agent='bench/1.0', extra={'i': i}, duration_ms=1.5, db_queries=2, db_time_ms=0.5)
+            for i in range(start, min(start + batch, total))
+        ]
+        intern_all(ActivityLog, chunk)
+        ActivityLog.objects.bulk_create(chunk)
+
+
+def rate(rows, fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(rows / best)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--page-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False, LOG_BUFFER_ENABLED=False)
+    try:
+        from monitoring import exports
+        from monitoring.models import ActivityLog
+        from monitoring.serializers import ActivityLogSerializer
+
+        seed(args.rows)
+        row_format = exports.ACTIVITY_EXPORT.row_format
+        qs = ActivityLog.objects.order_by('-timestamp', '-id')
+        instances = qs.select_related('user')
+
+        def serializer_page():
+            return ActivityLogSerializer(instances[:args.page_size], many=True).data
+
+        def rows_page():
+            return exports.FormattedRows(qs, row_format)[0:args.page_size]
+
+        def serializer_export():
+            for start in range(0, args.rows, exports.CHUNK_SIZE):
+                for row in ActivityLogSerializer(instances[start:start + exports.CHUNK_SIZE], many=True).data:
+                    exports._dumps(row)
+
+        def rows_export():
+            for _ in exports.json_array_lines(row_format.rows(qs)):
+                pass
+
+        assert serializer_page() == rows_page()
+        results = {'rows': args.rows, 'page_size': args.page_size}
+        for name, serializer_fn, rows_fn, n, repeat in (
+            ('list_page', serializer_page, rows_page, args.page_size, args.repeat * 10),
+            ('json_export', serializer_export, rows_export, args.rows, args.repeat),
+        ):
+            serializer = rate(n, serializer_fn, repeat)
+            rows = rate(n, rows_fn, repeat)
+            results[name] = {
+                'serializer_rows_per_second': serializer,
+                'rows_per_second': rows,
+                'speedup': round(rows / serializer, 2),
+            }
+    finally:
+        teardown()
+    return report('serialization', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""App writes and log writes running side by side, with and without a separate log database.
+
+Writer threads update users (standing in for app and auth writes) while
+others insert activity rows one at a time, as unbuffered request logging
+does. Each mode runs in its own process because the database layout is
+fixed at settings import:
+
+- ``rollback``: one file, rollback journal (the old defaults)
+- ``wal``: one file with ``SQLITE_PRAGMAS`` (WAL, synchronous=NORMAL)
+- ``split``: WAL plus the log tables in their own ``logs`` database
+
+    python -m benchmarks.sqlite_concurrency --seconds 5 --app-writers 4 --log-writers 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .common import ROOT, report, setup_django
+
+MODES = {
+    'rollback': {'SQLITE_JOURNAL_MODE': 'delete', 'SQLITE_SYNCHRONOUS': 'full'},
+    'wal': {},
+    'split': {'LOG_DATABASE_PATH': 'set-per-run'},
+}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return round(samples[min(len(samples) - 1, int(len(samples) * pct / 100))] * 1000, 2)
+
+
+def run_mode(mode, seconds, app_writers, log_writers):
+    overrides = dict(MODES[mode], DEBUG=False, LOG_BUFFER_ENABLED=False)
+    if 'LOG_DATABASE_PATH' in overrides:
+        overrides['LOG_DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='monitoring-bench-'), 'logs.sqlite3')
+    teardown = setup_django(**overrides)
+    try:
+        from django.contrib.auth.models import User
+        from django.db import OperationalError, connections
+        from django.utils import timezone
+        from monitoring.models import ActivityLog
+
+        users = [User.objects.create_user(f'user{i}').pk for i in range(app_writers)]
+        stop = threading.Event()
+        results = {'app': [], 'log': [], 'errors': 0}
+        lock = threading.Lock()
+
+        def worker(kind, write):
+            latencies, errors = [], 0
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    write()
+                except OperationalError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+            connections.close_all()
+            with lock:
+                results[kind].extend(latencies)
+                results['errors'] += errors
+
+        def app_write(pk):
+            return lambda: User.objects.filter(pk=pk).update(last_login=timezone.now())
+
+        def log_write():
+            ActivityLog.objects.create(action='read', method='GET', path='/api/items/', status_code=200)
+
+        threads = [threading.Thread(target=worker, args=('app', app_write(pk))) for pk in users]
+        threads += [threading.Thread(target=worker, args=('log', log_write)) for _ in range(log_writers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        teardown()
+
+    return {
+        'app_writes_per_second': round(len(results['app']) / seconds),
+        'app_p50_ms': percentile(results['app'], 50),
+        'app_p99_ms': percentile(results['app'], 99),
+        'log_writes_per_second': round(len(results['log']) / seconds),
+        'log_p99_ms': percentile(results['log'], 99),
+        'lock_errors': results['errors'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--app-writers', type=int, default=4)
+    parser.add_argument('--log-writers', type=int, default=8)
+    parser.add_argument('--mode', choices=sorted(MODES), help='Run a single mode in this process.')
+    args = parser.parse_args(argv)
+
+    options = ['--seconds', str(args.seconds), '--app-writers', str(args.app_writers),
+               '--log-writers', str(args.log_writers)]
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.seconds, args.app_writers, args.log_writers)))
+        return None
+
+    results = {'seconds': args.seconds, 'app_writers': args.app_writers, 'log_writers': args.log_writers}
+    for mode in MODES:
+        out = subprocess.run([sys.executable, '-m', 'benchmarks.sqlite_concurrency', '--mode', mode, *options],
+                             cwd=ROOT, check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(out.strip().splitlines()[-1])
+    return report('sqlite_concurrency', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Bytes per row and insert throughput of the activity table, text vs compact.
+
+"text" is the previous layout (string method/action, text IP, inline user
+agent) recreated in a scratch table; "compact" is the current model. Sizes
+come from SQLite's dbstat and include the table's indexes (and, for the
+compact layout, the user-agent dimension table) but not the full-text index,
+which is the same for both.
+
+    python -m benchmarks.storage --rows 100000
+"""
+import argparse
+import random
+import time
+
+from .common import report, setup_django
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+    f'Chrome/{v}.0.0.0 Safari/537.36 Edg/{v}.0.{b}.{p}'
+    for v in range(110, 130) for b in range(3) for p in range(5)
+]
+
+
+def legacy_model():
+    from django.db import models
+    from monitoring.models import ActivityLog
+
+    class Meta:
+        app_label = 'monitoring'
+        db_table = 'bench_text_activitylog'
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='bench_text_ts'),
+            models.Index(fields=['user', 'timestamp'], name='bench_text_user'),
+            models.Index(fields=['action', 'timestamp'], name='bench_text_action'),
+            models.Index(fields=['user', 'action', 'timestamp'], name='bench_text_user_action'),
+        ]
+
+    return type('TextActivityLog', (models.Model,), {
+        '__module__': 'monitoring.models',
+        'Meta': Meta,
+        'user': models.ForeignKey('auth.User', null=True, on_delete=models.SET_NULL,
+                                  related_name='+', db_index=False),
+        'action': models.CharField(max_length=32, choices=ActivityLog.ACTION_CHOICES, default='other'),
+        'method': models.CharField(max_length=10, blank=True, default=''),
+        'path': models.CharField(max_length=512, blank=True, default=''),
+        'ip_address': models.GenericIPAddressField(null=True, blank=True),
+        'user_agent': models.TextField(blank=True, default=''),
+        'status_code': models.PositiveIntegerField(default=200),
+        'timestamp': models.DateTimeField(),
+        'extra': models.JSONField(null=True, blank=True),
+        'duration_ms': models.FloatField(null=True, blank=True),
+        'db_queries': models.PositiveIntegerField(null=True, blank=True),
+        'db_time_ms': models.FloatField(null=True, blank=True),
+    })
+
+
+def rows(model, total, seed=0):
+    from django.utils import timezone
+    rng = random.Random(seed)
+    now = timezone.now()
+    methods = ['GET'] * 8 + ['POST', 'PUT', 'DELETE']
+    actions = {'GET': 'read', 'POST': 'create', 'PUT': 'update', 'DELETE': 'delete'}
+    for i in range(total):
+        method = rng.choice(methods)
+        yield model(
+            action=actions[method], method=method, path=f'/api/items/{rng.randrange(10000)}/',
+            ip_address=f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}',
+            user_agent=rng.choice(USER_AGENTS), status_code=200, timestamp=now, extra={},
+            duration_ms=rng.random() * 50, db_queries=rng.randrange(1, 6), db_time_ms=rng.random() * 10,
+        )
+
+
+def insert(model, total, batch=1000):
+    from monitoring.fields import intern_all
+    objs = list(rows(model, total))
+    start = time.perf_counter()
+    for i in range(0, total, batch):
+        chunk = objs[i:i + batch]
+        intern_all(model, chunk)
+        model.objects.bulk_create(chunk)
+    return total / (time.perf_counter() - start)
+
+
+def table_bytes(*tables):
+    from django.db import connection
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(tables))
+        cursor.execute(
+            f"SELECT coalesce(sum(pgsize), 0) FROM dbstat WHERE name IN ({placeholders}) "
+            f"OR name IN (SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ({placeholders}))",
+            list(tables) * 2,
+        )
+        return cursor.fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(DEBUG=False, LOG_BUFFER_ENABLED=False)
+    try:
+        from django.db import connection
+        from monitoring.models import ActivityLog, UserAgent
+
+        from monitoring.search import SearchIndex
+
+        text_model = legacy_model()
+        with connection.schema_editor() as editor:
+            editor.create_model(text_model)
+        # Same full-text triggers on both, so insert rates compare the layouts.
+        SearchIndex(text_model, ('path',)).install()
+
+        results = {'rows': args.rows}
+        for name, model, tables in (
+            ('compact', ActivityLog, [ActivityLog._meta.db_table, UserAgent._meta.db_table]),
+            ('text', text_model, [text_model._meta.db_table]),
+        ):
+            per_second = insert(model, args.rows)
+            results[name] = {
+                'bytes_per_row': round(table_bytes(*tables) / args.rows, 1),
+                'inserts_per_second': round(per_second),
+            }
+    finally:
+        teardown()
+    return report('storage', results)
+
+
+if __name__ == '__main__':
+    main()
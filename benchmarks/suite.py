@@ -0,0 +1,283 @@
+"""Hot-path benchmark suite with a stored baseline to catch regressions.
+
+Measures the activity middleware per request (bare view, logged, buffered,
+sampled out), log write throughput, list/filter/export latency at each
+``--rows`` size and ``LogStatsView`` latency. Results are written as JSON;
+any metric more than ``--threshold`` worse than the baseline fails the run
+(exit status 1). Metrics ending in ``_per_s`` are throughputs (higher is
+better), everything else is the best of ``--repeat`` timings (lower is
+better), which is much steadier between runs than a mean. Baselines are
+machine-specific: record one with ``--update-baseline`` before comparing.
+
+    python -m benchmarks.suite --rows 100000 1000000 [--baseline benchmarks/baseline.json]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from .common import report, setup_django
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+USERS = 1000
+ERRORS_PER_ACTIVITY = 10
+ACTIONS = ['read'] * 14 + ['create', 'create', 'update', 'delete', 'login', 'logout']
+METHODS = {'read': 'GET', 'create': 'POST', 'update': 'PATCH', 'delete': 'DELETE', 'login': 'POST',
+           'logout': 'POST'}
+# Views are measured uncached and undisturbed by their own logging.
+SETTINGS = {'DEBUG': False, 'LOG_BUFFER_ENABLED': False, 'LOG_CACHE_TIMEOUT': 0}
+
+
+def best_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return round(min(times) * 1000, 3)
+
+
+# Seeding
+
+def seed(total, days=30, seed_value=0):
+    """Grow the activity table to ``total`` rows (and errors to a tenth of that)."""
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from monitoring import ingest
+    from monitoring.models import ActivityLog, ErrorLog
+
+    if not User.objects.exists():
+        User.objects.bulk_create(User(username=f'user{i}', email=f'user{i}@example.com') for i in range(USERS))
+    user_ids = list(User.objects.values_list('id', flat=True))
+    have = ActivityLog.objects.count()
+    rng = random.Random(seed_value + have)
+    now = timezone.now()
+    span = days * 86400
+    writer = ingest.ActivityIngest()
+    result = ingest.IngestResult()
+    while have < total:
+        n = min(writer.chunk_size, total - have)
+        chunk = []
+        for i in range(n):
+            action = rng.choice(ACTIONS)
+            chunk.append((i, {
+                'user': rng.choice(user_ids) if rng.random() < 0.8 else None,
+                'action': action, 'method': METHODS[action],
+                'path': f'/api/items/{rng.randrange(10000)}/', 'ip_address': f'10.0.{rng.randrange(256)}.1',
+                'user_agent': f'bench/{rng.randrange(20)}', 'status_code': 200 if rng.random() < 0.95 else 404,
+                'timestamp': (now - timedelta(seconds=rng.random() * span)).isoformat(),
+                'duration_ms': rng.random() * 50, 'db_queries': rng.randrange(1, 6), 'db_time_ms': rng.random() * 5,
+            }))
+        writer.write(chunk, result)
+        have += n
+    errors = ErrorLog.objects.count()
+    while errors < total // ERRORS_PER_ACTIVITY:
+        n = min(5000, total // ERRORS_PER_ACTIVITY - errors)
+        ErrorLog.objects.bulk_create(
+            ErrorLog(message=f'KeyError: {rng.randrange(50)}', endpoint=f'/api/items/{rng.randrange(100)}/',
+                     status_code=500, timestamp=now - timedelta(seconds=rng.random() * span))
+            for _ in range(n)
+        )
+        errors += n
+
+
+# Middleware
+
+def middleware_metrics(requests):
+    from django.http import HttpResponse
+    from django.test import RequestFactory, override_settings
+    from django.urls import resolve
+    from monitoring import buffer, rollups
+    from monitoring.middleware import ActivityLoggingMiddleware
+
+    factory = RequestFactory()
+    match = resolve('/api/items/')
+
+    def view(request):
+        return HttpResponse(b'{}', content_type='application/json')
+
+    def per_request_us(handler, repeat=3):
+        best = None
+        for _ in range(repeat):
+            request_objs = []
+            for _ in range(requests):
+                request = factory.get('/api/items/', HTTP_USER_AGENT='bench/1.0')
+                request.resolver_match = match
+                request_objs.append(request)
+            start = time.perf_counter()
+            for request in request_objs:
+                handler(request)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return round(best / requests * 1e6, 2)
+
+    logged = {'LOG_ROUTE_POLICY': [{'route': '*', 'sample_rate': 1}]}
+    modes = {
+        'bare': None,
+        'logged': logged,
+        'buffered': {**logged, 'LOG_BUFFER_ENABLED': True},
+        'sampled_out': {'LOG_ROUTE_POLICY': [{'route': '*', 'sample_rate': 0}]},
+    }
+    metrics = {}
+    for mode, overrides in modes.items():
+        if overrides is None:
+            metrics[f'middleware.{mode}_us'] = per_request_us(view)
+            continue
+        with override_settings(**overrides):
+            metrics[f'middleware.{mode}_us'] = per_request_us(ActivityLoggingMiddleware(view))
+            if overrides.get('LOG_BUFFER_ENABLED'):
+                buffer.shutdown()
+    rollups.pending.drain()
+    return metrics
+
+
+# Writes
+
+def write_metrics(records):
+    from django.test import RequestFactory
+    from django.utils import timezone
+    from monitoring import ingest, utils
+    from monitoring.buffer import BufferedLogWriter
+    from monitoring.models import ActivityLog
+
+    request = RequestFactory().get('/api/items/', HTTP_USER_AGENT='bench/1.0')
+    request.user = None
+
+    start = time.perf_counter()
+    for _ in range(records):
+        utils.log_activity(request, action='read')
+    direct = records / (time.perf_counter() - start)
+
+    writer = BufferedLogWriter(ActivityLog, max_size=records)
+    start = time.perf_counter()
+    for _ in range(records):
+        writer.submit(utils._activity_record(request, None, 'read', 200, None))
+    writer.flush()
+    buffered = records / (time.perf_counter() - start)
+
+    stamp = timezone.now().isoformat()
+    lines = [json.dumps({'action': 'read', 'method': 'GET', 'path': f'/api/items/{i}/', 'timestamp': stamp})
+             for i in range(records * 10)]
+    start = time.perf_counter()
+    ingest.ActivityIngest().run(lines)
+    bulk = len(lines) / (time.perf_counter() - start)
+    return {
+        'write.direct_per_s': round(direct),
+        'write.buffered_per_s': round(buffered),
+        'write.ingest_per_s': round(bulk),
+    }
+
+
+# Views
+
+def view_metrics(rows, repeat):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from rest_framework.test import APIRequestFactory, force_authenticate
+    from monitoring import rollups
+    from monitoring.views import ActivityLogListView, ErrorLogListView, LogStatsView
+
+    factory = APIRequestFactory()
+    admin = User(id=0, username='bench', is_staff=True)
+    user_id = User.objects.order_by('id').values_list('id', flat=True)[7]
+    day = (timezone.now() - timedelta(days=3)).date()
+
+    def call(view, params):
+        request = factory.get('/', params)
+        force_authenticate(request, user=admin)
+        response = view(request)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        else:
+            response.render()
+        assert response.status_code == 200, response.status_code
+
+    activity = ActivityLogListView.as_view()
+    errors = ErrorLogListView.as_view()
+    stats = LogStatsView.as_view()
+    cases = {
+        'list.first_page': (activity, {}),
+        'list.cursor_page': (activity, {'pagination': 'cursor'}),
+        'list.filter_action': (activity, {'action': 'delete'}),
+        'list.filter_user': (activity, {'user_id': user_id, 'pagination': 'cursor'}),
+        'list.date_range': (activity, {'date_from': f'{day}T00:00:00Z', 'date_to': f'{day}T23:59:59Z'}),
+        'list.errors': (errors, {'status_code': 500}),
+        'list.errors_grouped': (errors, {'grouped': '1'}),
+        'export.user_ndjson': (activity, {'export': 'ndjson', 'user_id': user_id}),
+        'stats.day': (stats, {'granularity': 'day'}),
+        'stats.hour': (stats, {'granularity': 'hour'}),
+        'stats.minute': (stats, {'granularity': 'minute'}),
+    }
+    # Stats are measured against up-to-date rollups, as on a busy server.
+    rollups.refresh()
+    metrics = {}
+    for name, (view, params) in cases.items():
+        call(view, params)
+        metrics[f'{name}@{rows}_ms'] = best_ms(lambda: call(view, params), repeat)
+    return metrics
+
+
+# Baseline comparison
+
+def compare(current, baseline, threshold):
+    """Metrics worse than ``baseline`` by more than ``threshold`` (a fraction)."""
+    regressions = []
+    for name, base in sorted(baseline.items()):
+        value = current.get(name)
+        if value is None or not base:
+            continue
+        if name.endswith('_per_s'):
+            worse = base / value - 1 if value else float('inf')
+        else:
+            worse = value / base - 1
+        if worse > threshold:
+            regressions.append({'metric': name, 'baseline': base, 'current': value, 'worse_by': round(worse, 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000])
+    parser.add_argument('--requests', type=int, default=2000, help='requests per middleware mode')
+    parser.add_argument('--writes', type=int, default=2000, help='rows per write mode (ingest writes 10x)')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', type=Path, help='write the results JSON here')
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=0.3)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args(argv)
+
+    teardown = setup_django(**SETTINGS)
+    metrics = {}
+    try:
+        metrics.update(middleware_metrics(args.requests))
+        metrics.update(write_metrics(args.writes))
+        for rows in sorted(args.rows):
+            seed(rows)
+            metrics.update(view_metrics(rows, args.repeat))
+    finally:
+        teardown()
+
+    results = {'python': sys.version.split()[0], 'metrics': metrics}
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+    elif args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text())['metrics']
+        results['regressions'] = compare(metrics, baseline, args.threshold)
+    report('suite', results)
+    if results.get('regressions'):
+        for r in results['regressions']:
+            print(f"regression: {r['metric']} {r['baseline']} -> {r['current']} "
+                  f"({r['worse_by']:+.0%})", file=sys.stderr)
+        raise SystemExit(1)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,240 @@
+import hashlib
+from datetime import datetime, timedelta
+
+from django.conf import settings
 from django.contrib import admin
-from .models import ActivityLog, ErrorLog
+from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import METHOD_CODES, ActivityLog, ActivityRollup, ErrorLog, ErrorGroup, ErrorRollup
+from . import caching, db, rollups, search
+
+
+def performance_mode():
+    return getattr(settings, 'LOG_ADMIN_PERFORMANCE_MODE', True)
+
+
+def capped_count(queryset, limit):
+    """Exact count up to ``limit`` (``limit`` beyond that), cached for ``LOG_ADMIN_COUNT_TIMEOUT`` seconds."""
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.md5(f'{queryset.db}:{sql}:{params!r}:{limit}'.encode()).hexdigest()
+    key = f'monitoring:admin-count:{digest}'
+    cache = caching.get_cache()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by()[:limit].count()
+        cache.set(key, count, getattr(settings, 'LOG_ADMIN_COUNT_TIMEOUT', 60))
+    return count
+
+
+class EstimatedCountPaginator(Paginator):
+    """Page counts that stay cheap on log tables with millions of rows.
+
+    Large results report an approximate count (see ``db.estimated_count``);
+    the rest are counted exactly up to ``LOG_ADMIN_COUNT_LIMIT`` rows and
+    cached briefly, so paging through a filter does not count it again.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'LOG_ADMIN_COUNT_LIMIT', 10000)
+        estimate = db.estimated_count(self.object_list)
+        if estimate is not None and estimate > limit:
+            return estimate
+        return capped_count(self.object_list, limit)
+
+
+class MethodFilter(admin.SimpleListFilter):
+    title = 'method'
+    parameter_name = 'method'
+
+    def lookups(self, request, model_admin):
+        return [(method, method) for method in METHOD_CODES if method]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(method=self.value())
+        return queryset
+
+
+class RollupStatusFilter(admin.SimpleListFilter):
+    """Status choices and their all-time counts read from the daily rollups, not the log table."""
+    title = 'status'
+    rollup = None
+    dimension = None
+
+    def lookups(self, request, model_admin):
+        totals = (self.rollup.objects.filter(granularity='day').values_list(self.dimension)
+                  .annotate(total=Sum('count')).order_by(self.dimension))
+        return [(str(value), f'{self.label(value)} ({total:,})') for value, total in totals]
+
+    def label(self, value):
+        return str(value)
+
+
+class StatusClassFilter(RollupStatusFilter):
+    parameter_name = 'status_class'
+    rollup = ActivityRollup
+    dimension = 'status_class'
+
+    def label(self, value):
+        return f'{value}xx'
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            low = int(self.value()) * 100
+            return queryset.filter(status_code__gte=low, status_code__lt=low + 100)
+        return queryset
+
+
+class StatusCodeFilter(RollupStatusFilter):
+    parameter_name = 'status'
+    rollup = ErrorRollup
+    dimension = 'status_code'
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            return queryset.filter(status_code=int(self.value()))
+        return queryset
+
+
+class RollupDates:
+    """Stands in for the changelist in Django's ``date_hierarchy`` tag.
+
+    The year/month/day choices come from the distinct hourly rollup buckets
+    (read through the rollup key index and converted to the current time
+    zone here) from the oldest live row on, instead of a DISTINCT over the
+    whole log table. Days newer than the last rollup bucket come from the
+    live rows in that range, so recent rows can be drilled into before the
+    rollups catch up. Other filters do not narrow the choices.
+    """
+
+    def __init__(self, cl):
+        self.cl = cl
+        self.queryset = self
+
+    def __getattr__(self, name):
+        return getattr(self.cl, name)
+
+    @cached_property
+    def hours(self):
+        cl = self.cl
+        field = cl.date_hierarchy
+        # Rollups also count archived rows; only offer dates that still have rows.
+        live = cl.root_queryset.order_by()
+        oldest = live.order_by(field).values_list(field, flat=True).first()
+        if oldest is None:
+            return []
+        buckets = list(cl.model_admin.rollup_model.objects
+                       .filter(granularity='hour', bucket__gte=rollups.truncate(oldest, 'hour'))
+                       .order_by('bucket').values_list('bucket', flat=True).distinct())
+        uncovered = buckets[-1] + timedelta(hours=1) if buckets else oldest
+        newest = live.order_by(f'-{field}').values_list(field, flat=True).first()
+        if newest >= uncovered:
+            buckets += live.filter(**{f'{field}__gte': uncovered}).datetimes(field, 'day')
+        hours = sorted(timezone.localtime(bucket) for bucket in buckets)
+        for part in ('year', 'month'):
+            value = cl.params.get(f'{cl.date_hierarchy}__{part}')
+            if value and value.isdigit():
+                hours = [hour for hour in hours if getattr(hour, part) == int(value)]
+        return hours
+
+    # The two queryset methods ``date_hierarchy`` calls.
+
+    def aggregate(self, first, last):
+        return {'first': self.hours[0] if self.hours else None, 'last': self.hours[-1] if self.hours else None}
+
+    def datetimes(self, field_name, kind):
+        parts = {'year': 1, 'month': 2, 'day': 3}[kind]
+        seen = sorted({hour.timetuple()[:parts] for hour in self.hours})
+        return [timezone.make_aware(datetime(*(key + (1,) * (3 - parts)))) for key in seen]
+
+
+class IndexedSearchMixin:
+    """Changelist search through the full-text index instead of LIKE scans.
+
+    The index does not hold usernames, so a term that is exactly a username
+    also matches that user's rows.
+    """
+    search_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.tokens(search_term):
+            return queryset, False
+        # The changelist applies its own ordering afterwards.
+        matches = self.search_index.filter(queryset, search_term, rank=False)
+        User = get_user_model()
+        user_ids = list(User._default_manager.filter(**{User.USERNAME_FIELD: search_term.strip()})
+                        .values_list('pk', flat=True))
+        if not user_ids:
+            return matches, False
+        return queryset.filter(Q(pk__in=matches.values('pk')) | Q(user_id__in=user_ids)), False
+
+
+class LogAdminMixin(IndexedSearchMixin):
+    """Changelists that stay fast on very large log tables (``LOG_ADMIN_PERFORMANCE_MODE``).
+
+    Users are joined in the page query, counts are estimated or capped
+    (``EstimatedCountPaginator``), status and method filters and the date
+    drilldown take their choices from the rollups or constants, and the
+    drilldown itself filters on a ``timestamp`` range served by the index.
+    """
+    date_hierarchy = 'timestamp'
+    change_list_template = 'admin/monitoring/log_change_list.html'
+    rollup_model = None
+    fast_list_filter = ()
+    if hasattr(admin, 'ShowFacets'):
+        # Facet counts would run one COUNT per filter choice.
+        show_facets = admin.ShowFacets.NEVER
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if db.shares_user_database(self.model):
+            return queryset
+        return queryset.prefetch_related('user')
+
+    def get_list_select_related(self, request):
+        return ('user',) if db.shares_user_database(self.model) else False
+
+    def get_list_filter(self, request):
+        return self.fast_list_filter if performance_mode() else self.list_filter
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if not performance_mode():
+            return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+
+    @property
+    def show_full_result_count(self):
+        # Without the "N total" link the changelist skips its second, unfiltered COUNT.
+        return not performance_mode()
+
 
 @admin.register(ActivityLog)
-class ActivityLogAdmin(admin.ModelAdmin):
+class ActivityLogAdmin(LogAdminMixin, admin.ModelAdmin):
     list_display = ('timestamp', 'user', 'action', 'method', 'path', 'status_code', 'ip_address')
     list_filter = ('action', 'method', 'status_code', 'timestamp')
-    search_fields = ('path', 'user__username')
+    fast_list_filter = ('action', MethodFilter, StatusClassFilter, 'timestamp')
+    search_fields = ('path',)
+    search_index = search.activity
+    rollup_model = ActivityRollup
+
 
 @admin.register(ErrorLog)
-class ErrorLogAdmin(admin.ModelAdmin):
+class ErrorLogAdmin(LogAdminMixin, admin.ModelAdmin):
     list_display = ('timestamp', 'user', 'message', 'status_code', 'endpoint', 'ip_address')
     list_filter = ('status_code', 'timestamp')
-    search_fields = ('message', 'endpoint', 'user__username')
+    fast_list_filter = (StatusCodeFilter, 'timestamp')
+    search_fields = ('message', 'endpoint', 'stack_trace')
+    search_index = search.errors
+    rollup_model = ErrorRollup
+
+
+@admin.register(ErrorGroup)
+class ErrorGroupAdmin(admin.ModelAdmin):
+    list_display = ('last_seen', 'exception_type', 'endpoint', 'count', 'first_seen', 'message')
+    list_filter = ('exception_type',)
+    search_fields = ('fingerprint', 'message', 'endpoint')
@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class _RateState:
+    __slots__ = ('window', 'current', 'previous', 'baseline', 'alerted')
+
+    def __init__(self, window):
+        self.window = window
+        self.current = 0
+        self.previous = 0
+        self.baseline = 0.0
+        self.alerted = None
+
+
+class RateDetector:
+    """Spots keys whose event rate jumps well above their usual rate.
+
+    Each key keeps the counts of the current and the previous fixed window;
+    the rate over the last ``window`` seconds is the current count plus the
+    part of the previous one that still overlaps it. When a window closes
+    its count goes into an EWMA baseline (smoothing ``alpha``; windows with
+    no events decay it in one step), so a key costs a few numbers whatever
+    its traffic. ``observe`` reports a spike when the rate is at least
+    ``min_count`` and more than ``factor`` times the baseline, at most once
+    per key and window, and not before the detector has seen ``warmup``
+    windows. The ``max_keys`` most recently seen keys are kept.
+    """
+
+    def __init__(self, window=60.0, alpha=0.1, factor=3.0, min_count=10, warmup=5, max_keys=10000):
+        self.window = float(window)
+        self.alpha = alpha
+        self.factor = factor
+        self.min_count = min_count
+        self.warmup = warmup
+        self.max_keys = max_keys
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self._first_window = None
+        self.spikes = 0
+
+    def observe(self, key, now):
+        """Count one event for ``key``; returns ``(rate, baseline)`` on a spike, else None."""
+        window = int(now // self.window)
+        with self._lock:
+            if self._first_window is None:
+                self._first_window = window
+            state = self._keys.get(key)
+            if state is None:
+                state = self._keys[key] = _RateState(window)
+                if len(self._keys) > self.max_keys:
+                    self._keys.popitem(last=False)
+            else:
+                self._keys.move_to_end(key)
+                if state.window != window:
+                    self._roll(state, window)
+            state.current += 1
+            elapsed = now / self.window - window
+            rate = state.current + state.previous * (1.0 - elapsed)
+            if (rate < self.min_count or rate <= self.factor * state.baseline or state.alerted == window
+                    or window - self._first_window < self.warmup):
+                return None
+            state.alerted = window
+            self.spikes += 1
+            return rate, state.baseline
+
+    def _roll(self, state, window):
+        gap = window - state.window
+        keep = 1.0 - self.alpha
+        state.baseline = self.alpha * state.current + keep * state.baseline
+        if gap > 1:
+            state.baseline *= keep ** (gap - 1)
+        state.previous = state.current if gap == 1 else 0
+        state.current = 0
+        state.window = window
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+            self._first_window = None
+            self.spikes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'keys': len(self._keys), 'spikes': self.spikes}
+
+
+detector = RateDetector(
+    window=getattr(settings, 'LOG_ANOMALY_WINDOW', 60.0),
+    alpha=getattr(settings, 'LOG_ANOMALY_ALPHA', 0.1),
+    factor=getattr(settings, 'LOG_ANOMALY_FACTOR', 3.0),
+    min_count=getattr(settings, 'LOG_ANOMALY_MIN_COUNT', 10),
+    warmup=getattr(settings, 'LOG_ANOMALY_WARMUP', 5),
+    max_keys=getattr(settings, 'LOG_ANOMALY_MAX_KEYS', 10000),
+)
@@ -1,8 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 class MonitoringConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'monitoring'
 
     def ready(self):
-        from . import signals  
+        from . import db, latency, search, signals
+        post_migrate.connect(search.install, sender=self)
+        connection_created.connect(db.configure_connection)
+        connection_created.connect(latency.install_query_counter)
@@ -0,0 +1,341 @@
+import gzip
+import heapq
+import json
+import os
+import re
+import tempfile
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from . import caching, rollups
+
+MANIFEST = 'manifest.json'
+_SEGMENT = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:\.(\d+))?\.ndjson\.gz$')
+_dumps = DjangoJSONEncoder(separators=(',', ':')).encode
+
+
+def archive_root():
+    return Path(getattr(settings, 'LOG_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'log_archive'))
+
+
+def segments(kind, start=None, end=None):
+    """``{day: [paths]}`` for archived days of ``kind`` within [start, end]."""
+    directory = archive_root() / kind
+    found = {}
+    if not directory.is_dir():
+        return found
+    for entry in os.scandir(directory):
+        match = _SEGMENT.match(entry.name)
+        if not match:
+            continue
+        day = date.fromisoformat(match.group(1))
+        if (start is None or day >= start) and (end is None or day <= end):
+            found.setdefault(day, []).append(Path(entry.path))
+    for paths in found.values():
+        paths.sort()
+    return found
+
+
+def _replace_atomically(directory, path, write):
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.segment-')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            result = write(raw)
+            raw.flush()
+            os.fsync(raw.fileno())
+        if result:
+            os.replace(tmp, path)
+        else:
+            os.unlink(tmp)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return result
+
+
+def read_manifest(kind):
+    """``{segment name: {'rows', 'newest', 'oldest', 'min_id', 'max_id'}}`` for the segments of ``kind``.
+
+    Segments written before the manifest existed are missing from it and are
+    counted by reading them.
+    """
+    try:
+        with open(archive_root() / kind / MANIFEST, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _record_segment(kind, name, entry):
+    directory = archive_root() / kind
+    manifest = read_manifest(kind)
+    manifest[name] = entry
+    data = json.dumps(manifest, sort_keys=True, indent=1).encode('utf-8')
+    _replace_atomically(directory, directory / MANIFEST, lambda raw: raw.write(data))
+
+
+def write_segment(kind, day, rows):
+    """Write ``rows`` (newest first) as one compressed NDJSON segment for ``day``.
+
+    The file appears atomically; a day archived more than once gets numbered
+    parts. The segment's row count, time span and id range go into the kind's
+    manifest. Returns ``(path, row count)``.
+    """
+    directory = archive_root() / kind
+    directory.mkdir(parents=True, exist_ok=True)
+    existing = segments(kind, day, day).get(day, [])
+    name = f'{day.isoformat()}.ndjson.gz' if not existing else f'{day.isoformat()}.{len(existing)}.ndjson.gz'
+    entry = {'rows': 0, 'newest': None, 'oldest': None, 'min_id': None, 'max_id': None}
+
+    def write(raw):
+        with gzip.GzipFile(fileobj=raw, mode='wb') as out:
+            for row in rows:
+                out.write((_dumps(row) + '\n').encode('utf-8'))
+                entry['newest'] = entry['newest'] or row['timestamp']
+                entry['oldest'] = row['timestamp']
+                entry['min_id'] = min(entry['min_id'] or row['id'], row['id'])
+                entry['max_id'] = max(entry['max_id'] or row['id'], row['id'])
+                entry['rows'] += 1
+        return entry['rows']
+
+    if not _replace_atomically(directory, directory / name, write):
+        return None, 0
+    _record_segment(kind, name, entry)
+    return directory / name, entry['rows']
+
+
+def archived_through(kind, day):
+    """Highest row id already written to a segment of ``kind`` for ``day``, or None."""
+    paths = segments(kind, day, day).get(day, [])
+    manifest = read_manifest(kind) if paths else {}
+    ids = []
+    for path in paths:
+        max_id = manifest.get(path.name, {}).get('max_id')
+        if max_id is None:
+            # Written before ids were recorded, or the run stopped before recording it.
+            ids.extend(row['id'] for row in _read_segment(path))
+        else:
+            ids.append(max_id)
+    return max(ids, default=None)
+
+
+def _read_segment(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _sort_key(row):
+    return parse_datetime(row['timestamp']), row['id']
+
+
+def row_timestamp(row):
+    return parse_datetime(row['timestamp'])
+
+
+class ArchivedRows:
+    """Archived rows of ``kind`` in [date_from, date_to], newest first.
+
+    Iterating streams the matching segments. Without a ``predicate``,
+    ``count`` and ``slice`` take the row counts of segments that lie wholly
+    inside the range from the manifest, so only the boundary days (and
+    segments missing from the manifest) are decompressed; a predicate has
+    to be checked row by row.
+    """
+
+    def __init__(self, kind, date_from=None, date_to=None, predicate=None):
+        self.kind = kind
+        self.date_from = date_from
+        self.date_to = date_to
+        self.predicate = predicate
+        start = date_from.astimezone(dt_timezone.utc).date() if date_from else None
+        end = date_to.astimezone(dt_timezone.utc).date() if date_to else None
+        self.days = sorted(segments(kind, start, end).items(), reverse=True)
+        self.manifest = read_manifest(kind) if self.days else {}
+        self._count = None
+
+    def __bool__(self):
+        return bool(self.days)
+
+    def __iter__(self):
+        for _, paths in self.days:
+            yield from self._day_rows(paths)
+
+    def _day_rows(self, paths):
+        if len(paths) == 1:
+            rows = _read_segment(paths[0])
+        else:
+            rows = heapq.merge(*(_read_segment(p) for p in paths), key=_sort_key, reverse=True)
+        date_from, date_to, predicate = self.date_from, self.date_to, self.predicate
+        for row in rows:
+            if date_from is not None or date_to is not None:
+                ts = row_timestamp(row)
+                if (date_from is not None and ts < date_from) or (date_to is not None and ts > date_to):
+                    continue
+            if predicate is None or predicate(row):
+                yield row
+
+    def _known_count(self, paths):
+        """Rows of one day from the manifest, or None when they must be read."""
+        if self.predicate is not None:
+            return None
+        total = 0
+        for path in paths:
+            entry = self.manifest.get(path.name)
+            if entry is None:
+                return None
+            if entry['rows'] and (
+                (self.date_from is not None and parse_datetime(entry['oldest']) < self.date_from)
+                or (self.date_to is not None and parse_datetime(entry['newest']) > self.date_to)
+            ):
+                return None
+            total += entry['rows']
+        return total
+
+    def count(self):
+        if self._count is None:
+            total = 0
+            for _, paths in self.days:
+                n = self._known_count(paths)
+                total += sum(1 for _ in self._day_rows(paths)) if n is None else n
+            self._count = total
+        return self._count
+
+    def slice(self, start, stop):
+        """Rows ``start`` to ``stop``, skipping whole days by their manifest counts."""
+        out = []
+        skip = start
+        for _, paths in self.days:
+            if len(out) >= stop - start:
+                break
+            if skip:
+                n = self._known_count(paths)
+                if n is not None and skip >= n:
+                    skip -= n
+                    continue
+            rows = self._day_rows(paths)
+            if skip:
+                consumed = sum(1 for _ in islice(rows, skip))
+                skip -= consumed
+                if skip:
+                    continue
+            out.extend(islice(rows, stop - start - len(out)))
+        return out
+
+
+def read_rows(kind, date_from=None, date_to=None, predicate=None):
+    """Archived rows of ``kind``, newest first, optionally filtered."""
+    return iter(ArchivedRows(kind, date_from, date_to, predicate))
+
+
+def csv_row(row, columns):
+    """Map an archived (API-shaped) row back onto the CSV export columns."""
+    values = []
+    for column in columns:
+        if column == 'timestamp':
+            values.append(row_timestamp(row).astimezone(dt_timezone.utc))
+        elif column == 'user_id':
+            values.append(row['user']['id'] if row.get('user') else None)
+        else:
+            values.append(row.get(column))
+    return values
+
+
+class ArchiveAwareResults:
+    """Live queryset rows followed by archived rows, for Django's Paginator.
+
+    Slices return serialized dicts; ``serialize`` turns a slice of the live
+    queryset into the same shape archived rows are stored in. ``archived`` is
+    an ``ArchivedRows``; its rows are streamed from disk rather than held in
+    memory.
+    """
+
+    def __init__(self, queryset, archived, serialize):
+        self.queryset = queryset
+        self.archived = archived
+        self.serialize = serialize
+        self._live_count = None
+
+    def live_count(self):
+        if self._live_count is None:
+            self._live_count = self.queryset.count()
+        return self._live_count
+
+    def count(self):
+        return self.live_count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        live = self.live_count()
+        out = []
+        if start < live:
+            out.extend(self.serialize(self.queryset[start:min(stop, live)]))
+        if stop > live:
+            out.extend(self.archived.slice(max(start - live, 0), stop - live))
+        return out
+
+
+def _delete_in_chunks(model, queryset, chunk_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += model.objects.filter(id__in=ids).delete()[0]
+
+
+def archive_before(model, kind, row_format, cutoff, chunk_size=1000, dry_run=False):
+    """Move rows of ``model`` older than ``cutoff`` into daily segments.
+
+    Each UTC day is written out first and then deleted in ``chunk_size``
+    batches, each its own short transaction. Only rows that made it into the
+    segment (id <= the newest archived id) are deleted, so rows that arrive
+    for an archived day during the run are left for the next run. The
+    manifest records each segment's id range: rows of a day at or below an
+    archived id were written by a run that stopped while deleting, and are
+    deleted rather than archived twice. Rows are folded into the rollups
+    before they are deleted, so stats keep counting them. Returns
+    ``(archived, deleted)``.
+    """
+    if dry_run:
+        return model.objects.filter(timestamp__lt=cutoff).count(), 0
+    archived = deleted = 0
+    while True:
+        oldest = (
+            model.objects.filter(timestamp__lt=cutoff)
+            .order_by('timestamp').values_list('timestamp', flat=True).first()
+        )
+        if oldest is None:
+            break
+        day = oldest.astimezone(dt_timezone.utc).date()
+        day_start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+        day_end = min(day_start + timedelta(days=1), cutoff)
+        day_qs = model.objects.filter(timestamp__gte=day_start, timestamp__lt=day_end)
+        done = archived_through(kind, day)
+        if done is not None:
+            rollups.ensure_counted(model, done)
+            deleted += _delete_in_chunks(model, day_qs.filter(id__lte=done), chunk_size)
+            day_qs = day_qs.filter(id__gt=done)
+        max_id = day_qs.order_by('-id').values_list('id', flat=True).first()
+        if max_id is None:
+            continue
+        day_qs = day_qs.filter(id__lte=max_id)
+        _, n = write_segment(kind, day, row_format.rows(day_qs.order_by('-timestamp', '-id')))
+        archived += n
+        rollups.ensure_counted(model, max_id)
+        deleted += _delete_in_chunks(model, day_qs, chunk_size)
+    if deleted:
+        caching.invalidate(model)
+    return archived, deleted
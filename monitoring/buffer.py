@@ -0,0 +1,246 @@
+import atexit
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+
+from . import caching, metrics, rollups, tail
+from .fields import intern_all
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+SAMPLE = 'sample'
+POLICIES = (BLOCK, DROP_OLDEST, SAMPLE)
+
+
+class BufferedLogWriter:
+    """Bounded in-process queue of unsaved log rows, flushed with bulk_create.
+
+    A background thread writes a batch once ``batch_size`` rows are queued or
+    the oldest queued row is ``flush_interval`` seconds old. When the queue is
+    full, ``policy`` decides what happens to new rows: ``block`` waits up to
+    ``block_timeout`` for room, ``drop_oldest`` evicts the oldest queued row,
+    and ``sample`` admits only ``sample_rate`` of rows once the queue is half
+    full (and none once it is full).
+    """
+
+    def __init__(self, model, max_size=10000, batch_size=500, flush_interval=1.0,
+                 policy=BLOCK, sample_rate=0.1, block_timeout=1.0):
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown log buffer policy {policy!r}; expected one of {POLICIES}')
+        self.model = model
+        self.table = model._meta.model_name
+        self.max_size = max(1, int(max_size))
+        self.batch_size = max(1, min(int(batch_size), self.max_size))
+        self.flush_interval = float(flush_interval)
+        self.policy = policy
+        self.sample_rate = float(sample_rate)
+        self.block_timeout = float(block_timeout)
+
+        self._queue = deque()
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._pid = os.getpid()
+
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, obj, block=True):
+        with self._cond:
+            if len(self._queue) >= self.max_size or self._must_sample():
+                if not self._make_room(block):
+                    self.dropped += 1
+                    return False
+            if not self._queue:
+                self._oldest = time.monotonic()
+            self._queue.append(obj)
+            self.enqueued += 1
+            metrics.log_queue_depth.set((self.table,), len(self._queue))
+            if len(self._queue) == 1 or len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+            return True
+
+    def _must_sample(self):
+        return (
+            self.policy == SAMPLE
+            and len(self._queue) >= self.max_size // 2
+            and random.random() >= self.sample_rate
+        )
+
+    def _make_room(self, block):
+        # Called with the lock held; returns True if the new row may be queued.
+        if self.policy == DROP_OLDEST:
+            self._queue.popleft()
+            self.dropped += 1
+            return True
+        if self.policy == BLOCK and block and self._thread is not None and not self._stopping:
+            deadline = time.monotonic() + self.block_timeout
+            while len(self._queue) >= self.max_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return len(self._queue) < self.max_size
+        return False
+
+    def _take_batch(self):
+        n = min(self.batch_size, len(self._queue))
+        batch = [self._queue.popleft() for _ in range(n)]
+        self._oldest = time.monotonic() if self._queue else None
+        self._cond.notify_all()
+        if batch:
+            metrics.log_queue_depth.set((self.table,), len(self._queue))
+        return batch
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            intern_all(self.model, batch)
+            self.model.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            # Avoid breaking the app if logging fails; the rows are lost.
+            with self._cond:
+                self.failed += len(batch)
+            return
+        metrics.log_write_seconds.observe((self.table, 'buffered'), time.perf_counter() - started)
+        with self._cond:
+            self.flushed += len(batch)
+        if getattr(settings, 'LOG_ROLLUP_REFRESH_ON_FLUSH', True):
+            self._refresh_rollup()
+        if not all(getattr(obj, 'log_read', False) for obj in batch):
+            caching.invalidate(self.model)
+        tail.publish(self.model, batch)
+
+    def _refresh_rollup(self):
+        rollup = rollups.for_source(self.model)
+        if rollup is None:
+            return
+        try:
+            rollup.refresh(max_rows=getattr(settings, 'LOG_ROLLUP_REFRESH_MAX_ROWS', 50000))
+        except Exception:
+            # The rows are stored; the next flush or rollup_logs counts them.
+            pass
+
+    def flush(self):
+        """Write every queued row from the calling thread."""
+        while True:
+            with self._cond:
+                batch = self._take_batch()
+            if not batch:
+                return
+            self._write(batch)
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    while not self._stopping:
+                        if len(self._queue) >= self.batch_size:
+                            break
+                        if self._queue:
+                            remaining = self._oldest + self.flush_interval - time.monotonic()
+                            if remaining <= 0:
+                                break
+                            self._cond.wait(remaining)
+                        else:
+                            self._cond.wait()
+                    batch = self._take_batch()
+                    done = self._stopping and not self._queue
+                if batch:
+                    self._write(batch)
+                if done:
+                    return
+        finally:
+            connections.close_all()
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name=f'log-writer-{self.model._meta.model_name}', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the worker after it has flushed everything still queued."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def reset_after_fork(self):
+        # Threads do not survive fork(); rows queued by the parent belong to it.
+        self._cond = threading.Condition()
+        self._queue.clear()
+        self._oldest = None
+        self._thread = None
+        self._stopping = False
+        self._pid = os.getpid()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': len(self._queue),
+                'enqueued': self.enqueued,
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'failed': self.failed,
+            }
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def buffering_enabled():
+    return getattr(settings, 'LOG_BUFFER_ENABLED', False)
+
+
+def get_writer(model):
+    with _writers_lock:
+        writer = _writers.get(model)
+        if writer is None:
+            writer = BufferedLogWriter(
+                model,
+                max_size=getattr(settings, 'LOG_BUFFER_MAX_SIZE', 10000),
+                batch_size=getattr(settings, 'LOG_BUFFER_BATCH_SIZE', 500),
+                flush_interval=getattr(settings, 'LOG_BUFFER_FLUSH_INTERVAL', 1.0),
+                policy=getattr(settings, 'LOG_BUFFER_POLICY', BLOCK),
+                sample_rate=getattr(settings, 'LOG_BUFFER_SAMPLE_RATE', 0.1),
+            )
+            _writers[model] = writer
+        elif writer._pid != os.getpid():
+            writer.reset_after_fork()
+    writer.start()
+    return writer
+
+
+def stats():
+    with _writers_lock:
+        writers = list(_writers.values())
+    return {w.model._meta.label_lower: w.stats() for w in writers}
+
+
+def shutdown():
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        if writer._pid == os.getpid():
+            writer.stop()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,158 @@
+import hashlib
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import ActivityLog, ErrorLog
+
+KINDS = {ActivityLog: 'activity', ErrorLog: 'error'}
+PREFIX = 'monitoring:responses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'LOG_CACHE_ALIAS', 'default')]
+
+
+def timeout():
+    return getattr(settings, 'LOG_CACHE_TIMEOUT', 10)
+
+
+def _version_key(kind):
+    return f'{PREFIX}:version:{kind}'
+
+
+def invalidate(model):
+    """Start a new version for ``model``'s responses; called whenever rows are written."""
+    kind = KINDS.get(model)
+    if kind is None:
+        return
+    try:
+        # The version is the write time, so it doubles as Last-Modified.
+        get_cache().set(_version_key(kind), time.time(), None)
+    except Exception:
+        # A cache outage must not fail log writes.
+        pass
+
+
+def versions(kinds):
+    """Current version of each kind, with one cache round trip when warm."""
+    cache = get_cache()
+    found = cache.get_many([_version_key(k) for k in kinds])
+    result = {}
+    for kind in kinds:
+        version = found.get(_version_key(kind))
+        if version is None:
+            # Unknown (cold or evicted cache): start a version now.
+            cache.add(_version_key(kind), time.time(), None)
+            version = cache.get(_version_key(kind))
+        result[kind] = version
+    return result
+
+
+def normalized_params(request):
+    params = request.query_params
+    return '&'.join(f'{key}={value}' for key in sorted(params) for value in params.getlist(key))
+
+
+class CacheStats:
+    __slots__ = ('hits', 'misses', 'not_modified', '_lock')
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
+
+
+stats = CacheStats()
+
+
+class Entry:
+    """Cache key and validators of one request against the current versions."""
+
+    def __init__(self, request, kinds, scope):
+        current = versions(kinds)
+        token = '|'.join(repr(current[k]) for k in kinds)
+        digest = hashlib.sha1(f'{scope}|{request.path}|{normalized_params(request)}|{token}'.encode()).hexdigest()
+        self.key = f'{PREFIX}:{digest}'
+        self.etag = quote_etag(digest[:32])
+        # Last-Modified has whole seconds. The second a version falls in is
+        # only claimed once it is over; until then the date is the second
+        # before, so a later write in the same second still changes it.
+        self.modified = math.ceil(max(current.values()))
+        self.last_modified = self.modified if self.modified <= time.time() else self.modified - 1
+
+    def not_modified(self, request):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return self.etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+        return since is not None and self.modified <= since
+
+    def headers(self, response):
+        response['ETag'] = self.etag
+        response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+def cached_data(request, kinds, compute, scope=''):
+    """``compute()``'s result, reused until ``kinds`` change or the TTL passes."""
+    if not timeout():
+        return compute()
+    entry = Entry(request, kinds, scope)
+    cache = get_cache()
+    data = cache.get(entry.key)
+    if data is not None:
+        stats.count('hits')
+        return data
+    stats.count('misses')
+    data = compute()
+    cache.set(entry.key, data, timeout())
+    return data
+
+
+def cached_response(*kinds):
+    """Caches a view method's 200 responses and answers conditional GETs with 304.
+
+    Both need only cache lookups, no queries. Requests with a parameter in
+    the view's ``uncached_params`` (exports, say) go straight through.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            skip = getattr(view, 'uncached_params', ())
+            if request.method != 'GET' or not timeout() or any(p in request.query_params for p in skip):
+                return method(view, request, *args, **kwargs)
+            entry = Entry(request, kinds, type(view).__name__)
+            if entry.not_modified(request):
+                stats.count('not_modified')
+                return entry.headers(Response(status=status.HTTP_304_NOT_MODIFIED))
+            cache = get_cache()
+            data = cache.get(entry.key)
+            if data is not None:
+                stats.count('hits')
+                return entry.headers(Response(data))
+            stats.count('misses')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                cache.set(entry.key, response.data, timeout())
+                entry.headers(response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,146 @@
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.http.request import RawPostDataException
+
+try:
+    import orjson
+    _loads = orjson.loads
+except Exception:
+    orjson = None
+    _loads = json.loads
+
+REDACTED = '***'
+TOO_DEEP = '[nested too deep]'
+MORE_KEY = '...'
+
+
+def is_json(content_type):
+    return content_type == 'application/json' or content_type.endswith('+json')
+
+
+def content_length(request):
+    try:
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return 0
+
+
+class BodyCapture:
+    """Bounded, redacted copy of JSON request bodies for ``extra['body']``.
+
+    Only ``application/json`` (and ``+json``) bodies of at most ``max_bytes``
+    are read; anything else is decided from the headers without touching the
+    stream, and an oversized body is recorded as a size marker. The parsed
+    body is owned by the capture, so redaction and truncation happen in place
+    in a single walk: values of ``sensitive_keys`` (matched case-insensitively
+    at any depth) become ``***``, strings are cut to ``max_string``
+    characters, lists and objects to ``max_items`` entries, and containers
+    below ``max_depth`` are replaced by a marker.
+    """
+
+    def __init__(self, sensitive_keys=('password',), max_bytes=16384, max_depth=8, max_string=1024,
+                 max_items=100):
+        self.sensitive = frozenset(key.lower() for key in sensitive_keys)
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.max_string = max_string
+        self.max_items = max_items
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            getattr(settings, 'SENSITIVE_KEYS', {'password'}),
+            max_bytes=getattr(settings, 'LOG_REQUEST_BODY_MAX_BYTES', 16384),
+            max_depth=getattr(settings, 'LOG_REQUEST_BODY_MAX_DEPTH', 8),
+            max_string=getattr(settings, 'LOG_REQUEST_BODY_MAX_STRING', 1024),
+            max_items=getattr(settings, 'LOG_REQUEST_BODY_MAX_ITEMS', 100),
+        )
+
+    def capturable(self, request):
+        return is_json(request.content_type or '') and 0 < content_length(request) <= self.max_bytes
+
+    def preload(self, request):
+        """Buffer a capturable body before the view runs.
+
+        DRF parsers read the stream directly, after which ``request.body`` is
+        gone; once buffered here they parse the same bytes from memory.
+        """
+        if self.capturable(request):
+            self.read(request)
+
+    def read(self, request):
+        try:
+            return request.body
+        except (RawPostDataException, RequestDataTooBig, OSError):
+            return None
+
+    def capture(self, request):
+        """The value to log for ``request``'s body, or None to log none."""
+        if not is_json(request.content_type or ''):
+            return None
+        length = content_length(request)
+        if length > self.max_bytes:
+            return f'[{length} bytes not captured]'
+        body = self.read(request) if length else None
+        if not body:
+            return None
+        try:
+            data = _loads(body)
+        except (ValueError, RecursionError):
+            return None
+        return self.clean(data)
+
+    def clean(self, value, depth=0):
+        """Redact and truncate ``value``, reusing its containers; returns the result."""
+        if type(value) is str:
+            return self.truncate(value) if len(value) > self.max_string else value
+        if type(value) is dict:
+            if depth >= self.max_depth:
+                return TOO_DEEP
+            more = len(value) - self.max_items
+            if more > 0:
+                value = dict(islice(value.items(), self.max_items))
+            sensitive = self.sensitive
+            max_string = self.max_string
+            for key, item in value.items():
+                if key.lower() in sensitive:
+                    value[key] = REDACTED
+                elif type(item) is str:
+                    if len(item) > max_string:
+                        value[key] = self.truncate(item)
+                elif type(item) is dict or type(item) is list:
+                    value[key] = self.clean(item, depth + 1)
+            if more > 0:
+                value[MORE_KEY] = f'[{more} more keys]'
+            return value
+        if type(value) is list:
+            if depth >= self.max_depth:
+                return TOO_DEEP
+            more = len(value) - self.max_items
+            if more > 0:
+                del value[self.max_items:]
+            for i, item in enumerate(value):
+                if type(item) is str:
+                    if len(item) > self.max_string:
+                        value[i] = self.truncate(item)
+                elif type(item) is dict or type(item) is list:
+                    value[i] = self.clean(item, depth + 1)
+            if more > 0:
+                value.append(f'[{more} more items]')
+            return value
+        return value
+
+    def truncate(self, text):
+        return f'{text[:self.max_string]}...[{len(text) - self.max_string} more chars]'
+
+    def redact(self, data):
+        """Deep-redacted copy of ``data`` without truncation (see ``utils.sanitize_data``)."""
+        if isinstance(data, dict):
+            return {k: REDACTED if isinstance(k, str) and k.lower() in self.sensitive else self.redact(v)
+                    for k, v in data.items()}
+        if isinstance(data, list):
+            return [self.redact(v) for v in data]
+        return data
@@ -0,0 +1,116 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, router
+from django.db.models import Q
+
+LOG_DATABASE = 'logs'
+# Ids per window of the sampled COUNT that checks an id-span estimate.
+COUNT_SAMPLE = 1000
+# Everything in the monitoring app except the demo Item model.
+LOG_MODELS = frozenset({
+    'activitylog', 'errorlog', 'errorgroup', 'useragent',
+    'activityrollup', 'errorrollup', 'rollupcheckpoint',
+})
+
+
+def log_database():
+    """Alias of the separate log database, or None when logs share ``default``."""
+    return LOG_DATABASE if LOG_DATABASE in settings.DATABASES else None
+
+
+def is_log_model(model):
+    meta = model._meta
+    return meta.app_label == 'monitoring' and meta.model_name in LOG_MODELS
+
+
+class LogRouter:
+    """Sends the log tables to the ``logs`` database when one is configured.
+
+    Log writes then take the lock of their own SQLite file instead of queueing
+    behind auth and app writes. Nothing else is ever routed to ``logs``.
+    """
+
+    def db_for_read(self, model, **hints):
+        if is_log_model(model):
+            return log_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Log rows reference users by id across databases.
+        if is_log_model(type(obj1)) or is_log_model(type(obj2)):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = log_database()
+        if alias is None:
+            return None
+        is_log = app_label == 'monitoring' and model_name in LOG_MODELS
+        if db == alias:
+            return is_log
+        return False if is_log else None
+
+
+def shares_user_database(model):
+    return router.db_for_read(model) == router.db_for_read(get_user_model())
+
+
+def with_users(queryset):
+    """Load each row's ``user`` with a join, or a second query across databases."""
+    if shares_user_database(queryset.model):
+        return queryset.select_related('user')
+    return queryset.prefetch_related('user')
+
+
+def estimated_count(queryset):
+    """Approximate rows ``queryset`` would return, or None when it should be counted.
+
+    PostgreSQL estimates any query from the planner's statistics. Elsewhere
+    only an unfiltered table is estimated, from the span of its ids (two
+    index lookups). Log rows are normally deleted oldest first, but rolled
+    back inserts and manual deletes leave gaps, so the span is checked
+    against a COUNT of three ``COUNT_SAMPLE``-id windows (start, middle,
+    end) and None is returned when they disagree by more than 10%, or when
+    the table is too small to sample.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    if queryset.query.has_filters():
+        return None
+    ids = queryset.order_by().values_list('pk', flat=True)
+    last = ids.order_by('-pk').first()
+    if last is None:
+        return 0
+    first = ids.order_by('pk').first()
+    span = last - first + 1
+    windows = (first, first + (span - COUNT_SAMPLE) // 2, last - COUNT_SAMPLE + 1)
+    if span <= COUNT_SAMPLE * len(windows):
+        return None
+    sampled = ids.filter(Q(*[Q(pk__gte=start, pk__lt=start + COUNT_SAMPLE) for start in windows],
+                           _connector=Q.OR)).count()
+    if sampled < 0.9 * COUNT_SAMPLE * len(windows):
+        return None
+    return span
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created hook: applies ``SQLITE_PRAGMAS`` to every SQLite connection."""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
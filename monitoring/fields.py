@@ -0,0 +1,286 @@
+import hashlib
+import socket
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db import connections, models, router
+
+
+class CodedCharField(models.Field):
+    """A string from a fixed list, stored as its small-integer position.
+
+    ``codes`` is append-only: the position of a value is what is stored, so
+    existing entries must never be reordered or removed. Values outside the
+    list are stored as code 0.
+    """
+
+    def __init__(self, *args, codes=(), **kwargs):
+        self.codes = tuple(codes)
+        self._code_of = {value: i for i, value in enumerate(self.codes)}
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['codes'] = self.codes
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'PositiveSmallIntegerField'
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if isinstance(value, int):
+            return self.codes[value] if value < len(self.codes) else self.codes[0]
+        # Rows written before the column was coded hold the string itself.
+        if isinstance(value, str) and value.isdigit():
+            return self.to_python(int(value))
+        return value
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        return self._code_of.get(value, 0)
+
+
+class PackedIPField(models.Field):
+    """IPv4/IPv6 address stored as its 4 or 16 packed bytes."""
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, memoryview)):
+            value = bytes(value)
+            return socket.inet_ntop(socket.AF_INET if len(value) == 4 else socket.AF_INET6, value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None or value == '':
+            return None
+        if isinstance(value, (bytes, memoryview)):
+            return bytes(value)
+        # inet_pton is far cheaper than ipaddress on the write path.
+        try:
+            return socket.inet_pton(socket.AF_INET6 if ':' in value else socket.AF_INET, value)
+        except (OSError, ValueError):
+            return None
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        return None if value is None else connection.Database.Binary(value)
+
+
+class Interner:
+    """Maps strings to ids in a dimension table, with an LRU cache both ways.
+
+    The table has ``value`` and unique ``digest`` columns. New ids are cached
+    only when created outside a transaction, so an id from a rolled-back
+    insert is never handed out again.
+    """
+
+    def __init__(self, model_label, max_size=4096):
+        self.model_label = model_label
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @staticmethod
+    def digest(value):
+        return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+    def _remember(self, value, pk):
+        with self._lock:
+            self._ids[value] = pk
+            self._values[pk] = value
+            self._ids.move_to_end(value)
+            self._values.move_to_end(pk)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+            while len(self._values) > self.max_size:
+                self._values.popitem(last=False)
+
+    def _cacheable(self):
+        return not connections[router.db_for_write(self.model)].in_atomic_block
+
+    def id_for(self, value):
+        if not value:
+            return 0
+        with self._lock:
+            pk = self._ids.get(value)
+            if pk is not None:
+                self._ids.move_to_end(value)
+                return pk
+        model = self.model
+        obj, created = model.objects.get_or_create(digest=self.digest(value), defaults={'value': value})
+        if not created or self._cacheable():
+            self._remember(value, obj.pk)
+        return obj.pk
+
+    def lookup(self, value):
+        """Id of ``value`` if it is already in the table, else None; never inserts."""
+        if not value:
+            return 0
+        with self._lock:
+            pk = self._ids.get(value)
+            if pk is not None:
+                self._ids.move_to_end(value)
+                return pk
+        pk = self.model.objects.filter(digest=self.digest(value)).values_list('pk', flat=True).first()
+        if pk is not None:
+            self._remember(value, pk)
+        return pk
+
+    def intern_many(self, values):
+        """Resolve many values with at most three queries for the cache misses."""
+        with self._lock:
+            missing = {v for v in values if v and v not in self._ids}
+        if not missing:
+            return
+        model = self.model
+        digests = {self.digest(v): v for v in missing}
+        known = model.objects.filter(digest__in=list(digests)).values_list('pk', 'digest')
+        for pk, digest in known:
+            self._remember(digests.pop(digest), pk)
+        if not digests or not self._cacheable():
+            return
+        model.objects.bulk_create(
+            [model(value=value, digest=digest) for digest, value in digests.items()],
+            ignore_conflicts=True,
+        )
+        for pk, digest in model.objects.filter(digest__in=list(digests)).values_list('pk', 'digest'):
+            self._remember(digests[digest], pk)
+
+    def value_for(self, pk):
+        if not pk:
+            return ''
+        with self._lock:
+            value = self._values.get(pk)
+            if value is not None:
+                self._values.move_to_end(pk)
+                return value
+        value = self.model.objects.filter(pk=pk).values_list('value', flat=True).first()
+        if value is None:
+            return ''
+        self._remember(value, pk)
+        return value
+
+    def values_for(self, pks):
+        """``{id: value}`` for many ids, with one query for the cache misses."""
+        found, missing = {0: ''}, set()
+        with self._lock:
+            for pk in pks:
+                if pk in found:
+                    continue
+                value = self._values.get(pk)
+                if value is None:
+                    missing.add(pk)
+                else:
+                    self._values.move_to_end(pk)
+                    found[pk] = value
+        missing.discard(None)
+        if missing:
+            for pk, value in self.model.objects.filter(pk__in=missing).values_list('pk', 'value'):
+                self._remember(value, pk)
+                found[pk] = value
+        return found
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+            self._values.clear()
+
+
+_interners = {}
+_interners_lock = threading.Lock()
+
+
+def get_interner(model_label):
+    with _interners_lock:
+        interner = _interners.get(model_label)
+        if interner is None:
+            interner = _interners[model_label] = Interner(model_label)
+        return interner
+
+
+# Compared against in lookups for text that was never interned; no row has it.
+NO_MATCH = -1
+LOOKUPS = frozenset({'exact', 'in', 'isnull'})
+
+
+class InternedTextField(models.Field):
+    """Repeated text stored as an id into the ``table`` dimension model.
+
+    Reads and writes still see the plain string. The empty string is id 0
+    and has no dimension row. Only saving creates dimension rows; filters
+    look ids up and support equality (``exact``, ``in``) only, since the
+    column holds no text to match against. Readers of many rows should read
+    the raw ids (``raw_ids``) and resolve them with ``Interner.values_for``.
+    """
+
+    def __init__(self, *args, table=None, **kwargs):
+        self.table = table
+        self.interner = get_interner(table)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['table'] = self.table
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'PositiveIntegerField'
+
+    def from_db_value(self, value, expression, connection):
+        return self.to_python(value)
+
+    def to_python(self, value):
+        if isinstance(value, int):
+            return self.interner.value_for(value)
+        # Rows written before the column was interned hold the text itself.
+        if isinstance(value, str) and value.isdigit():
+            return self.interner.value_for(int(value))
+        return value
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return value
+        pk = self.interner.lookup(value)
+        return NO_MATCH if pk is None else pk
+
+    def get_db_prep_save(self, value, connection):
+        if isinstance(value, str):
+            value = self.interner.id_for(value)
+        return super().get_db_prep_save(value, connection)
+
+    def get_lookup(self, lookup_name):
+        if lookup_name not in LOOKUPS:
+            return None
+        return super().get_lookup(lookup_name)
+
+    def get_transform(self, lookup_name):
+        return None
+
+    def raw_ids(self):
+        """This column as plain ids, bypassing the per-row conversion."""
+        return models.ExpressionWrapper(models.F(self.name), output_field=models.PositiveIntegerField())
+
+
+def intern_all(model, objs):
+    """Resolve interned values of ``objs`` up front, e.g. before ``bulk_create``.
+
+    Ids created inside the bulk insert's transaction would not be cached.
+    """
+    for field in model._meta.concrete_fields:
+        if isinstance(field, InternedTextField):
+            field.interner.intern_many([getattr(obj, field.attname) for obj in objs])
@@ -0,0 +1,110 @@
+import hashlib
+import re
+import threading
+import traceback
+from collections import OrderedDict
+
+_UUID = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
+_HEX = re.compile(r'\b(?:0x)?[0-9a-fA-F]{12,}\b')
+_NUMBER = re.compile(r'\d+')
+_QUOTED = re.compile(r'"[^"]*"|\'[^\']*\'')
+_FRAME = re.compile(r'^\s*File "([^"]+)", line \d+, in (\S+)', re.MULTILINE)
+_EXC_LINE = re.compile(r'^([A-Za-z_][\w.]*)(?::|$)')
+
+TOP_FRAMES = 5
+
+
+def normalize_endpoint(path):
+    """``/api/items/42/`` and ``/api/items/7/`` are the same endpoint."""
+    path = _UUID.sub('{uuid}', path or '')
+    path = _HEX.sub('{hex}', path)
+    return _NUMBER.sub('{id}', path)
+
+
+def normalize_message(message):
+    message = _UUID.sub('{uuid}', message or '')
+    message = _QUOTED.sub('{str}', message)
+    message = _HEX.sub('{hex}', message)
+    return _NUMBER.sub('{n}', message)[:500]
+
+
+def _short_path(filename):
+    # The last two path components survive venv and deploy-path changes.
+    return '/'.join(filename.replace('\\', '/').rsplit('/', 2)[-2:])
+
+
+def _exception_frames(exception):
+    frames = traceback.extract_tb(exception.__traceback__)[-TOP_FRAMES:]
+    return [(_short_path(f.filename), f.name) for f in frames]
+
+
+def _text_frames(stack_trace):
+    frames = _FRAME.findall(stack_trace or '')[-TOP_FRAMES:]
+    return [(_short_path(filename), name) for filename, name in frames]
+
+
+def _text_exception_type(stack_trace):
+    for line in reversed((stack_trace or '').strip().splitlines()):
+        match = _EXC_LINE.match(line.strip())
+        if match:
+            return match.group(1)
+    return ''
+
+
+def compute(message, endpoint, exception=None, stack_trace=''):
+    """Return ``(fingerprint, exception_type)`` for one error occurrence.
+
+    Line numbers, ids and literal values are left out so that the same bug
+    keeps its fingerprint across deploys and across requests. Errors without
+    a traceback fall back to the normalized message.
+    """
+    if exception is not None:
+        exc_type = type(exception).__qualname__
+        frames = _exception_frames(exception)
+    else:
+        exc_type = _text_exception_type(stack_trace)
+        frames = _text_frames(stack_trace)
+    parts = [exc_type, normalize_endpoint(endpoint)]
+    if frames:
+        parts.extend(f'{filename}:{name}' for filename, name in frames)
+    else:
+        parts.append(normalize_message(message))
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest(), exc_type
+
+
+class OccurrenceSampler:
+    """Keeps at most ``limit`` full occurrences per fingerprint per window.
+
+    Occurrences that are not stored are carried over to the next stored one
+    (as its ``occurrences`` weight), so sums over stored rows stay exact.
+    Per process, bounded to ``max_keys`` fingerprints.
+    """
+
+    def __init__(self, limit=5, window=60.0, max_keys=10000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._state = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sample(self, fingerprint, now):
+        """Return the weight to store the occurrence with, or 0 to skip it."""
+        with self._lock:
+            state = self._state.get(fingerprint)
+            if state is None or now - state[0] >= self.window:
+                pending = state[2] if state is not None else 0
+                state = [now, 0, pending]
+                self._state[fingerprint] = state
+            self._state.move_to_end(fingerprint)
+            if len(self._state) > self.max_keys:
+                self._state.popitem(last=False)
+            if state[1] < self.limit:
+                state[1] += 1
+                weight, state[2] = state[2] + 1, 0
+                return weight
+            state[2] += 1
+            return 0
+
+    def clear(self):
+        with self._lock:
+            self._state.clear()
@@ -0,0 +1,256 @@
+import gzip
+import json
+import re
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import caching, search
+from .models import ACTION_CODES, METHOD_CODES, ActivityLog
+from .utils import is_request_id
+
+try:
+    import orjson
+    _loads = orjson.loads
+except Exception:
+    orjson = None
+    _loads = json.loads
+
+CHUNK_SIZE = 5000
+# Rows per INSERT statement, within SQLite's bound-parameter limit.
+ROWS_PER_STATEMENT = 500
+MAX_ERRORS = 20
+GZIP_MAGIC = b'\x1f\x8b'
+
+_ACTION = {value: i for i, value in enumerate(ACTION_CODES)}
+_METHOD = {value: i for i, value in enumerate(METHOD_CODES)}
+
+
+class Rejected(ValueError):
+    pass
+
+
+def open_input(fileobj, compressed=None):
+    """Wrap ``fileobj`` for line iteration, gunzipping when needed.
+
+    With ``compressed=None`` the gzip magic is sniffed, which needs ``peek``.
+    """
+    if compressed is None:
+        compressed = fileobj.peek(2)[:2] == GZIP_MAGIC
+    return gzip.GzipFile(fileobj=fileobj, mode='rb') if compressed else fileobj
+
+
+# UTC timestamps as most shippers write them; converted by slicing.
+_UTC_ISO = re.compile(r'(\d{4}-\d\d-\d\d)T(\d\d:\d\d:\d\d)(?:\.(\d{1,6}))?(?:Z|\+00:00)')
+
+
+def _timestamp(value):
+    """ISO 8601 string to the naive UTC text every backend accepts (naive input is UTC)."""
+    if value is None:
+        parsed = timezone.now()
+    elif not isinstance(value, str):
+        raise Rejected('timestamp must be an ISO 8601 string')
+    else:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise Rejected(f'invalid timestamp {value!r}')
+        else:
+            # Same text str(datetime) would give, several times cheaper.
+            match = _UTC_ISO.fullmatch(value)
+            if match:
+                date, time_, fraction = match.groups()
+                if fraction and fraction.strip('0'):
+                    return f'{date} {time_}.{fraction.ljust(6, "0")}'
+                return f'{date} {time_}'
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return str(parsed)
+
+
+def _number(value, kind=float):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise Rejected('expected a non-negative number')
+    return kind(value)
+
+
+class IngestResult:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def reject(self, line, error, count=1):
+        self.rejected += count
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({'line': line, 'error': str(error)})
+
+    def as_dict(self):
+        return {'accepted': self.accepted, 'rejected': self.rejected, 'errors': self.errors}
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+
+class BulkInsert:
+    """Multi-row INSERTs of ready-made value tuples, in ``columns`` order, into ``model``'s table."""
+
+    def __init__(self, model, columns, using=None):
+        self.using = using or router.db_for_write(model)
+        self.connection = connections[self.using]
+        meta = model._meta
+        quote = self.connection.ops.quote_name
+        names = ', '.join(quote(meta.get_field(c).column) for c in columns)
+        self.insert = f'INSERT INTO {quote(meta.db_table)} ({names}) VALUES '
+        self.placeholder = f'({", ".join(["%s"] * len(columns))})'
+        self.full_sql = self.statement(ROWS_PER_STATEMENT)
+
+    def statement(self, rows):
+        return self.insert + ', '.join([self.placeholder] * rows)
+
+    def execute(self, rows):
+        with self.connection.cursor() as cursor:
+            for start in range(0, len(rows), ROWS_PER_STATEMENT):
+                batch = rows[start:start + ROWS_PER_STATEMENT]
+                sql = self.full_sql if len(batch) == ROWS_PER_STATEMENT else self.statement(len(batch))
+                cursor.execute(sql, [value for row in batch for value in row])
+
+
+class ActivityIngest:
+    """Streams NDJSON activity records into ``ActivityLog``.
+
+    Records use the field names of the activity log API (``user`` may be the
+    nested user object or an id). Lines are parsed one at a time and written
+    in chunks of ``chunk_size``, each chunk in its own transaction with
+    multi-row inserts; invalid records are counted and skipped without
+    affecting the rest of their chunk.
+    """
+    columns = ('user_id', 'action', 'method', 'path', 'ip_address', 'user_agent', 'status_code',
+               'timestamp', 'extra', 'duration_ms', 'db_queries', 'db_time_ms', 'request_id')
+
+    def __init__(self, chunk_size=None, using=None):
+        self.chunk_size = chunk_size or getattr(settings, 'LOG_INGEST_CHUNK_SIZE', CHUNK_SIZE)
+        self.bulk = BulkInsert(ActivityLog, self.columns, using)
+        self.using = self.bulk.using
+        self.connection = self.bulk.connection
+        meta = ActivityLog._meta
+        self.ip_field = meta.get_field('ip_address')
+        self.interner = meta.get_field('user_agent').interner
+
+    def run(self, lines):
+        result = IngestResult()
+        chunk = []
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = _loads(line)
+            except ValueError as exc:
+                result.reject(number, f'invalid JSON: {exc}')
+                continue
+            if not isinstance(record, dict):
+                result.reject(number, 'expected a JSON object')
+                continue
+            chunk.append((number, record))
+            if len(chunk) >= self.chunk_size:
+                self.write(chunk, result)
+                chunk = []
+        if chunk:
+            self.write(chunk, result)
+        return result
+
+    def write(self, chunk, result):
+        # Lookups for the whole chunk happen before the transaction opens.
+        self.interner.intern_many([r['user_agent'] for _, r in chunk if isinstance(r.get('user_agent'), str)])
+        user_ids = {u for u in (self.user_id(r) for _, r in chunk) if type(u) is int}
+        users = set()
+        if user_ids:
+            users = set(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+
+        rows = []
+        for number, record in chunk:
+            try:
+                rows.append(self.convert(record, users))
+            except (Rejected, TypeError, ValueError) as exc:
+                result.reject(number, exc)
+        if not rows:
+            return
+        try:
+            with transaction.atomic(using=self.using):
+                with search.activity.deferred(self.using):
+                    self.bulk.execute(rows)
+        except Exception as exc:
+            result.reject(chunk[0][0], f'chunk failed: {exc}', count=len(rows))
+            return
+        result.accepted += len(rows)
+        caching.invalidate(ActivityLog)
+
+    @staticmethod
+    def user_id(record):
+        user = record.get('user')
+        if isinstance(user, dict):
+            user = user.get('id')
+        if user is None:
+            user = record.get('user_id')
+        return user
+
+    def convert(self, record, users):
+        get = record.get
+        action = get('action') or 'other'
+        action_code = _ACTION.get(action)
+        if action_code is None:
+            raise Rejected(f'unknown action {action!r}')
+        method = get('method') or ''
+        if not isinstance(method, str):
+            raise Rejected('method must be a string')
+        path = get('path') or ''
+        if not isinstance(path, str):
+            raise Rejected('path must be a string')
+        ip = get('ip_address')
+        packed = None
+        if ip:
+            packed = self.ip_field.get_prep_value(ip) if isinstance(ip, str) else None
+            if packed is None:
+                raise Rejected(f'invalid ip_address {ip!r}')
+            packed = self.connection.Database.Binary(packed)
+        user_agent = get('user_agent') or ''
+        if not isinstance(user_agent, str):
+            raise Rejected('user_agent must be a string')
+        status_code = get('status_code', 200)
+        if isinstance(status_code, bool) or not isinstance(status_code, int) or not 100 <= status_code <= 599:
+            raise Rejected(f'invalid status_code {status_code!r}')
+        user_id = self.user_id(record)
+        if user_id is not None and (type(user_id) is not int or user_id not in users):
+            raise Rejected(f'unknown user {user_id!r}')
+        extra = get('extra')
+        if extra is not None and not isinstance(extra, dict):
+            raise Rejected('extra must be an object')
+        request_id = get('request_id') or None
+        if request_id is not None and not is_request_id(request_id):
+            raise Rejected(f'invalid request_id {request_id!r}')
+        return (
+            user_id,
+            action_code,
+            _METHOD.get(method.upper(), 0),
+            path[:512],
+            packed,
+            self.interner.id_for(user_agent),
+            status_code,
+            _timestamp(get('timestamp')),
+            None if extra is None else json.dumps(extra),
+            _number(get('duration_ms')),
+            _number(get('db_queries'), int),
+            _number(get('db_time_ms')),
+            request_id,
+        )
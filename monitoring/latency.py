@@ -0,0 +1,218 @@
+import math
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+
+from .models import METHOD_CODES
+
+# Buckets grow by 2**(1/8), so a reported percentile is within ~4.5% of the
+# true value; 1 µs .. 1 h fits in under 300 buckets.
+_BUCKETS_PER_DOUBLING = 8
+_LOG_BASE = math.log(2) / _BUCKETS_PER_DOUBLING
+_MIN_MS = 0.001
+
+
+class LogHistogram:
+    """Log-bucketed latency histogram in milliseconds.
+
+    Only non-empty buckets are stored, and two histograms merge by adding
+    bucket counts, so per-minute histograms roll up into hours exactly.
+    """
+    __slots__ = ('counts', 'total', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def index(value):
+        return int(math.log(max(value, _MIN_MS) / _MIN_MS) / _LOG_BASE)
+
+    @staticmethod
+    def value(index):
+        # Geometric midpoint of the bucket.
+        return _MIN_MS * math.exp((index + 0.5) * _LOG_BASE)
+
+    def record(self, value):
+        i = self.index(value)
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, n in other.counts.items():
+            self.counts[i] = self.counts.get(i, 0) + n
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, p):
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(self.total * p / 100))
+        if rank >= self.total:
+            return self.max
+        seen = 0
+        for i in sorted(self.counts):
+            seen += self.counts[i]
+            if seen >= rank:
+                return min(self.value(i), self.max)
+        return self.max
+
+    def summary(self, percentiles=(50, 95, 99)):
+        out = {'count': self.total, 'mean_ms': round(self.sum / self.total, 3) if self.total else None}
+        for p in percentiles:
+            value = self.percentile(p)
+            out[f'p{p}_ms'] = round(value, 3) if value is not None else None
+        out['max_ms'] = round(self.max, 3)
+        return out
+
+
+class LatencyRecorder:
+    """Per-process histograms keyed by endpoint and time bucket.
+
+    Buckets older than ``retention`` seconds are dropped as new ones open,
+    so memory is bounded by endpoints × retention / bucket_seconds.
+    """
+
+    def __init__(self, bucket_seconds=60, retention=86400):
+        self.bucket_seconds = int(bucket_seconds)
+        self.retention = retention
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._oldest = None
+
+    def record(self, endpoint, duration_ms, now=None):
+        now = time.time() if now is None else now
+        bucket = int(now // self.bucket_seconds) * self.bucket_seconds
+        with self._lock:
+            hist = self._buckets.get((endpoint, bucket))
+            if hist is None:
+                hist = self._buckets[(endpoint, bucket)] = LogHistogram()
+                self._expire(bucket)
+            hist.record(duration_ms)
+
+    def _expire(self, newest):
+        cutoff = newest - self.retention
+        if self._oldest is not None and self._oldest > cutoff:
+            return
+        for key in [key for key in self._buckets if key[1] <= cutoff]:
+            del self._buckets[key]
+        self._oldest = min((key[1] for key in self._buckets), default=None)
+
+    def snapshot(self, start=None, end=None, endpoint=None, bucket_seconds=None):
+        """Merged ``{(endpoint, bucket start): LogHistogram}`` within [start, end]."""
+        step = max(bucket_seconds or self.bucket_seconds, self.bucket_seconds)
+        out = {}
+        with self._lock:
+            for (name, bucket), hist in self._buckets.items():
+                if endpoint and name != endpoint:
+                    continue
+                if (start is not None and bucket < start) or (end is not None and bucket > end):
+                    continue
+                key = (name, bucket // step * step)
+                out.setdefault(key, LogHistogram()).merge(hist)
+        return out
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._oldest = None
+
+
+recorder = LatencyRecorder(
+    bucket_seconds=getattr(settings, 'LOG_LATENCY_BUCKET_SECONDS', 60),
+    retention=getattr(settings, 'LOG_LATENCY_RETENTION', 86400),
+)
+
+
+def bucket_start(bucket):
+    return datetime.fromtimestamp(bucket, dt_timezone.utc)
+
+
+class RequestTimer:
+    """Wall time plus database query count and time for one request."""
+    __slots__ = ('started', 'duration_ms', 'db_queries', 'db_time')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.db_queries = 0
+        self.db_time = 0.0
+
+    def stop(self):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        return self
+
+    @property
+    def db_time_ms(self):
+        return self.db_time * 1000
+
+
+_current = ContextVar('monitoring_request_timer', default=None)
+
+
+def start_request():
+    timer = RequestTimer()
+    return timer, _current.set(timer)
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def count_queries(execute, sql, params, many, context):
+    # Installed on every connection; only requests being timed pay for it.
+    timer = _current.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.db_time += time.perf_counter() - started
+        timer.db_queries += 1
+
+
+def install_query_counter(sender, connection, **kwargs):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+_GROUP = re.compile(r'\(\?P<(\w+)>[^)]*\)')
+
+
+@lru_cache(maxsize=1024)
+def route_template(route):
+    # Router patterns are regexes: ``^items/(?P<pk>[^/.]+)/$`` -> ``items/<pk>/``.
+    return _GROUP.sub(r'<\1>', route).replace('^', '').replace('$', '')
+
+
+def route_name(request):
+    """``/route`` template of the resolved URL, so ``/api/items/7/`` and ``/api/items/8/`` share one key."""
+    match = getattr(request, 'resolver_match', None)
+    return '/' + route_template(match.route) if match is not None and match.route else '/<unresolved>'
+
+
+def method_name(request):
+    """The request method, or ``other`` for verbs outside ``METHOD_CODES``.
+
+    Clients can send any verb; used as a label it would add a series each.
+    """
+    method = request.method
+    return method if method and method in METHOD_CODES else 'other'
+
+
+def endpoint_name(request, route=None):
+    """``METHOD /route``."""
+    return f'{method_name(request)} {route or route_name(request)}'
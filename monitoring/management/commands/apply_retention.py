@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from monitoring import archive, exports, rollups
+from monitoring.models import ActivityLog, ErrorLog
+
+TABLES = {
+    'activity': (ActivityLog, exports.ACTIVITY_EXPORT),
+    'error': (ErrorLog, exports.ERROR_EXPORT),
+}
+
+
+class Command(BaseCommand):
+    help = ('Archive log rows older than the retention period to daily compressed NDJSON '
+            'segments under LOG_ARCHIVE_DIR, then delete them in small batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=sorted(TABLES), help='Process a single table.')
+        parser.add_argument('--days', type=int, help='Override the retention period in days.')
+        parser.add_argument('--chunk-size', type=int,
+                            default=getattr(settings, 'LOG_RETENTION_CHUNK_SIZE', 1000))
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived.')
+
+    def handle(self, *args, **options):
+        retention = getattr(settings, 'LOG_RETENTION_DAYS', {})
+        # Raw rows must be counted before they disappear.
+        if not options['dry_run']:
+            rollups.refresh()
+        midnight = rollups.truncate(timezone.now(), 'day')
+        for kind, (model, spec) in TABLES.items():
+            if options['only'] and options['only'] != kind:
+                continue
+            days = options['days'] if options['days'] is not None else retention.get(kind)
+            if days is None:
+                continue
+            cutoff = midnight - timedelta(days=days)
+            archived, deleted = archive.archive_before(
+                model, kind, spec.row_format, cutoff,
+                chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+            )
+            verb = 'would archive' if options['dry_run'] else 'archived'
+            self.stdout.write(f'{kind}: {verb} {archived} rows older than {cutoff:%Y-%m-%d}, deleted {deleted}')
@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import ingest
+
+
+class Command(BaseCommand):
+    help = ('Load activity records from an NDJSON file (optionally gzip-compressed) into ActivityLog, '
+            'in chunks of one transaction each.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="NDJSON file, or '-' for standard input.")
+        parser.add_argument('--chunk-size', type=int, help='Records per transaction (default LOG_INGEST_CHUNK_SIZE).')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        try:
+            raw = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(exc)
+        try:
+            result = ingest.ActivityIngest(chunk_size=options['chunk_size']).run(ingest.open_input(raw))
+        except (OSError, EOFError) as exc:
+            raise CommandError(f'Could not read {path}: {exc}')
+        finally:
+            if raw is not sys.stdin.buffer:
+                raw.close()
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        seconds = result.seconds
+        rate = result.accepted / seconds if seconds else 0
+        self.stdout.write(f'accepted {result.accepted}, rejected {result.rejected} '
+                          f'in {seconds:.1f}s ({rate:.0f} records/s)')
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import archive, rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new ActivityLog/ErrorLog rows into the rollup tables used by /logs/stats.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--max-rows', type=int, default=None,
+                            help='Stop after this many raw rows per table.')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute the rollups from the day of the oldest stored row on.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            self.rebuild(options['chunk_size'])
+        processed = rollups.refresh(options['chunk_size'], options['max_rows'])
+        for name, n in processed.items():
+            self.stdout.write(f'{name}: {n} rows rolled up')
+
+    def rebuild(self, chunk_size):
+        # Older buckets also count archived rows and are kept. Counts that
+        # never had a stored row cannot be recomputed, so refuse instead.
+        plan = []
+        for rollup in rollups.ROLLUPS:
+            since = rollup.oldest_day()
+            if since is None:
+                continue
+            if archive.segments(rollup.name, since.date()):
+                raise CommandError(f'{rollup.name}: rows from {since:%Y-%m-%d} on have been archived; '
+                                   f'rebuilding would drop their counts.')
+            if rollup.added_since(since):
+                raise CommandError(f'{rollup.name}: sampled-out requests were counted since {since:%Y-%m-%d}; '
+                                   f'rebuilding would drop their counts.')
+            plan.append((rollup, since))
+        for rollup, since in plan:
+            n = rollup.rebuild(since, chunk_size)
+            self.stdout.write(f'{rollup.name}: recounted {n} rows since {since:%Y-%m-%d}')
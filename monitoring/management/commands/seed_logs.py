@@ -0,0 +1,101 @@
+import time
+from contextlib import nullcontext
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from monitoring import caching, rollups, seeding
+from monitoring.models import ActivityLog, ErrorLog
+
+
+def parse_end(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid --end {value!r}; expected an ISO date or datetime.')
+        parsed = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = ('Insert synthetic activity and error rows for load and retention testing. '
+            'The same --seed and options always produce the same rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--activities', type=int, default=100000, help='Activity rows to insert.')
+        parser.add_argument('--errors', type=int, default=10000, help='Error rows to insert.')
+        parser.add_argument('--days', type=float, default=30, help='Length of the time span the rows cover.')
+        parser.add_argument('--end', help='End of the span (ISO date or datetime, UTC); default today 00:00 UTC.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=100, help='Distinct users (created as seed-user-N).')
+        parser.add_argument('--anonymous', type=float, default=0.2, help='Share of rows without a user.')
+        parser.add_argument('--paths', type=int, default=500, help='Distinct request paths.')
+        parser.add_argument('--fingerprints', type=int, default=50, help='Distinct error groups.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent for users, paths and fingerprints (0 is uniform).')
+        parser.add_argument('--actions', help='Action weights, e.g. read=70,create=10,update=5.')
+        parser.add_argument('--statuses', help='Activity status code weights, e.g. 200=90,404=5,500=1.')
+        parser.add_argument('--error-statuses', help='Error group status code weights, e.g. 500=90,503=10.')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per transaction.')
+        parser.add_argument('--defer-indexes', choices=('auto', 'always', 'never'), default='auto',
+                            help='Drop secondary indexes during the load and rebuild them after; '
+                                 'auto does so only for an empty table.')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not fold the rows into the rollups.')
+
+    def handle(self, *args, **options):
+        end = parse_end(options['end']) if options['end'] else rollups.truncate(timezone.now(), 'day')
+        try:
+            seeder = seeding.LogSeeder(
+                end - timedelta(days=options['days']), end,
+                seed=options['seed'], users=options['users'], anonymous=options['anonymous'],
+                paths=max(1, options['paths']), fingerprints=max(1, options['fingerprints']), skew=options['skew'],
+                actions=options['actions'] and seeding.parse_weights(options['actions']),
+                statuses=options['statuses'] and seeding.parse_weights(options['statuses'], int),
+                error_statuses=options['error_statuses'] and seeding.parse_weights(options['error_statuses'], int),
+                chunk_size=max(1, options['chunk_size']),
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        for name, model, total, load in (
+            ('activity', ActivityLog, options['activities'], seeder.activity),
+            ('error', ErrorLog, options['errors'], seeder.errors),
+        ):
+            if total <= 0:
+                continue
+            using = router.db_for_write(model)
+            defer = self.defer_indexes(options['defer_indexes'], model, using)
+            started = time.perf_counter()
+            with seeding.deferred_indexes(model, using) if defer else nullcontext():
+                inserted = load(total, using, progress=self.progress(name, total, options['verbosity']))
+            seconds = time.perf_counter() - started
+            caching.invalidate(model)
+            self.stdout.write(f'{name}: {inserted} rows in {seconds:.1f}s ({inserted / seconds:.0f} rows/s)'
+                              + (', indexes rebuilt' if defer else ''))
+
+        if not options['skip_rollups']:
+            started = time.perf_counter()
+            processed = rollups.refresh()
+            self.stdout.write(f'rollups: {sum(processed.values())} rows folded in '
+                              f'{time.perf_counter() - started:.1f}s')
+
+    def defer_indexes(self, mode, model, using):
+        if mode == 'never':
+            return False
+        if connections[using].in_atomic_block:
+            # Schema changes would not be undone cleanly on every backend.
+            if mode == 'always':
+                raise CommandError('--defer-indexes always cannot be used inside a transaction.')
+            return False
+        return mode == 'always' or not model.objects.using(using).exists()
+
+    def progress(self, name, total, verbosity):
+        if verbosity < 2:
+            return None
+        return lambda done: self.stderr.write(f'{name}: {done}/{total}')
@@ -0,0 +1,338 @@
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from django.conf import settings
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; log writes are usually a few milliseconds, batches up to a second.
+WRITE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_HEADER = struct.Struct('<Q')
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 64 * 1024
+
+
+class MemoryStore:
+    """Sample values of this process, keyed by ``(sample name, label values)``."""
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, amount):
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    def items(self):
+        with self.lock:
+            return list(self.values.items())
+
+
+class MmapStore(MemoryStore):
+    """A ``MemoryStore`` mirrored into a file other processes can read.
+
+    The file is a header holding the bytes in use, followed by entries of a
+    length-prefixed JSON key and an 8-byte aligned double. Only the owning
+    process writes it; an entry is complete before the header covers it,
+    so readers never see a torn key (see ``read_file``).
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.offsets = {}
+        self.file = open(path, 'a+b')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < _INITIAL_SIZE:
+            self.file.truncate(_INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.used = _HEADER.unpack_from(self.map, 0)[0] or _HEADER.size
+        # Reopening the file of an earlier process with this pid keeps its counts.
+        for key, value, offset in _entries(self.map, self.used):
+            self.values[key] = value
+            self.offsets[key] = offset
+
+    def add(self, key, amount):
+        with self.lock:
+            value = self.values.get(key, 0.0) + amount
+            self.values[key] = value
+            self._write(key, value)
+
+    def set(self, key, value):
+        with self.lock:
+            self.values[key] = value
+            self._write(key, value)
+
+    def _write(self, key, value):
+        offset = self.offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        _VALUE.pack_into(self.map, offset, value)
+
+    def _append(self, key):
+        encoded = json.dumps(key).encode()
+        start = self.used
+        # The value goes on the next 8-byte boundary after the key.
+        offset = (start + _LENGTH.size + len(encoded) + 7) // 8 * 8
+        end = offset + _VALUE.size
+        if end > len(self.map):
+            self._grow(end)
+        _LENGTH.pack_into(self.map, start, len(encoded))
+        self.map[start + _LENGTH.size:start + _LENGTH.size + len(encoded)] = encoded
+        _VALUE.pack_into(self.map, offset, 0.0)
+        self.used = end
+        _HEADER.pack_into(self.map, 0, end)
+        self.offsets[key] = offset
+        return offset
+
+    def _grow(self, needed):
+        size = len(self.map)
+        while size < needed:
+            size *= 2
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+def _entries(buffer, used):
+    pos = _HEADER.size
+    while pos < used:
+        length = _LENGTH.unpack_from(buffer, pos)[0]
+        key = json.loads(bytes(buffer[pos + _LENGTH.size:pos + _LENGTH.size + length]))
+        offset = (pos + _LENGTH.size + length + 7) // 8 * 8
+        yield (key[0], tuple(key[1])), _VALUE.unpack_from(buffer, offset)[0], offset
+        pos = offset + _VALUE.size
+
+
+def read_file(path):
+    """``{key: value}`` from one process's metrics file."""
+    data = Path(path).read_bytes()
+    if len(data) < _HEADER.size:
+        return {}
+    used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+    return {key: value for key, value, _ in _entries(data, used)}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Metric:
+    __slots__ = ('registry', 'name', 'kind', 'help', 'labelnames')
+
+    def __init__(self, registry, name, kind, help, labelnames):
+        self.registry = registry
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+
+class Counter(Metric):
+    def inc(self, labels=(), amount=1):
+        self.registry.store(COUNTER).add((self.name, labels), amount)
+
+
+class Gauge(Metric):
+    def set(self, labels, value):
+        self.registry.store(GAUGE).set((self.name, labels), value)
+
+
+class Histogram(Metric):
+    __slots__ = ('buckets',)
+
+    def __init__(self, registry, name, kind, help, labelnames, buckets):
+        super().__init__(registry, name, kind, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        store = self.registry.store(COUNTER)
+        # Per-bucket counts; the exposition makes them cumulative.
+        for bound in self.buckets:
+            if value <= bound:
+                break
+        else:
+            bound = math.inf
+        store.add((f'{self.name}_bucket', labels + (bound,)), 1)
+        store.add((f'{self.name}_sum', labels), value)
+        store.add((f'{self.name}_count', labels), 1)
+
+
+class Registry:
+    """Process-wide metrics rendered in the Prometheus text format.
+
+    Updates take one uncontended lock and never touch the database. With a
+    ``directory`` (``LOG_METRICS_DIR``), every process keeps its values in
+    its own memory-mapped files there and ``render`` sums the files of all
+    processes, so any pre-fork worker can answer a scrape for the whole
+    server. Counters of exited processes keep counting towards the totals;
+    their gauges are dropped.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.metrics = []
+        self._stores = {}
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(self, name, COUNTER, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(self, name, GAUGE, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=WRITE_BUCKETS):
+        return self._add(Histogram(self, name, HISTOGRAM, help, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def get_directory(self):
+        if self.directory is not None:
+            return self.directory
+        return getattr(settings, 'LOG_METRICS_DIR', None)
+
+    def store(self, kind):
+        store = self._stores.get(kind)
+        if store is None:
+            with self._lock:
+                store = self._stores.get(kind)
+                if store is None:
+                    directory = self.get_directory()
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                        store = MmapStore(os.path.join(directory, f'{kind}_{os.getpid()}.db'))
+                    else:
+                        store = MemoryStore()
+                    self._stores[kind] = store
+        return store
+
+    def _reset(self):
+        # A forked worker writes its own files; the parent's values stay with the parent.
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Forget this process's values (its files are left in place)."""
+        with self._lock:
+            for store in self._stores.values():
+                if isinstance(store, MmapStore):
+                    store.close()
+            self._stores = {}
+
+    def collect(self):
+        """Summed ``{(sample name, label values): value}`` over every process."""
+        directory = self.get_directory()
+        if not directory:
+            totals = {}
+            for kind in (COUNTER, GAUGE):
+                totals.update(self.store(kind).items())
+            return totals
+        totals = {}
+        for path in Path(directory).glob('*.db'):
+            kind, _, pid = path.stem.partition('_')
+            if kind == GAUGE and pid.isdigit() and not _alive(int(pid)):
+                continue
+            try:
+                values = read_file(path)
+            except (OSError, ValueError):
+                continue
+            for key, value in values.items():
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+    def render(self):
+        samples = {}
+        for (name, labels), value in self.collect().items():
+            samples.setdefault(name, []).append((tuple(labels), value))
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            if metric.kind == HISTOGRAM:
+                lines.extend(_histogram_lines(metric, samples))
+            else:
+                for labels, value in sorted(samples.get(metric.name, ()), key=_sort_key):
+                    lines.append(_sample(metric.name, metric.labelnames, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _sort_key(sample):
+    return tuple(str(v) for v in sample[0])
+
+
+def _histogram_lines(metric, samples):
+    buckets = {}
+    for labels, value in samples.get(f'{metric.name}_bucket', ()):
+        per_bound = buckets.setdefault(labels[:-1], {})
+        per_bound[labels[-1]] = per_bound.get(labels[-1], 0) + value
+    sums = dict(samples.get(f'{metric.name}_sum', ()))
+    counts = dict(samples.get(f'{metric.name}_count', ()))
+    names = metric.labelnames + ('le',)
+    for labels in sorted(counts, key=lambda labels: tuple(map(str, labels))):
+        per_bound = buckets.get(labels, {})
+        cumulative = 0
+        for bound in metric.buckets + (math.inf,):
+            cumulative += per_bound.get(bound, 0)
+            yield _sample(f'{metric.name}_bucket', names, labels + (_bound(bound),), cumulative)
+        yield _sample(f'{metric.name}_sum', metric.labelnames, labels, sums.get(labels, 0.0))
+        yield _sample(f'{metric.name}_count', metric.labelnames, labels, counts[labels])
+
+
+def _bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _sample(name, names, labels, value):
+    if names:
+        pairs = ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, labels))
+        return f'{name}{{{pairs}}} {_number(value)}'
+    return f'{name} {_number(value)}'
+
+
+registry = Registry()
+requests = registry.counter('monitoring_requests_total', 'HTTP requests by route, method and status.',
+                            ('route', 'method', 'status'))
+errors = registry.counter('monitoring_errors_total', 'Errors logged, by fingerprint and exception type.',
+                          ('fingerprint', 'exception'))
+log_queue_depth = registry.gauge('monitoring_log_queue_depth', 'Log rows queued in memory for writing.',
+                                 ('table',))
+log_write_seconds = registry.histogram('monitoring_log_write_seconds',
+                                       'Time to write log rows, per write (a batch when buffered).',
+                                       ('table', 'mode'))
@@ -1,23 +1,47 @@
 import traceback
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.timezone import now
 from django.conf import settings
-from .utils import log_activity, log_error, sanitize_data
+from . import capture, latency, metrics, policy, rollups
+from .utils import log_activity, alog_activity, log_error, get_request_id, track_error_rate
+
+# Echoes the id the request's log rows were stored under (see /api/logs/trace/<id>).
+REQUEST_ID_HEADER = 'X-Request-ID'
 
 class ErrorLoggingMiddleware(MiddlewareMixin):
     def process_exception(self, request, exception):
-        stack = ''.join(traceback.format_exception(type(exception), exception, exception.__traceback__))
-        log_error(request, str(exception), stack_trace=stack)
-       
+        log_error(request, str(exception), stack_trace=self.format_stack(exception),
+                  status_code=500, exception=exception)
+        return self.error_response(exception)
+
+    def format_stack(self, exception):
+        return ''.join(traceback.format_exception(type(exception), exception, exception.__traceback__))
+
+    def error_response(self, exception):
         return JsonResponse({'detail': 'Internal Server Error', 'error': str(exception)}, status=500)
 
 class ActivityLoggingMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.policy = policy.compile_policy()
+        self.capture = capture.BodyCapture.from_settings()
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
         response = None
-       
+        get_request_id(request)
+        if self.policy.captures_body:
+            self.capture.preload(request)
+        timer, token = latency.start_request()
         try:
             response = self.get_response(request)
             status = getattr(response, 'status_code', 200)
@@ -26,33 +50,90 @@ class ActivityLoggingMiddleware:
             status = 500
             raise
         finally:
-            action = self.infer_action(request, response)
-            
-            extra = {}
-            if getattr(settings, 'LOG_REQUEST_BODY', False):
-                if request.content_type and 'application/json' in request.content_type:
-                    try:
-                        import json
-                        data = json.loads(request.body.decode('utf-8') or '{}')
-                        extra['body'] = sanitize_data(data)
-                    except Exception:
-                        pass
-            log_activity(request, action=action, status_code=status, extra=extra)
+            self.finish_timing(request, status, timer, token)
+            rule, keep = self.decide(request, status)
+            if keep:
+                log_activity(request, action=rule.action_for(request.method.upper()), status_code=status,
+                             extra=self.request_extra(request, rule.capture_body), timing=timer)
+            elif rule is not None and self.count_sampled_out(rule, request, status):
+                self.flush_pending()
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        response = None
+        get_request_id(request)
+        if self.policy.captures_body:
+            self.capture.preload(request)
+        timer, token = latency.start_request()
+        try:
+            response = await self.get_response(request)
+            status = getattr(response, 'status_code', 200)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            self.finish_timing(request, status, timer, token)
+            rule, keep = self.decide(request, status)
+            if keep:
+                await alog_activity(request, action=rule.action_for(request.method.upper()), status_code=status,
+                                    extra=self.request_extra(request, rule.capture_body), timing=timer)
+            elif rule is not None and self.count_sampled_out(rule, request, status):
+                await sync_to_async(self.flush_pending)()
+        response[REQUEST_ID_HEADER] = request.request_id
         return response
 
+    def finish_timing(self, request, status, timer, token):
+        # Stop before the log write so it is not counted against the request.
+        latency.finish_request(token)
+        timer.stop()
+        route = latency.route_name(request)
+        endpoint = latency.endpoint_name(request, route)
+        latency.recorder.record(endpoint, timer.duration_ms)
+        metrics.requests.inc((route, latency.method_name(request), status))
+        if status >= 500:
+            # Here rather than in log_activity so sampled-out failures count too.
+            track_error_rate('endpoint', endpoint)
+
+    def decide(self, request, status):
+        """Return ``(rule, keep)``; non-2xx responses bypass sampling if the rule says so.
+
+        Views marked with ``policy.unlogged`` give ``(None, False)``: neither
+        logged nor counted in the rollups.
+        """
+        if policy.is_unlogged(request):
+            return None, False
+        rule = self.policy.for_request(request)
+        if policy.sampled(request.request_id, rule.sample_rate):
+            policy.sampling.count(True)
+            return rule, True
+        if rule.always_log_errors and policy.is_error(status):
+            policy.sampling.count(True, forced=True)
+            return rule, True
+        policy.sampling.count(False)
+        return rule, False
+
+    def count_sampled_out(self, rule, request, status):
+        """Count a dropped request for the rollups; True when a flush is due."""
+        rollups.pending.add(now(), rule.action_for(request.method.upper()), status)
+        return rollups.pending.due()
+
+    def flush_pending(self):
+        try:
+            rollups.flush_pending()
+        except Exception:
+            # Avoid breaking app if logging fails; counts are kept for the next flush
+            pass
+
+    def request_extra(self, request, capture_body=None):
+        extra = {}
+        if capture_body is None:
+            capture_body = getattr(settings, 'LOG_REQUEST_BODY', False)
+        if capture_body:
+            body = self.capture.capture(request)
+            if body is not None:
+                extra['body'] = body
+        return extra
+
     def infer_action(self, request, response):
-        path = request.path.lower()
-        method = request.method.upper()
-        if path.endswith('/auth/login'):
-            return 'login'
-        if path.endswith('/auth/logout'):
-            return 'logout'
-        if path.endswith('/me/profile') and method in ('PUT', 'PATCH'):
-            return 'profile_update'
-        if method == 'POST':
-            return 'create'
-        if method == 'PUT' or method == 'PATCH':
-            return 'update'
-        if method == 'DELETE':
-            return 'delete'
-        return 'read'
+        return self.policy.for_request(request).action_for(request.method.upper())
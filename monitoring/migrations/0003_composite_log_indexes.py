@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:03
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_activitylog_timestamp_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='activitylog',
+            name='monitoring__timesta_3e0c22_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activitylog',
+            name='monitoring__action_a5517e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='activitylog',
+            name='monitoring__user_id_debfb4_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='errorlog',
+            name='monitoring__timesta_c4071d_idx',
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activity_logs', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['timestamp', 'id'], name='monitoring__timesta_6f6ee9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', 'timestamp'], name='monitoring__user_id_897f09_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['action', 'timestamp'], name='monitoring__action_c97c2a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', 'action', 'timestamp'], name='monitoring__user_id_8910f8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errorlog',
+            index=models.Index(fields=['timestamp', 'id'], name='monitoring__timesta_06c9cf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errorlog',
+            index=models.Index(fields=['status_code', 'timestamp'], name='monitoring__status__d193f8_idx'),
+        ),
+    ]
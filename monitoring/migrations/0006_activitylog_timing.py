@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0005_error_groups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activitylog',
+            name='db_queries',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='activitylog',
+            name='db_time_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='activitylog',
+            name='duration_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,189 @@
+# Re-encodes method, action, IP and user agent columns (see monitoring.fields).
+# Each column is converted through a temporary column so that it works on any
+# backend: add it, fill it in batches, drop the old column, rename.
+
+import hashlib
+import socket
+
+import monitoring.fields
+from django.db import migrations, models
+
+# Frozen copies of models.METHOD_CODES and models.ACTION_CODES.
+METHOD_CODES = ('', 'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS', 'TRACE', 'CONNECT')
+ACTION_CODES = ('other', 'login', 'logout', 'profile_update', 'create', 'read', 'update', 'delete')
+BATCH_SIZE = 2000
+
+# (model, old field, temporary field)
+COLUMNS = {
+    'activitylog': [('action', 'action_code'), ('method', 'method_code'), ('ip_address', 'ip_packed'),
+                    ('user_agent', 'user_agent_ref')],
+    'errorlog': [('method', 'method_code'), ('ip_address', 'ip_packed'), ('user_agent', 'user_agent_ref')],
+}
+ACTION_INDEXES = [
+    models.Index(fields=['action', 'timestamp'], name='monitoring__action_c97c2a_idx'),
+    models.Index(fields=['user', 'action', 'timestamp'], name='monitoring__user_id_8910f8_idx'),
+]
+
+
+def _code(codes, value):
+    return codes.index(value) if value in codes else 0
+
+
+def _pack(value):
+    if not value:
+        return None
+    try:
+        return socket.inet_pton(socket.AF_INET6 if ':' in value else socket.AF_INET, value)
+    except (OSError, ValueError):
+        return None
+
+
+def _unpack(value):
+    if value is None:
+        return None
+    value = bytes(value)
+    return socket.inet_ntop(socket.AF_INET if len(value) == 4 else socket.AF_INET6, value)
+
+
+def _intern(UserAgent, using, values):
+    """``{text: id}`` for ``values``, creating the missing dimension rows."""
+    digests = {hashlib.sha1(v.encode('utf-8')).hexdigest(): v for v in values if v}
+    if not digests:
+        return {}
+    UserAgent.objects.using(using).bulk_create(
+        [UserAgent(value=value, digest=digest) for digest, value in digests.items()], ignore_conflicts=True,
+    )
+    rows = UserAgent.objects.using(using).filter(digest__in=list(digests)).values_list('digest', 'pk')
+    return {digests[digest]: pk for digest, pk in rows}
+
+
+def _batches(model, using, fields):
+    last_id = 0
+    while True:
+        rows = list(model.objects.using(using).filter(id__gt=last_id).order_by('id')
+                    .values_list('id', *fields)[:BATCH_SIZE])
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def compact(apps, schema_editor):
+    using = schema_editor.connection.alias
+    UserAgent = apps.get_model('monitoring', 'UserAgent')
+    for model_name, columns in COLUMNS.items():
+        model = apps.get_model('monitoring', model_name)
+        old = [name for name, _ in columns]
+        for rows in _batches(model, using, old):
+            agents = [row[old.index('user_agent') + 1] for row in rows]
+            ids = _intern(UserAgent, using, set(agents))
+            objs = []
+            for row in rows:
+                values = dict(zip(old, row[1:]))
+                obj = model(id=row[0], method_code=_code(METHOD_CODES, values['method']),
+                            ip_packed=_pack(values['ip_address']),
+                            user_agent_ref=ids.get(values['user_agent'], 0))
+                if 'action' in values:
+                    obj.action_code = _code(ACTION_CODES, values['action'])
+                objs.append(obj)
+            model.objects.using(using).bulk_update(objs, [temp for _, temp in columns])
+
+
+def expand(apps, schema_editor):
+    using = schema_editor.connection.alias
+    UserAgent = apps.get_model('monitoring', 'UserAgent')
+    for model_name, columns in COLUMNS.items():
+        model = apps.get_model('monitoring', model_name)
+        temp = [name for _, name in columns]
+        for rows in _batches(model, using, temp):
+            refs = {row[temp.index('user_agent_ref') + 1] for row in rows} - {0}
+            agents = dict(UserAgent.objects.using(using).filter(pk__in=refs).values_list('pk', 'value'))
+            objs = []
+            for row in rows:
+                values = dict(zip(temp, row[1:]))
+                code = values['method_code']
+                obj = model(id=row[0], method=METHOD_CODES[code] if code < len(METHOD_CODES) else '',
+                            ip_address=_unpack(values['ip_packed']),
+                            user_agent=agents.get(values['user_agent_ref'], ''))
+                if 'action_code' in values:
+                    code = values['action_code']
+                    obj.action = ACTION_CODES[code] if code < len(ACTION_CODES) else 'other'
+                objs.append(obj)
+            model.objects.using(using).bulk_update(objs, [name for name, _ in columns])
+
+
+def _temporary_field(name):
+    if name == 'ip_packed':
+        return models.BinaryField(blank=True, null=True)
+    if name == 'user_agent_ref':
+        return models.PositiveIntegerField(default=0)
+    return models.PositiveSmallIntegerField(default=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0006_activitylog_timing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.TextField()),
+                ('digest', models.CharField(max_length=40, unique=True)),
+            ],
+        ),
+        # The action column is in two indexes; they are rebuilt on the coded column.
+        *[migrations.RemoveIndex(model_name='activitylog', name=index.name) for index in ACTION_INDEXES],
+        *[
+            migrations.AddField(model_name=model_name, name=temp, field=_temporary_field(temp))
+            for model_name, columns in COLUMNS.items() for _, temp in columns
+        ],
+        migrations.RunPython(compact, expand, hints={'model_name': 'activitylog'}),
+        *[
+            operation
+            for model_name, columns in COLUMNS.items() for name, temp in columns
+            for operation in (
+                migrations.RemoveField(model_name=model_name, name=name),
+                migrations.RenameField(model_name=model_name, old_name=temp, new_name=name),
+            )
+        ],
+        migrations.AlterField(
+            model_name='activitylog',
+            name='action',
+            field=monitoring.fields.CodedCharField(choices=[('login', 'Login'), ('logout', 'Logout'), ('profile_update', 'Profile Update'), ('create', 'Create'), ('read', 'Read'), ('update', 'Update'), ('delete', 'Delete'), ('other', 'Other')], codes=('other', 'login', 'logout', 'profile_update', 'create', 'read', 'update', 'delete'), default='other'),
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='ip_address',
+            field=monitoring.fields.PackedIPField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='method',
+            field=monitoring.fields.CodedCharField(blank=True, codes=('', 'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS', 'TRACE', 'CONNECT'), default=''),
+        ),
+        migrations.AlterField(
+            model_name='activitylog',
+            name='user_agent',
+            field=monitoring.fields.InternedTextField(blank=True, default='', table='monitoring.UserAgent'),
+        ),
+        migrations.AlterField(
+            model_name='errorlog',
+            name='ip_address',
+            field=monitoring.fields.PackedIPField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='errorlog',
+            name='method',
+            field=monitoring.fields.CodedCharField(blank=True, codes=('', 'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS', 'TRACE', 'CONNECT'), default=''),
+        ),
+        migrations.AlterField(
+            model_name='errorlog',
+            name='user_agent',
+            field=monitoring.fields.InternedTextField(blank=True, default='', table='monitoring.UserAgent'),
+        ),
+        *[migrations.AddIndex(model_name='activitylog', index=index) for index in ACTION_INDEXES],
+    ]
@@ -1,8 +1,24 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
+from .fields import CodedCharField, InternedTextField, PackedIPField
+
 User = get_user_model()
 
+# Stored codes are positions in these tuples: append only.
+METHOD_CODES = ('', 'GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS', 'TRACE', 'CONNECT')
+ACTION_CODES = ('other', 'login', 'logout', 'profile_update', 'create', 'read', 'update', 'delete')
+
+
+class UserAgent(models.Model):
+    """Distinct user-agent strings, referenced by id from the log tables."""
+    value = models.TextField()
+    digest = models.CharField(max_length=40, unique=True)
+
+    def __str__(self):
+        return self.value
+
 
 class ActivityLog(models.Model):
     ACTION_CHOICES = [
@@ -16,27 +32,40 @@ class ActivityLog(models.Model):
         ('other', 'Other'),
     ]
 
+    # No database constraint so the log tables can live in their own
+    # database; signals.clear_deleted_user does the SET_NULL.
     user = models.ForeignKey(
         User,
         null=True,
         blank=True,
-        on_delete=models.SET_NULL,
-        related_name='activity_logs'
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='activity_logs',
+        db_index=False,
     )
-    action = models.CharField(max_length=32, choices=ACTION_CHOICES, default='other')
-    method = models.CharField(max_length=10, blank=True, default='')
+    action = CodedCharField(codes=ACTION_CODES, choices=ACTION_CHOICES, default='other')
+    method = CodedCharField(codes=METHOD_CODES, blank=True, default='')
     path = models.CharField(max_length=512, blank=True, default='')
-    ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True, default='')
+    ip_address = PackedIPField(null=True, blank=True)
+    user_agent = InternedTextField(table='monitoring.UserAgent', blank=True, default='')
     status_code = models.PositiveIntegerField(default=200)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     extra = models.JSONField(null=True, blank=True)
+    duration_ms = models.FloatField(null=True, blank=True)
+    db_queries = models.PositiveIntegerField(null=True, blank=True)
+    db_time_ms = models.FloatField(null=True, blank=True)
+    # Shared with the ErrorLog rows of the same request (see utils.get_request_id).
+    request_id = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
+        # Composite indexes match the list view filters so that keyset pages
+        # ordered by (timestamp, id) are served by a single index range.
         indexes = [
-            models.Index(fields=['timestamp']),
-            models.Index(fields=['action']),
-            models.Index(fields=['user']),
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['user', 'timestamp']),
+            models.Index(fields=['action', 'timestamp']),
+            models.Index(fields=['user', 'action', 'timestamp']),
+            models.Index(fields=['request_id', 'timestamp']),
         ]
         ordering = ['-timestamp']
 
@@ -45,26 +74,63 @@ class ActivityLog(models.Model):
         return f"[{self.timestamp:%Y-%m-%d %H:%M:%S}] {user_display} {self.action} {self.path}"
 
 
+class ErrorGroup(models.Model):
+    fingerprint = models.CharField(max_length=40, unique=True)
+    exception_type = models.CharField(max_length=255, blank=True, default='')
+    message = models.TextField(blank=True, default='')
+    endpoint = models.CharField(max_length=512, blank=True, default='')
+    status_code = models.PositiveIntegerField(null=True, blank=True)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+    count = models.PositiveBigIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_seen']),
+        ]
+        ordering = ['-last_seen']
+
+    def __str__(self):
+        short_message = (self.message[:57] + "...") if len(self.message) > 60 else self.message
+        return f"{self.exception_type or 'Error'} x{self.count} {self.endpoint}: {short_message}"
+
+
 class ErrorLog(models.Model):
     user = models.ForeignKey(
         User,
         null=True,
         blank=True,
-        on_delete=models.SET_NULL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
         related_name='error_logs'
     )
     message = models.TextField()
     stack_trace = models.TextField(blank=True, default='')
-    method = models.CharField(max_length=10, blank=True, default='')
+    method = CodedCharField(codes=METHOD_CODES, blank=True, default='')
     endpoint = models.CharField(max_length=512, blank=True, default='')
-    ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True, default='')
+    ip_address = PackedIPField(null=True, blank=True)
+    user_agent = InternedTextField(table='monitoring.UserAgent', blank=True, default='')
     status_code = models.PositiveIntegerField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    group = models.ForeignKey(
+        ErrorGroup,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='occurrences',
+        db_index=False,
+    )
+    # Repeats of the group that were counted but not stored since the
+    # previous stored occurrence, plus this one.
+    occurrences = models.PositiveIntegerField(default=1)
+    request_id = models.CharField(max_length=64, null=True, blank=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=['timestamp']),
+            models.Index(fields=['timestamp', 'id']),
+            models.Index(fields=['status_code', 'timestamp']),
+            models.Index(fields=['group', 'timestamp']),
+            models.Index(fields=['request_id', 'timestamp']),
         ]
         ordering = ['-timestamp']
 
@@ -72,3 +138,58 @@ class ErrorLog(models.Model):
         short_message = (self.message[:57] + "...") if len(self.message) > 60 else self.message
         return f"[{self.timestamp:%Y-%m-%d %H:%M:%S}] {short_message}"
 
+
+
+class ActivityRollup(models.Model):
+    GRANULARITY_CHOICES = [
+        ('minute', 'Minute'),
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    granularity = models.CharField(max_length=8, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    action = models.CharField(max_length=32)
+    status_class = models.PositiveSmallIntegerField()
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'action', 'status_class'],
+                name='activityrollup_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"[{self.granularity} {self.bucket:%Y-%m-%d %H:%M}] {self.action} {self.status_class}xx: {self.count}"
+
+
+class ErrorRollup(models.Model):
+    GRANULARITY_CHOICES = ActivityRollup.GRANULARITY_CHOICES
+
+    granularity = models.CharField(max_length=8, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    endpoint = models.CharField(max_length=512, blank=True, default='')
+    status_code = models.PositiveIntegerField(default=0)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'bucket', 'endpoint', 'status_code'],
+                name='errorrollup_unique_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"[{self.granularity} {self.bucket:%Y-%m-%d %H:%M}] {self.endpoint} {self.status_code}: {self.count}"
+
+
+class RollupCheckpoint(models.Model):
+    name = models.CharField(max_length=32, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
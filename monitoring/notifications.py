@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import mail_admins
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except Exception:
+    requests = None
+
+
+class _KeyState:
+    __slots__ = ('tokens', 'updated', 'pending', 'subject', 'text')
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.pending = 0
+        self.subject = ''
+        self.text = ''
+
+
+class NotificationDispatcher:
+    """Long-lived sender for critical alerts.
+
+    Each alert key (an error fingerprint, or the subject) has a token bucket
+    holding ``burst`` tokens that refills one token every ``window`` seconds.
+    Alerts that find the bucket empty are coalesced and sent as a single
+    "N more occurrences" message once a token is available again. Delivery
+    runs on a bounded pool of ``workers`` threads sharing one pooled HTTP
+    session, with at most ``max_queue`` deliveries outstanding, and webhook
+    posts are retried with exponential backoff.
+    """
+
+    def __init__(self, workers=2, max_queue=100, window=60.0, burst=1, retries=3,
+                 backoff=0.5, timeout=3.0, tick=1.0, max_keys=10000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.window = float(window)
+        self.burst = burst
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.tick = tick
+        self.max_keys = max_keys
+
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._keys = OrderedDict()
+        self._executor = None
+        self._session = None
+        self._ticker = None
+        self._inflight = 0
+        self._pid = os.getpid()
+
+        self.queued = 0
+        self.sent = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+
+    def notify(self, subject, text, key=None):
+        key = key or subject
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(key, now)
+            if state.tokens >= 1:
+                state.tokens -= 1
+                more, state.pending = state.pending, 0
+                return self._submit(subject, text, more)
+            state.pending += 1
+            state.subject, state.text = subject, text
+            self.suppressed += 1
+            self._ensure_ticker()
+            return False
+
+    def _state(self, key, now):
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyState(self.burst, now)
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        else:
+            self._keys.move_to_end(key)
+            if self.window > 0:
+                state.tokens = min(self.burst, state.tokens + (now - state.updated) / self.window)
+            else:
+                state.tokens = self.burst
+            state.updated = now
+        return state
+
+    def _submit(self, subject, text, more=0):
+        # Called with the lock held.
+        if more:
+            text = f'{text}\n\n({more} more occurrences since the last notification)'
+        if self._inflight >= self.max_queue:
+            self.dropped += 1
+            return False
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='notify')
+        self._inflight += 1
+        self.queued += 1
+        self._executor.submit(self._deliver, subject, text)
+        return True
+
+    def _ensure_ticker(self):
+        if self._ticker is None or not self._ticker.is_alive():
+            self._ticker = threading.Thread(target=self._tick_loop, name='notify-coalesce', daemon=True)
+            self._ticker.start()
+
+    def _tick_loop(self):
+        while True:
+            time.sleep(self.tick)
+            now = time.monotonic()
+            with self._lock:
+                waiting = False
+                for key in list(self._keys):
+                    state = self._keys[key]
+                    if not state.pending:
+                        continue
+                    self._state(key, now)
+                    if state.tokens >= 1:
+                        state.tokens -= 1
+                        more, state.pending = state.pending - 1, 0
+                        self._submit(state.subject, state.text, more)
+                    else:
+                        waiting = True
+                if not waiting:
+                    self._ticker = None
+                    return
+
+    def _http(self):
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    def _post(self, url, payload):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                resp = self._http().post(url, json=payload, timeout=self.timeout)
+            except requests.RequestException:
+                continue
+            if resp.status_code < 500 and resp.status_code != 429:
+                return resp.ok
+        return False
+
+    def _deliver(self, subject, text):
+        ok = True
+        try:
+            try:
+                mail_admins(subject, text, fail_silently=True)
+            except Exception:
+                ok = False
+            webhook = getattr(settings, 'SLACK_WEBHOOK_URL', '')
+            if webhook and requests:
+                ok = self._post(webhook, {'text': f'*{subject}*\n{text}'}) and ok
+        finally:
+            with self._lock:
+                self._inflight -= 1
+                if ok:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+                self._idle.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every queued delivery has finished."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queued': self.queued,
+                'inflight': self._inflight,
+                'sent': self.sent,
+                'suppressed': self.suppressed,
+                'coalescing': sum(1 for s in self._keys.values() if s.pending),
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'retried': self.retried,
+            }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher._pid != os.getpid():
+            _dispatcher = NotificationDispatcher(
+                workers=getattr(settings, 'NOTIFY_WORKERS', 2),
+                max_queue=getattr(settings, 'NOTIFY_MAX_QUEUE', 100),
+                window=getattr(settings, 'NOTIFY_WINDOW', 60.0),
+                burst=getattr(settings, 'NOTIFY_BURST', 1),
+                retries=getattr(settings, 'NOTIFY_RETRIES', 3),
+                backoff=getattr(settings, 'NOTIFY_BACKOFF', 0.5),
+            )
+        return _dispatcher
@@ -0,0 +1,157 @@
+import re
+import threading
+import zlib
+from fnmatch import translate
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import ACTION_CODES
+
+METHOD_ACTIONS = {
+    'POST': 'create',
+    'PUT': 'update',
+    'PATCH': 'update',
+    'DELETE': 'delete',
+}
+
+# Same actions the middleware used to infer from paths; everything is logged.
+DEFAULT_POLICY = [
+    {'route': 'login', 'action': 'login'},
+    {'route': 'logout', 'action': 'logout'},
+    {'route': 'me-profile', 'methods': ['PUT', 'PATCH'], 'action': 'profile_update'},
+]
+
+
+class Rule:
+    """One compiled policy entry; see ``LOG_ROUTE_POLICY`` in the settings."""
+    __slots__ = ('route', 'methods', 'action', 'sample_rate', 'always_log_errors', 'capture_body', '_match')
+
+    def __init__(self, route='*', methods=None, action=None, sample_rate=1.0,
+                 always_log_errors=True, capture_body=None):
+        self.route = route
+        self.methods = frozenset(m.upper() for m in methods) if methods else None
+        if action is not None and action not in ACTION_CODES:
+            raise ImproperlyConfigured(f'LOG_ROUTE_POLICY: unknown action {action!r} for route {route!r}')
+        self.action = action
+        self.sample_rate = float(sample_rate)
+        self.always_log_errors = always_log_errors
+        self.capture_body = capture_body
+        self._match = re.compile(translate(route)).match
+
+    def matches(self, route, method):
+        return (self.methods is None or method in self.methods) and self._match(route) is not None
+
+    def action_for(self, method):
+        return self.action or METHOD_ACTIONS.get(method, 'read')
+
+
+class RoutePolicy:
+    """Policy table compiled once and matched on the resolved URL name.
+
+    The first rule (in declaration order) whose route pattern and methods
+    match wins; a trailing catch-all keeps the old log-everything behaviour.
+    Lookups are cached per ``(url name, method)``, so steady-state matching
+    is one dict hit.
+    """
+
+    def __init__(self, rules, capture_body=False):
+        self.rules = [rule if isinstance(rule, Rule) else Rule(**rule) for rule in rules]
+        self.rules.append(Rule())
+        for rule in self.rules:
+            if rule.capture_body is None:
+                rule.capture_body = capture_body
+        self.captures_body = any(rule.capture_body for rule in self.rules)
+        self._cache = {}
+
+    def match(self, route, method):
+        key = (route, method)
+        rule = self._cache.get(key)
+        if rule is None:
+            rule = next(r for r in self.rules if r.matches(route, method))
+            if len(self._cache) < 4096:
+                self._cache[key] = rule
+        return rule
+
+    def for_request(self, request):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None and match.view_name else ''
+        return self.match(route, request.method.upper())
+
+
+def compile_policy():
+    return RoutePolicy(
+        getattr(settings, 'LOG_ROUTE_POLICY', DEFAULT_POLICY),
+        capture_body=getattr(settings, 'LOG_REQUEST_BODY', False),
+    )
+
+
+def unlogged(view):
+    """Mark ``view`` (a function or view class) so ``ActivityLoggingMiddleware``
+    keeps no row or rollup count for it."""
+    view.activity_log_exempt = True
+    return view
+
+
+def is_unlogged(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return False
+    return getattr(getattr(match.func, 'view_class', match.func), 'activity_log_exempt', False)
+
+
+def log_read(view):
+    """Mark ``view`` as a read of the logs themselves.
+
+    Its requests are logged like any other, but their rows do not start a
+    new cached-response version (see ``caching.invalidate``): otherwise
+    every poll of a cached log list would invalidate itself.
+    """
+    view.activity_log_read = True
+    return view
+
+
+def is_log_read(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return False
+    return getattr(getattr(match.func, 'view_class', match.func), 'activity_log_read', False)
+
+
+def sampled(request_id, rate):
+    """Head-based decision that every service seeing ``request_id`` agrees on."""
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return zlib.crc32(request_id.encode()) < rate * 0x100000000
+
+
+def is_error(status_code):
+    return not 200 <= status_code < 300
+
+
+class SamplingStats:
+    __slots__ = ('logged', 'forced', 'sampled_out', '_lock')
+
+    def __init__(self):
+        self.logged = 0
+        self.forced = 0
+        self.sampled_out = 0
+        self._lock = threading.Lock()
+
+    def count(self, kept, forced=False):
+        with self._lock:
+            if not kept:
+                self.sampled_out += 1
+            elif forced:
+                self.forced += 1
+            else:
+                self.logged += 1
+
+    def stats(self):
+        with self._lock:
+            return {'logged': self.logged, 'forced': self.forced, 'sampled_out': self.sampled_out}
+
+
+sampling = SamplingStats()
@@ -0,0 +1,294 @@
+import threading
+import time
+from collections import Counter
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import caching
+from .models import ActivityLog, ErrorLog, ActivityRollup, ErrorRollup, RollupCheckpoint
+
+GRANULARITIES = ('minute', 'hour', 'day')
+# Buckets per upsert statement, within SQLite's bound-parameter limit.
+ROWS_PER_STATEMENT = 500
+STEP = {
+    'minute': timedelta(minutes=1),
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+
+def truncate(value, granularity):
+    value = value.astimezone(dt_timezone.utc)
+    if granularity == 'minute':
+        return value.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def lag():
+    """Seconds a row must be old before ``refresh`` folds it in and moves the checkpoint past it."""
+    return getattr(settings, 'LOG_ROLLUP_LAG', 60.0)
+
+
+class _Rollup:
+    """Folds raw log rows past a checkpoint id into count buckets."""
+
+    def __init__(self, name, source, target, columns, dimensions, key, weight=None):
+        self.name = name
+        self.source = source
+        self.target = target
+        self.columns = columns
+        self.dimensions = dimensions
+        self.key = key
+        self.weight = weight or (lambda row: 1)
+
+    def counts(self, rows):
+        """``{(granularity, bucket, *dimensions): n}`` for source ``rows`` (``columns`` tuples)."""
+        counts = Counter()
+        for row in rows:
+            timestamp, dims, n = row[1], self.key(row), self.weight(row)
+            for granularity in GRANULARITIES:
+                counts[(granularity, truncate(timestamp, granularity)) + dims] += n
+        return counts
+
+    def apply(self, rows):
+        self._upsert(self.counts(rows))
+
+    def unfolded(self, limit):
+        """``counts`` of up to ``limit`` rows past the checkpoint, without writing anything.
+
+        Added to the rollups on read, so stats include rows the next refresh
+        will fold in.
+        """
+        return self.counts(
+            self.source.objects.filter(id__gt=self.last_id()).order_by('id').values_list(*self.columns)[:limit]
+        )
+
+    def add(self, counts):
+        """Add ``{(timestamp, *dimensions): n}`` counts that have no raw rows."""
+        buckets = Counter()
+        for key, n in counts.items():
+            for granularity in GRANULARITIES:
+                buckets[(granularity, truncate(key[0], granularity)) + key[1:]] += n
+        with transaction.atomic(using=self.target.objects.db):
+            self._upsert(buckets)
+            # The marker's updated_at bounds the newest such count, so a
+            # rebuild can tell whether it would drop any.
+            marker, created = RollupCheckpoint.objects.get_or_create(name=f'{self.name}:added')
+            if not created:
+                marker.save(update_fields=['updated_at'])
+
+    def added_since(self, since):
+        """Whether counts without raw rows may have been added for ``since`` or later."""
+        return RollupCheckpoint.objects.filter(name=f'{self.name}:added', updated_at__gte=since).exists()
+
+    def _upsert(self, counts):
+        connection = connections[self.target.objects.db]
+        if connection.features.supports_update_conflicts_with_target:
+            self._upsert_sql(connection, counts)
+            return
+
+        buckets = {key[1] for key in counts}
+        existing = {}
+        for rollup in self.target.objects.filter(bucket__in=buckets):
+            key = (rollup.granularity, rollup.bucket) + tuple(getattr(rollup, d) for d in self.dimensions)
+            existing[key] = rollup
+
+        changed, created = [], []
+        for key, n in counts.items():
+            rollup = existing.get(key)
+            if rollup is not None:
+                rollup.count += n
+                changed.append(rollup)
+            else:
+                fields = dict(zip(('granularity', 'bucket') + self.dimensions, key))
+                created.append(self.target(count=n, **fields))
+        if changed:
+            self.target.objects.bulk_update(changed, ['count'])
+        if created:
+            self.target.objects.bulk_create(created)
+
+    def _upsert_sql(self, connection, counts):
+        # INSERT .. ON CONFLICT DO UPDATE adds to existing buckets in the
+        # database itself: no read first, and none of bulk_update's CASE
+        # expressions, which get very slow once a chunk touches many buckets.
+        meta = self.target._meta
+        quote = connection.ops.quote_name
+        table = quote(meta.db_table)
+        key = ', '.join(quote(meta.get_field(f).column) for f in ('granularity', 'bucket') + self.dimensions)
+        count = quote(meta.get_field('count').column)
+        placeholder = f'({", ".join(["%s"] * (len(self.dimensions) + 3))})'
+        adapt = connection.ops.adapt_datetimefield_value
+        rows = [(k[0], adapt(k[1])) + k[2:] + (n,) for k, n in counts.items()]
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), ROWS_PER_STATEMENT):
+                batch = rows[start:start + ROWS_PER_STATEMENT]
+                cursor.execute(
+                    f'INSERT INTO {table} ({key}, {count}) VALUES {", ".join([placeholder] * len(batch))} '
+                    f'ON CONFLICT ({key}) DO UPDATE SET {count} = {table}.{count} + excluded.{count}',
+                    [value for row in batch for value in row],
+                )
+
+    def _claim(self):
+        """The checkpoint, locked for the current transaction."""
+        # select_for_update is a no-op on SQLite; writing first takes the
+        # database lock there, so a concurrent refresh waits instead of
+        # reading the same checkpoint and counting the rows twice.
+        RollupCheckpoint.objects.filter(name=self.name).update(updated_at=timezone.now())
+        checkpoint, _ = RollupCheckpoint.objects.select_for_update().get_or_create(name=self.name)
+        return checkpoint
+
+    def refresh(self, chunk_size=5000, max_rows=None, through_id=None):
+        """Fold rows past the checkpoint into the buckets; returns how many.
+
+        Rows are taken in id order, but concurrent writers can commit a lower
+        id after a higher one. So the checkpoint only moves past rows older
+        than ``lag()`` seconds, by when any row with a lower id is assumed
+        committed; it stops at the first newer row. Rows up to
+        ``through_id`` are folded regardless, for callers about to delete them.
+        """
+        processed = 0
+        while max_rows is None or processed < max_rows:
+            limit = chunk_size if max_rows is None else min(chunk_size, max_rows - processed)
+            with transaction.atomic(using=self.target.objects.db):
+                checkpoint = self._claim()
+                rows = list(
+                    self.source.objects.filter(id__gt=checkpoint.last_id)
+                    .order_by('id').values_list(*self.columns)[:limit]
+                )
+                horizon = timezone.now() - timedelta(seconds=lag())
+                fresh = next((i for i, row in enumerate(rows)
+                                if row[1] >= horizon and (through_id is None or row[0] > through_id)), None)
+                if fresh is not None:
+                    rows = rows[:fresh]
+                if not rows:
+                    break
+                self.apply(rows)
+                checkpoint.last_id = rows[-1][0]
+                checkpoint.save(update_fields=['last_id', 'updated_at'])
+            processed += len(rows)
+            if fresh is not None or len(rows) < limit:
+                break
+        return processed
+
+    def last_id(self):
+        return RollupCheckpoint.objects.filter(name=self.name).values_list('last_id', flat=True).first() or 0
+
+    def oldest_day(self):
+        """UTC midnight of the oldest stored row, or None when there are none."""
+        oldest = self.source.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        return None if oldest is None else truncate(oldest, 'day')
+
+    def rebuild(self, since, chunk_size=5000):
+        """Recount the buckets from ``since`` (a UTC midnight) out of the stored rows.
+
+        Rows past the checkpoint are left to ``refresh``. Counts with no
+        stored rows in the range (archived rows, sampled-out requests) would
+        be lost, so callers check ``added_since`` and the archive first.
+        """
+        processed = 0
+        with transaction.atomic(using=self.target.objects.db):
+            checkpoint = self._claim()
+            self.target.objects.filter(bucket__gte=since).delete()
+            rows = self.source.objects.filter(timestamp__gte=since, id__lte=checkpoint.last_id).order_by('id')
+            last_id = 0
+            while True:
+                chunk = list(rows.filter(id__gt=last_id).values_list(*self.columns)[:chunk_size])
+                if not chunk:
+                    break
+                self.apply(chunk)
+                processed += len(chunk)
+                last_id = chunk[-1][0]
+        return processed
+
+
+activity = _Rollup(
+    'activity', ActivityLog, ActivityRollup,
+    columns=('id', 'timestamp', 'action', 'status_code'),
+    dimensions=('action', 'status_class'),
+    key=lambda row: (row[2], row[3] // 100),
+)
+errors = _Rollup(
+    'error', ErrorLog, ErrorRollup,
+    columns=('id', 'timestamp', 'endpoint', 'status_code', 'occurrences'),
+    dimensions=('endpoint', 'status_code'),
+    key=lambda row: (row[2], row[3] or 0),
+    # Sampled-out repeats are carried by the next stored occurrence.
+    weight=lambda row: row[4],
+)
+ROLLUPS = (activity, errors)
+
+
+class PendingCounts:
+    """Activity counts for requests that were sampled out and never stored.
+
+    Kept per process by minute, action and status class, and added to the
+    activity rollups by ``flush_pending`` so stats still count every request.
+    """
+
+    def __init__(self, interval=10.0):
+        self.interval = interval
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def add(self, timestamp, action, status_code):
+        key = (truncate(timestamp, 'minute'), action, status_code // 100)
+        with self._lock:
+            self._counts[key] += 1
+
+    def due(self):
+        return bool(self._counts) and time.monotonic() - self._flushed >= self.interval
+
+    def drain(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed = time.monotonic()
+        return counts
+
+    def restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+
+    def total(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+
+pending = PendingCounts(interval=getattr(settings, 'LOG_SAMPLING_FLUSH_INTERVAL', 10.0))
+
+
+def flush_pending():
+    counts = pending.drain()
+    if not counts:
+        return 0
+    try:
+        activity.add(counts)
+    except Exception:
+        pending.restore(counts)
+        raise
+    # Sampled-out requests show up in the stats from here on.
+    caching.invalidate(ActivityLog)
+    return sum(counts.values())
+
+
+def for_source(model):
+    return next((rollup for rollup in ROLLUPS if rollup.source is model), None)
+
+
+def ensure_counted(model, last_id):
+    """Fold ``model``'s rows up to ``last_id`` into its rollup if not done yet, e.g. before deleting them."""
+    rollup = for_source(model)
+    if rollup is not None and rollup.last_id() < last_id:
+        rollup.refresh(through_id=last_id)
+
+
+def refresh(chunk_size=5000, max_rows=None, pending=True):
+    """Fold new rows into the rollups; with ``pending``, sampled-out counts too."""
+    if pending:
+        flush_pending()
+    return {rollup.name: rollup.refresh(chunk_size, max_rows) for rollup in ROLLUPS}
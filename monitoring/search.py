@@ -0,0 +1,172 @@
+import re
+from contextlib import contextmanager
+
+from django.db import connections, router
+
+from .models import ActivityLog, ErrorLog
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+MAX_TOKENS = 16
+
+
+def tokens(q):
+    return _TOKEN.findall((q or '').lower())[:MAX_TOKENS]
+
+
+class SearchIndex:
+    """Full-text index over some text columns of a log table.
+
+    On SQLite this is an external-content FTS5 table kept in sync by triggers,
+    so buffered ``bulk_create`` writes and retention deletes are covered too.
+    On PostgreSQL it is a GIN index on the columns' ``tsvector``.
+    """
+
+    def __init__(self, model, columns):
+        self.model = model
+        self.columns = columns
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def fts_table(self):
+        return f'{self.table}_fts'
+
+    def _document(self):
+        return " || ' ' || ".join(f"coalesce({c}, '')" for c in self.columns)
+
+    def install(self, using='default'):
+        if not router.allow_migrate_model(using, self.model):
+            return
+        connection = connections[using]
+        # post_migrate also fires for partial runs (`migrate auth`, or a
+        # migration target before the log tables exist).
+        if self.table not in connection.introspection.table_names():
+            return
+        if connection.vendor == 'sqlite':
+            self._install_sqlite(connection)
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self.table}_search ON {self.table} "
+                    f"USING GIN (to_tsvector('simple', {self._document()}))"
+                )
+
+    def _install_sqlite(self, connection):
+        fts, table = self.fts_table, self.table
+        cols = ', '.join(self.columns)
+        new = ', '.join(f'new.{c}' for c in self.columns)
+        old = ', '.join(f'old.{c}' for c in self.columns)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [fts])
+            created = cursor.fetchone() is None
+            if created:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id')"
+                )
+            # A row in the _defer table (only visible inside the bulk writer's
+            # transaction) switches the per-row insert trigger off; see deferred().
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS {fts}_defer (id INTEGER PRIMARY KEY)")
+            cursor.execute(f"DROP TRIGGER IF EXISTS {fts}_ai")
+            cursor.execute(
+                f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} "
+                f"WHEN NOT EXISTS (SELECT 1 FROM {fts}_defer) BEGIN "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+            )
+            cursor.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN "
+                f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END"
+            )
+            if created:
+                # Index rows that predate the index.
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    @contextmanager
+    def deferred(self, using=None):
+        """Index rows inserted in the block with one statement at the end.
+
+        Must run inside a transaction. On SQLite the per-row trigger is
+        paused for this transaction only and the new rows (ids past the
+        current maximum) are indexed set-wise on exit, which is several times
+        faster for bulk inserts. Other backends need nothing.
+        """
+        connection = connections[using or router.db_for_write(self.model)]
+        if connection.vendor != 'sqlite':
+            yield
+            return
+        if not connection.in_atomic_block:
+            raise RuntimeError('SearchIndex.deferred() must be used inside transaction.atomic().')
+        fts, table = self.fts_table, self.table
+        cols = ', '.join(self.columns)
+        with connection.cursor() as cursor:
+            # Writing first takes the write lock, so no other rows get ids in between.
+            cursor.execute(f"INSERT INTO {fts}_defer (id) VALUES (1)")
+            cursor.execute(f"SELECT coalesce(max(id), 0) FROM {table}")
+            last_id = cursor.fetchone()[0]
+        yield
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {fts}(rowid, {cols}) SELECT id, {cols} FROM {table} WHERE id > %s", [last_id]
+            )
+            cursor.execute(f"DELETE FROM {fts}_defer")
+
+    def filter(self, queryset, q, rank=True):
+        """Restrict ``queryset`` to rows matching every word of ``q``.
+
+        With ``rank``, rows get a ``search_rank`` (lower is better) and are
+        ordered by it, newest first among equals.
+        """
+        words = tokens(q)
+        if not words:
+            return queryset
+        vendor = connections[queryset.db].vendor
+        if vendor == 'sqlite':
+            match = ' '.join('"%s"' % w for w in words)
+            qs = queryset.extra(
+                tables=[self.fts_table],
+                where=[f'{self.fts_table}.rowid = {self.table}.id', f'{self.fts_table} MATCH %s'],
+                params=[match],
+                select={'search_rank': f'{self.fts_table}.rank'} if rank else None,
+            )
+        elif vendor == 'postgresql':
+            vector = f"to_tsvector('simple', {self._document()})"
+            query = "plainto_tsquery('simple', %s)"
+            text = ' '.join(words)
+            qs = queryset.extra(
+                where=[f'{vector} @@ {query}'], params=[text],
+                select={'search_rank': f'-ts_rank({vector}, {query})'} if rank else None,
+                select_params=[text] if rank else None,
+            )
+        else:
+            qs = queryset
+            for word in words:
+                condition = None
+                for column in self.columns:
+                    term = self.model.objects.filter(**{f'{column}__icontains': word})
+                    condition = term if condition is None else condition | term
+                qs = qs.filter(id__in=condition.values('id'))
+            return qs
+        return qs.order_by('search_rank', '-timestamp', '-id') if rank else qs
+
+    def matches(self, row, q):
+        """Whether an archived (API-shaped) row contains every word of ``q``."""
+        words = tokens(q)
+        text = ' '.join(str(row.get(c) or '') for c in self.columns).lower()
+        found = set(tokens(text))
+        return all(w in found for w in words)
+
+
+activity = SearchIndex(ActivityLog, ('path',))
+errors = SearchIndex(ErrorLog, ('message', 'endpoint', 'stack_trace'))
+INDEXES = (activity, errors)
+
+
+def install(using='default', **kwargs):
+    for index in INDEXES:
+        index.install(using)
@@ -0,0 +1,293 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import Max, Min
+
+from . import fingerprints, search
+from .ingest import ActivityIngest, BulkInsert
+from .models import ACTION_CODES, METHOD_CODES, ActivityLog, ErrorGroup, ErrorLog
+
+DEFAULT_ACTIONS = {'read': 70, 'create': 9, 'update': 7, 'delete': 2, 'login': 5, 'logout': 4,
+                   'profile_update': 1, 'other': 2}
+DEFAULT_STATUSES = {200: 82, 201: 7, 204: 2, 302: 1, 400: 3, 401: 2, 403: 1, 404: 1.5, 500: 0.5}
+DEFAULT_ERROR_STATUSES = {500: 85, 502: 4, 503: 7, 504: 4}
+ACTION_METHODS = {'read': 'GET', 'create': 'POST', 'update': 'PATCH', 'delete': 'DELETE', 'login': 'POST',
+                  'logout': 'POST', 'profile_update': 'PATCH', 'other': 'GET'}
+RESOURCES = ('items', 'orders', 'invoices', 'customers', 'products', 'payments', 'shipments', 'reports')
+EXCEPTIONS = ('KeyError', 'ValueError', 'TypeError', 'AttributeError', 'IntegrityError', 'TimeoutError',
+              'PermissionDenied', 'ConnectionError')
+USER_AGENTS = [
+    f'Mozilla/5.0 ({platform}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{version}.0.0.0 Safari/537.36'
+    for platform in ('Windows NT 10.0; Win64; x64', 'Macintosh; Intel Mac OS X 10_15_7', 'X11; Linux x86_64')
+    for version in range(110, 130)
+] + ['python-requests/2.32.3', 'curl/8.5.0', 'okhttp/4.12.0', 'PostmanRuntime/7.39.0']
+IP_POOL = 4096
+USERNAME = 'seed-user-{:05d}'
+
+ERROR_COLUMNS = ('user_id', 'message', 'stack_trace', 'method', 'endpoint', 'ip_address', 'user_agent',
+                 'status_code', 'timestamp', 'group_id', 'occurrences')
+
+
+def parse_weights(text, cast=str):
+    """``'read=70,create=10'`` to ``{'read': 70.0, 'create': 10.0}``; raises ValueError."""
+    weights = {}
+    for part in text.split(','):
+        key, sep, weight = part.partition('=')
+        if not sep:
+            raise ValueError(f'expected key=weight, got {part!r}')
+        weights[cast(key.strip())] = float(weight)
+    if not weights or any(w < 0 for w in weights.values()) or not sum(weights.values()):
+        raise ValueError('weights must be non-negative and not all zero')
+    return weights
+
+
+def zipf(n, skew):
+    """Weights of a Zipf-like distribution: a few hot values and a long tail."""
+    return [1 / (rank + 1) ** skew for rank in range(n)]
+
+
+class Distribution:
+    """Weighted values, drawn a whole column at a time."""
+
+    def __init__(self, values, weights):
+        self.values = list(values)
+        self.cum_weights = list(accumulate(weights))
+
+    def draw(self, rng, k):
+        return rng.choices(self.values, cum_weights=self.cum_weights, k=k)
+
+
+def _datetime_param(connection):
+    """Naive UTC datetime to the insert parameter the backend expects."""
+    if connection.vendor == 'sqlite':
+        # What adapt_datetimefield_value returns, without its per-value checks.
+        return str
+    adapt = connection.ops.adapt_datetimefield_value
+    return lambda value: adapt(value.replace(tzinfo=dt_timezone.utc))
+
+
+@contextmanager
+def deferred_indexes(model, using):
+    """Drop ``model``'s ``Meta.indexes`` for the block and build them once afterwards."""
+    connection = connections[using]
+    indexes = list(model._meta.indexes)
+    with connection.schema_editor() as editor:
+        for index in indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for index in indexes:
+                editor.add_index(model, index)
+
+
+class LogSeeder:
+    """Generates synthetic activity and error rows and inserts them in bulk.
+
+    Rows are spread evenly over ``[start, end)``: each chunk covers the next
+    slice of the span with sorted timestamps, so ids grow with time as they
+    do for real traffic. Columns are drawn a chunk at a time from the
+    configured distributions (Zipf over ``users``, ``paths`` and
+    ``fingerprints``, weights for actions and status codes) and written with
+    multi-row INSERTs, one transaction per chunk. The same ``seed`` and
+    options always produce the same rows.
+    """
+
+    def __init__(self, start, end, seed=0, users=100, anonymous=0.2, paths=500, fingerprints=50, skew=1.1,
+                 actions=None, statuses=None, error_statuses=None, chunk_size=10000):
+        actions = actions or DEFAULT_ACTIONS
+        unknown = set(actions) - set(ACTION_CODES)
+        if unknown:
+            raise ValueError(f'unknown actions: {", ".join(sorted(unknown))}')
+        statuses = statuses or DEFAULT_STATUSES
+        error_statuses = error_statuses or DEFAULT_ERROR_STATUSES
+        for code in (*statuses, *error_statuses):
+            if not 100 <= code <= 599:
+                raise ValueError(f'invalid status code {code}')
+        if start >= end:
+            raise ValueError('start must be before end')
+
+        self.start = start.astimezone(dt_timezone.utc).replace(tzinfo=None)
+        self.span = (end - start).total_seconds()
+        self.seed = seed
+        self.users = users
+        self.anonymous = anonymous
+        self.paths = [f'/api/{RESOURCES[i % len(RESOURCES)]}/{i // len(RESOURCES) + 1}/' for i in range(paths)]
+        self.fingerprints = fingerprints
+        self.skew = skew
+        self.chunk_size = chunk_size
+        self.actions = Distribution(
+            [(ACTION_CODES.index(a), METHOD_CODES.index(ACTION_METHODS[a])) for a in actions], actions.values()
+        )
+        self.statuses = Distribution(statuses, statuses.values())
+        self.error_statuses = Distribution(error_statuses, error_statuses.values())
+
+    def rng(self, name):
+        # String seeds are hashed deterministically, unlike hash() of a tuple.
+        return random.Random(f'{self.seed}:{name}')
+
+    def user_ids(self):
+        """Ids of the seed users (created when missing), most active first."""
+        User = get_user_model()
+        names = [USERNAME.format(i) for i in range(self.users)]
+        User.objects.bulk_create([User(username=name, password='!') for name in names], ignore_conflicts=True)
+        ids = dict(User.objects.filter(username__in=names).values_list('username', 'pk'))
+        return [ids[name] for name in names]
+
+    def _dimensions(self, model, using):
+        """Distributions over users, paths, IPs and user agents, shared by both tables."""
+        connection = connections[using]
+        users = self.user_ids()
+        weights = zipf(len(users), self.skew)
+        if self.anonymous >= 1 or not users:
+            weights, anonymous = [0] * len(users), 1
+        else:
+            # Anonymous rows make up ``anonymous`` of the total, whatever the skew.
+            anonymous = self.anonymous * sum(weights) / (1 - self.anonymous)
+        ip_field = model._meta.get_field('ip_address')
+        interner = model._meta.get_field('user_agent').interner
+        interner.intern_many(USER_AGENTS)
+        return {
+            'user': Distribution(users + [None], weights + [anonymous]),
+            'path': Distribution(self.paths, zipf(len(self.paths), self.skew)),
+            'ip': Distribution(
+                [connection.Database.Binary(ip_field.get_prep_value(f'10.{i >> 8 & 255}.{i & 255}.{i % 7 + 1}'))
+                 for i in range(IP_POOL)],
+                zipf(IP_POOL, 0.8),
+            ),
+            'user_agent': Distribution([interner.id_for(ua) for ua in USER_AGENTS], zipf(len(USER_AGENTS), 1.0)),
+        }
+
+    def _timestamps(self, rng, first, n, total, to_param):
+        # Row ``first`` of ``total`` starts this chunk's slice of the span.
+        low = self.span * first / total
+        width = self.span * n / total
+        start = self.start
+        return [to_param(start + timedelta(seconds=low + width * u)) for u in sorted(rng.random() for _ in range(n))]
+
+    def _insert(self, bulk, index, rows):
+        with transaction.atomic(using=bulk.using):
+            with index.deferred(bulk.using):
+                bulk.execute(rows)
+
+    def activity(self, total, using=None, progress=None):
+        using = using or router.db_for_write(ActivityLog)
+        bulk = BulkInsert(ActivityLog, ActivityIngest.columns, using)
+        dims = self._dimensions(ActivityLog, using)
+        to_param = _datetime_param(bulk.connection)
+        rng = self.rng('activity')
+        done = 0
+        while done < total:
+            n = min(self.chunk_size, total - done)
+            actions = self.actions.draw(rng, n)
+            durations = [round(rng.lognormvariate(3.0, 0.8), 3) for _ in range(n)]
+            queries = rng.choices(range(13), cum_weights=list(accumulate(zipf(13, 0.7))), k=n)
+            rows = list(zip(
+                dims['user'].draw(rng, n),
+                [a for a, _ in actions],
+                [m for _, m in actions],
+                dims['path'].draw(rng, n),
+                dims['ip'].draw(rng, n),
+                dims['user_agent'].draw(rng, n),
+                self.statuses.draw(rng, n),
+                self._timestamps(rng, done, n, total, to_param),
+                [None] * n,
+                durations,
+                queries,
+                [round(d * rng.random() * 0.5, 3) for d in durations],
+                [None] * n,
+            ))
+            self._insert(bulk, search.activity, rows)
+            done += n
+            if progress:
+                progress(done)
+        return done
+
+    def groups(self, using):
+        """One ``ErrorGroup`` per fingerprint: its id and the values its rows share."""
+        rng = self.rng('groups')
+        specs = []
+        for i in range(self.fingerprints):
+            exc = EXCEPTIONS[i % len(EXCEPTIONS)]
+            endpoint = self.paths[rng.randrange(len(self.paths))]
+            message = f'{exc}: synthetic failure {i} while handling {endpoint}'
+            stack_trace = (
+                'Traceback (most recent call last):\n'
+                f'  File "/app/{RESOURCES[i % len(RESOURCES)]}/views.py", line {40 + i}, in handler_{i}\n'
+                f'    return service.run(request)\n'
+                f'  File "/app/{RESOURCES[i % len(RESOURCES)]}/services.py", line {100 + i}, in run_{i}\n'
+                f'    raise {exc}(detail)\n'
+                f'{message}'
+            )
+            fingerprint, exc_type = fingerprints.compute(message, endpoint, stack_trace=stack_trace)
+            status = self.error_statuses.draw(rng, 1)[0]
+            specs.append((fingerprint, exc_type, message, endpoint, status, stack_trace))
+        existing = dict(ErrorGroup.objects.using(using).filter(fingerprint__in=[s[0] for s in specs])
+                        .values_list('fingerprint', 'pk'))
+        ErrorGroup.objects.using(using).bulk_create([
+            ErrorGroup(fingerprint=fp, exception_type=exc, message=message, endpoint=endpoint, status_code=status,
+                       count=0)
+            for fp, exc, message, endpoint, status, _ in specs if fp not in existing
+        ])
+        ids = dict(ErrorGroup.objects.using(using).filter(fingerprint__in=[s[0] for s in specs])
+                   .values_list('fingerprint', 'pk'))
+        return [(ids[fp], message, stack_trace, endpoint, status)
+                for fp, _, message, endpoint, status, stack_trace in specs]
+
+    def errors(self, total, using=None, progress=None):
+        using = using or router.db_for_write(ErrorLog)
+        bulk = BulkInsert(ErrorLog, ERROR_COLUMNS, using)
+        dims = self._dimensions(ErrorLog, using)
+        to_param = _datetime_param(bulk.connection)
+        groups = self.groups(using)
+        group_dist = Distribution(groups, zipf(len(groups), self.skew))
+        methods = Distribution([METHOD_CODES.index(m) for m in ('GET', 'POST', 'PATCH', 'DELETE')], [6, 2, 1, 1])
+        rng = self.rng('errors')
+        counts = {}
+        done = 0
+        while done < total:
+            n = min(self.chunk_size, total - done)
+            picked = group_dist.draw(rng, n)
+            timestamps = self._timestamps(rng, done, n, total, to_param)
+            rows = list(zip(
+                dims['user'].draw(rng, n),
+                [g[1] for g in picked],
+                [g[2] for g in picked],
+                methods.draw(rng, n),
+                [g[3] for g in picked],
+                dims['ip'].draw(rng, n),
+                dims['user_agent'].draw(rng, n),
+                [g[4] for g in picked],
+                timestamps,
+                [g[0] for g in picked],
+                [1] * n,
+            ))
+            self._insert(bulk, search.errors, rows)
+            for group in picked:
+                counts[group[0]] = counts.get(group[0], 0) + 1
+            done += n
+            if progress:
+                progress(done)
+        self._update_groups(counts, using)
+        return done
+
+    def _update_groups(self, counts, using):
+        # first_seen/last_seen straight from the rows, which may predate this run.
+        queryset = ErrorGroup.objects.using(using).filter(pk__in=counts)
+        seen = {
+            row['group']: row
+            for row in ErrorLog.objects.using(using).filter(group__in=counts).values('group')
+            .annotate(first=Min('timestamp'), last=Max('timestamp'))
+        }
+        groups = list(queryset)
+        for group in groups:
+            group.count += counts[group.pk]
+            group.first_seen = seen[group.pk]['first']
+            group.last_seen = seen[group.pk]['last']
+        ErrorGroup.objects.using(using).bulk_update(groups, ['count', 'first_seen', 'last_seen'])
+
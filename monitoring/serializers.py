@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import ActivityLog, ErrorLog
+from .models import ActivityLog, ErrorLog, ErrorGroup
 
 User = get_user_model()
 
@@ -18,10 +18,15 @@ class ActivityLogSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
         model = ActivityLog
-        fields = ['id','timestamp','user','action','method','path','ip_address','user_agent','status_code','extra']
+        fields = ['id','timestamp','user','action','method','path','ip_address','user_agent','status_code','extra','duration_ms','db_queries','db_time_ms','request_id']
 
 class ErrorLogSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     class Meta:
         model = ErrorLog
-        fields = ['id','timestamp','user','message','stack_trace','method','endpoint','ip_address','user_agent','status_code']
+        fields = ['id','timestamp','user','message','stack_trace','method','endpoint','ip_address','user_agent','status_code','group','occurrences','request_id']
+
+class ErrorGroupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ErrorGroup
+        fields = ['id','fingerprint','exception_type','message','endpoint','status_code','first_seen','last_seen','count']
@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import pre_delete
 from django.dispatch import receiver
+from .models import ActivityLog, ErrorLog
 from .utils import log_activity
 
 @receiver(user_logged_in)
@@ -11,3 +14,9 @@ def on_login(sender, request, user, **kwargs):
 def on_logout(sender, request, user, **kwargs):
     if request:
         log_activity(request, action='logout', status_code=200)
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def clear_deleted_user(sender, instance, **kwargs):
+    # Log rows may be in another database, out of reach of on_delete.
+    for model in (ActivityLog, ErrorLog):
+        model.objects.filter(user_id=instance.pk).update(user=None)
@@ -0,0 +1,242 @@
+import asyncio
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .exports import ACTIVITY_EXPORT, ERROR_EXPORT
+from .models import ActivityLog, ErrorLog
+from .serializers import ActivityLogSerializer, ErrorLogSerializer
+
+KINDS = {
+    ActivityLog: ('activity', ActivityLogSerializer),
+    ErrorLog: ('error', ErrorLogSerializer),
+}
+MODELS = {kind: model for model, (kind, _) in KINDS.items()}
+FILTERS = ('user_id', 'action', 'status_code')
+
+_dumps = DjangoJSONEncoder(separators=(',', ':')).encode
+
+
+def event(kind, row):
+    return f"id: {row['id']}\nevent: {kind}\ndata: {_dumps(row)}\n\n"
+
+
+def control(name, **data):
+    return f'event: {name}\ndata: {_dumps(data)}\n\n'
+
+
+class Subscriber:
+    """One tail connection: its filters and a bounded buffer of pending rows.
+
+    Publishers append from any thread. A subscriber whose buffer is full is
+    closed with ``overflowed`` set rather than slowing the writers down;
+    the client reconnects with its last seen id.
+    """
+
+    def __init__(self, kind, filters=None, max_buffer=1000, loop=None):
+        self.kind = kind
+        self.filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        self.max_buffer = max_buffer
+        self.overflowed = False
+        self.closed = False
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._event = asyncio.Event() if loop is not None else threading.Event()
+
+    def matches(self, record):
+        for name, value in self.filters.items():
+            if getattr(record, name, None) != value:
+                return False
+        return True
+
+    def offer(self, rows):
+        """Queue ``rows``; returns False once the subscriber is closed."""
+        with self._lock:
+            if self.closed:
+                return False
+            if len(self._buffer) + len(rows) > self.max_buffer:
+                self.overflowed = self.closed = True
+                self._buffer.clear()
+            else:
+                self._buffer.extend(rows)
+        self._wake()
+        return not self.closed
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+        self._wake()
+
+    def _wake(self):
+        if self._loop is None:
+            self._event.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def _drain(self):
+        with self._lock:
+            rows = list(self._buffer)
+            self._buffer.clear()
+            self._event.clear()
+        return rows
+
+    async def get(self, timeout):
+        """Pending rows, or ``[]`` after ``timeout`` seconds without any."""
+        if not self._buffer and not self.closed:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._drain()
+
+    def get_sync(self, timeout):
+        if not self._buffer and not self.closed:
+            self._event.wait(timeout)
+        return self._drain()
+
+
+class Broker:
+    """In-process fan-out of newly written log rows to tail subscribers.
+
+    Rows are serialized once per publish, and only when someone is
+    subscribed to that kind, so writes pay nothing while nobody tails.
+    Each process only sees the rows it wrote itself.
+    """
+
+    def __init__(self):
+        self._subscribers = {kind: set() for kind in MODELS}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.disconnected = 0
+
+    def subscribe(self, kind, filters=None, max_buffer=None, loop=None):
+        if max_buffer is None:
+            max_buffer = getattr(settings, 'LOG_TAIL_BUFFER', 1000)
+        subscriber = Subscriber(kind, filters, max_buffer, loop)
+        with self._lock:
+            self._subscribers[kind].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            self._subscribers[subscriber.kind].discard(subscriber)
+
+    def publish(self, model, records):
+        entry = KINDS.get(model)
+        if entry is None or not self._subscribers[entry[0]]:
+            return
+        kind, serializer = entry
+        with self._lock:
+            subscribers = list(self._subscribers[kind])
+        rows = None
+        for subscriber in subscribers:
+            matching = [r for r in records if r.pk is not None and subscriber.matches(r)]
+            if not matching:
+                continue
+            if rows is None:
+                rows = {r.pk: serializer(r).data for r in records if r.pk is not None}
+            if not subscriber.offer([rows[r.pk] for r in matching]):
+                self.unsubscribe(subscriber)
+                if subscriber.overflowed:
+                    self.disconnected += 1
+        if rows:
+            self.published += len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': {kind: len(subs) for kind, subs in self._subscribers.items()},
+                'published': self.published,
+                'disconnected': self.disconnected,
+            }
+
+
+broker = Broker()
+
+
+def publish(model, records):
+    try:
+        broker.publish(model, records)
+    except Exception:
+        # Tail delivery must never fail a log write.
+        pass
+
+
+class Stream:
+    """The SSE body for one subscriber, optionally replaying rows after ``last_id`` first."""
+
+    def __init__(self, subscriber, queryset=None, last_id=None, heartbeat=None, replay_limit=None):
+        self.subscriber = subscriber
+        self.queryset = queryset
+        self.last_id = last_id
+        self.heartbeat = heartbeat or getattr(settings, 'LOG_TAIL_HEARTBEAT', 15.0)
+        self.replay_limit = replay_limit or getattr(settings, 'LOG_TAIL_REPLAY_LIMIT', 1000)
+        # Live rows at or below the last replayed id were already sent.
+        self.replayed_through = last_id or 0
+
+    def replay(self):
+        if self.last_id is None:
+            return []
+        row_format = (ACTIVITY_EXPORT if self.subscriber.kind == 'activity' else ERROR_EXPORT).row_format
+        rows = list(row_format.rows(self.queryset.filter(id__gt=self.last_id).order_by('id')[:self.replay_limit + 1]))
+        chunks = []
+        for row in rows[:self.replay_limit]:
+            chunks.append(event(self.subscriber.kind, row))
+            self.replayed_through = row['id']
+        if len(rows) > self.replay_limit:
+            # Too far behind to catch up here; the rest is in the list API.
+            chunks.append(control('truncated', last_id=self.replayed_through))
+        return chunks
+
+    def render(self, rows):
+        kind = self.subscriber.kind
+        return ''.join(event(kind, row) for row in rows if row['id'] > self.replayed_through)
+
+    def finish(self):
+        if self.subscriber.overflowed:
+            return control('overflow', detail='Subscriber fell too far behind.')
+        return ''
+
+    async def __aiter__(self):
+        try:
+            yield 'retry: 3000\n\n'
+            for chunk in await sync_to_async(self.replay)():
+                yield chunk
+            while not self.subscriber.closed:
+                rows = await self.subscriber.get(self.heartbeat)
+                yield self.render(rows) if rows else ': keep-alive\n\n'
+            yield self.finish()
+        finally:
+            broker.unsubscribe(self.subscriber)
+
+    def __iter__(self):
+        try:
+            yield 'retry: 3000\n\n'
+            yield from self.replay()
+            while not self.subscriber.closed:
+                rows = self.subscriber.get_sync(self.heartbeat)
+                yield self.render(rows) if rows else ': keep-alive\n\n'
+            yield self.finish()
+        finally:
+            broker.unsubscribe(self.subscriber)
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    """Streams ``stream`` asynchronously under ASGI, from a worker thread under WSGI."""
+
+    def __init__(self, stream, is_async):
+        super().__init__(stream.__aiter__() if is_async else iter(stream), content_type='text/event-stream')
+        self.subscriber = stream.subscriber
+        self['Cache-Control'] = 'no-cache'
+        self['X-Accel-Buffering'] = 'no'
+
+    def close(self):
+        # The server calls this when the client goes away, even mid-stream.
+        broker.unsubscribe(self.subscriber)
+        super().close()
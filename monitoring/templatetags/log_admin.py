@@ -0,0 +1,12 @@
+from django import template
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+
+from ..admin import RollupDates, performance_mode
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def rollup_date_hierarchy(cl):
+    """Django's ``date_hierarchy`` with its choices read from the rollups in performance mode."""
+    return date_hierarchy(RollupDates(cl) if performance_mode() else cl)
@@ -1,6 +1,69 @@
-from django.urls import reverse
-from django.contrib.auth.models import User
-from rest_framework.test import APITestCase
+import asyncio
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.utils.timezone import now, override as override_timezone
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from itertools import combinations
+from unittest import mock
+from django.conf import settings
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.core import mail
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.urls import path, reverse
+from django.contrib.auth.models import AnonymousUser, User
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .buffer import BufferedLogWriter
+from .middleware import ActivityLoggingMiddleware
+from . import (anomaly, archive, caching, capture, db, exports, fingerprints, latency, metrics, policy, rollups, search, tail,
+               utils)
+from .models import ActivityLog, ErrorLog, ErrorGroup, ActivityRollup, ErrorRollup, RollupCheckpoint, UserAgent
+from .notifications import NotificationDispatcher, get_dispatcher
+from .pagination import KeysetPagination
+from .serializers import ActivityLogSerializer, ErrorLogSerializer
+from .views import ActivityLogListView, ErrorLogListView, Item
+
+
+def broken_view(request):
+    raise RuntimeError('boom')
+
+
+urlpatterns = [
+    path('broken', broken_view),
+]
+
+# Tests write log rows straight through the ORM, which does not invalidate
+# cached responses; ResponseCacheTest turns the cache back on.
+_response_cache_off = override_settings(LOG_CACHE_TIMEOUT=0)
+
+
+def setUpModule():
+    _response_cache_off.enable()
+
+
+def tearDownModule():
+    _response_cache_off.disable()
 
 class SmokeTest(APITestCase):
     def setUp(self):
@@ -27,3 +90,1666 @@ class SmokeTest(APITestCase):
         self.auth('admin', 'pass')
         resp = self.client.get(reverse('activity-logs'))
         self.assertIn(resp.status_code, [200, 204])
+
+
+class BufferedLogWriterTest(TestCase):
+    def make_log(self, path='/api/x'):
+        return ActivityLog(action='read', method='GET', path=path)
+
+    @override_settings(LOG_ROLLUP_LAG=0)
+    def test_flush_writes_batches(self):
+        writer = BufferedLogWriter(ActivityLog, max_size=10, batch_size=3)
+        for i in range(5):
+            self.assertTrue(writer.submit(self.make_log(f'/api/{i}')))
+        writer.flush()
+        self.assertEqual(ActivityLog.objects.count(), 5)
+        self.assertEqual(writer.stats(), {'queued': 0, 'enqueued': 5, 'flushed': 5, 'dropped': 0, 'failed': 0})
+        # Flushed rows past the lag window are folded into the rollups right away.
+        self.assertEqual(ActivityRollup.objects.get(granularity='day').count, 5)
+
+    def test_drop_oldest_policy(self):
+        writer = BufferedLogWriter(ActivityLog, max_size=2, policy='drop_oldest')
+        for i in range(3):
+            writer.submit(self.make_log(f'/api/{i}'))
+        writer.flush()
+        self.assertEqual(sorted(ActivityLog.objects.values_list('path', flat=True)), ['/api/1', '/api/2'])
+        self.assertEqual(writer.stats()['dropped'], 1)
+
+    def test_full_queue_rejects_without_worker(self):
+        writer = BufferedLogWriter(ActivityLog, max_size=1, policy='block', block_timeout=0.01)
+        self.assertTrue(writer.submit(self.make_log()))
+        self.assertFalse(writer.submit(self.make_log()))
+        self.assertEqual(writer.stats()['dropped'], 1)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            BufferedLogWriter(ActivityLog, policy='ignore')
+
+
+class BufferedLogWriterThreadTest(TransactionTestCase):
+    def test_stop_flushes_pending_rows(self):
+        writer = BufferedLogWriter(ActivityLog, batch_size=100, flush_interval=60)
+        writer.start()
+        for i in range(10):
+            writer.submit(ActivityLog(action='read', method='GET', path=f'/api/{i}'))
+        writer.stop()
+        self.assertEqual(ActivityLog.objects.count(), 10)
+        self.assertEqual(writer.stats()['flushed'], 10)
+
+
+@override_settings(ROOT_URLCONF='monitoring.tests', LOG_BUFFER_ENABLED=False)
+class AsyncMiddlewareTest(TestCase):
+    def test_middleware_mode_follows_get_response(self):
+        async def aget_response(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(ActivityLoggingMiddleware(aget_response)))
+        self.assertFalse(iscoroutinefunction(ActivityLoggingMiddleware(lambda request: HttpResponse())))
+
+    async def test_async_request_is_logged(self):
+        resp = await self.async_client.get('/missing', headers={'User-Agent': 'bench'})
+        self.assertEqual(resp.status_code, 404)
+        log = await ActivityLog.objects.aget()
+        self.assertEqual((log.path, log.status_code, log.user_agent), ('/missing', 404, 'bench'))
+
+    async def test_async_exception_is_logged(self):
+        utils.error_sampler.clear()
+        resp = await self.async_client.get('/broken')
+        self.assertEqual(resp.status_code, 500)
+        self.assertEqual(resp.json()['error'], 'boom')
+        error = await ErrorLog.objects.aget()
+        self.assertEqual(error.endpoint, '/broken')
+        self.assertIn('RuntimeError', error.stack_trace)
+        self.assertEqual(await ActivityLog.objects.filter(status_code=500).acount(), 1)
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        ActivityLog.objects.bulk_create(
+            ActivityLog(action='read', method='GET', path=f'/api/{i}') for i in range(7)
+        )
+
+    def test_pages_follow_cursor(self):
+        expected = list(ActivityLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        seen = []
+        url = reverse('activity-logs') + '?pagination=cursor&page_size=3&action=read'
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotIn('count', resp.data)
+            seen.extend(row['id'] for row in resp.data['results'])
+            url = resp.data['next']
+        # Rows logged by these requests are newer than the first page.
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        resp = self.client.get(reverse('activity-logs'), {'cursor': 'garbage'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_page_number_mode_is_default(self):
+        resp = self.client.get(reverse('activity-logs'))
+        self.assertEqual(resp.data['count'], 7)
+
+
+class ListQueryPlanTest(TestCase):
+    """Every supported filter combination must be answered from an index."""
+
+    def plan_for(self, view_class, params):
+        request = APIRequestFactory().get('/', params)
+        view = view_class()
+        view.setup(view.initialize_request(request))
+        qs = KeysetPagination().seek(view.get_queryset(), self.cursor)[:21]
+        sql, sql_params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, sql_params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, view_class, table, filters):
+        for n in range(len(filters) + 1):
+            for combo in combinations(filters, n):
+                params = {name: filters[name] for name in combo}
+                plan = self.plan_for(view_class, params)
+                with self.subTest(params=params, plan=plan):
+                    self.assertNotIn(f'SCAN {table}', plan)
+                    self.assertFalse(any('TEMP B-TREE' in step for step in plan))
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plan assertions are written against SQLite')
+        self.cursor = KeysetPagination().encode_cursor(ActivityLog(id=50, timestamp=now()))
+
+    def test_activity_filters_use_indexes(self):
+        self.assert_indexed(ActivityLogListView, 'monitoring_activitylog', {
+            'user_id': '1', 'action': 'read', 'date_from': '2025-01-01T00:00:00Z', 'date_to': '2026-01-01T00:00:00Z',
+        })
+
+    def test_error_filters_use_indexes(self):
+        self.assert_indexed(ErrorLogListView, 'monitoring_errorlog', {
+            'fingerprint': 'f' * 40, 'status_code': '500', 'date_from': '2025-01-01T00:00:00Z', 'date_to': '2026-01-01T00:00:00Z',
+        })
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class StreamingExportTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True, email='a@example.com')
+        self.client.force_authenticate(self.admin)
+        ActivityLog.objects.create(user=self.admin, action='login', method='POST', path='/api/auth/login',
+                                   ip_address='10.0.0.1', extra={'k': [1, 2]})
+        ActivityLog.objects.create(action='read', method='GET', path='/api/items/')
+        ErrorLog.objects.create(message='boom', endpoint='/api/x', status_code=500)
+
+    def serialized(self, serializer_class, model):
+        return json.loads(json.dumps(serializer_class(model.objects.all(), many=True).data))
+
+    def export(self, name, **params):
+        resp = self.client.get(reverse(name), params)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        return b''.join(resp.streaming_content)
+
+    # The export request's own activity row is written before the body streams.
+    def test_json_matches_serializer(self):
+        body = self.export('activity-logs', export='json')
+        self.assertEqual(json.loads(body), self.serialized(ActivityLogSerializer, ActivityLog))
+        body = self.export('error-logs', export='json')
+        self.assertEqual(json.loads(body), self.serialized(ErrorLogSerializer, ErrorLog))
+
+    def test_ndjson_gzip(self):
+        body = gzip.decompress(self.export('activity-logs', export='ndjson', gzip='1'))
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(rows, self.serialized(ActivityLogSerializer, ActivityLog))
+
+    def test_csv(self):
+        lines = self.export('activity-logs', export='csv', action='login').decode().splitlines()
+        self.assertEqual(lines[0], 'timestamp,user_id,action,method,path,ip_address,status_code')
+        self.assertEqual(len(lines), 2)
+        self.assertIn(',login,POST,/api/auth/login,10.0.0.1,200', lines[1])
+
+    def test_empty_json_export(self):
+        self.assertEqual(json.loads(self.export('activity-logs', export='json', action='delete')), [])
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class FastSerializationTest(APITestCase):
+    def setUp(self):
+        ActivityLog._meta.get_field('user_agent').interner.clear()
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True, email='a@example.com',
+                                              first_name='Ada', last_name='L')
+        self.client.force_authenticate(self.admin)
+        bob = User.objects.create_user('bob', password='pass')
+        group = ErrorGroup.objects.create(fingerprint='f' * 40, exception_type='KeyError', message='k')
+        for i, (user, ip) in enumerate([(self.admin, '10.0.0.1'), (None, '2001:db8::1'), (bob, None)]):
+            ActivityLog.objects.create(
+                user=user, action='update', method='PATCH', path=f'/api/items/{i}', ip_address=ip,
+                user_agent='agent/1', status_code=200 + i, extra={'n': i, 'tags': ['a']} if i else None,
+                duration_ms=1.5 * i if i else None, db_queries=i, db_time_ms=0.25,
+            )
+            ErrorLog.objects.create(user=user, message=f'boom {i}', endpoint='/api/x', ip_address=ip,
+                                    status_code=500, group=group if i else None, occurrences=i + 1)
+
+    def assertSameRows(self, rows, expected):
+        # Same values, types and key order as the serializer.
+        self.assertEqual([list(r.items()) for r in rows], [list(r.items()) for r in expected])
+
+    def test_row_format_matches_serializers(self):
+        for spec, serializer_class, model in ((exports.ACTIVITY_EXPORT, ActivityLogSerializer, ActivityLog),
+                                              (exports.ERROR_EXPORT, ErrorLogSerializer, ErrorLog)):
+            qs = model.objects.order_by('id')
+            self.assertSameRows(list(spec.row_format.rows(qs)), serializer_class(qs, many=True).data)
+            with override_timezone('America/New_York'):
+                self.assertSameRows(list(spec.row_format.rows(qs)), serializer_class(qs, many=True).data)
+
+    def test_list_pages_match_serializers(self):
+        qs = ErrorLog.objects.order_by('-timestamp', '-id')
+        expected = ErrorLogSerializer(qs, many=True).data
+        # Count, the page with users joined, and this request's own activity row.
+        with self.assertNumQueries(3):
+            resp = self.client.get(reverse('error-logs'), {'page_size': 10})
+        self.assertSameRows(resp.data['results'], expected)
+
+        seen = []
+        url = reverse('error-logs') + '?pagination=cursor&page_size=2'
+        while url:
+            resp = self.client.get(url)
+            seen.extend(resp.data['results'])
+            url = resp.data['next']
+        self.assertSameRows(seen, expected)
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class RollupTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        t = datetime(2025, 9, 2, 12, 34, 56, tzinfo=dt_timezone.utc)
+        ActivityLog.objects.bulk_create([
+            ActivityLog(action='read', status_code=200, timestamp=t),
+            ActivityLog(action='read', status_code=404, timestamp=t),
+            ActivityLog(action='create', status_code=201, timestamp=t.replace(hour=13)),
+        ])
+        ErrorLog.objects.bulk_create([
+            ErrorLog(message='boom', endpoint='/api/x', status_code=500, timestamp=t),
+            ErrorLog(message='boom', endpoint='/api/x', timestamp=t),
+        ])
+
+    def test_refresh_is_incremental(self):
+        self.assertEqual(rollups.refresh(chunk_size=2), {'activity': 3, 'error': 2})
+        self.assertEqual(rollups.refresh(), {'activity': 0, 'error': 0})
+        ActivityLog.objects.create(action='read', status_code=200,
+                                   timestamp=datetime(2025, 9, 2, 12, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(rollups.refresh(), {'activity': 1, 'error': 0})
+        day = ActivityRollup.objects.get(granularity='day', action='read', status_class=2)
+        self.assertEqual(day.count, 2)
+        self.assertEqual(ActivityRollup.objects.get(granularity='hour', action='create').count, 1)
+        self.assertEqual(RollupCheckpoint.objects.get(name='activity').last_id, ActivityLog.objects.latest('id').id)
+
+    def test_checkpoint_waits_for_the_lag_window(self):
+        fresh = ActivityLog.objects.create(action='read', status_code=200)
+        # An older row that was committed after the fresh one got its id.
+        late = ActivityLog.objects.create(action='read', status_code=200,
+                                          timestamp=datetime(2025, 9, 2, 14, 0, tzinfo=dt_timezone.utc))
+        self.assertEqual(rollups.activity.refresh(), 3)
+        self.assertEqual(rollups.activity.last_id(), fresh.id - 1)
+        with override_settings(LOG_ROLLUP_LAG=0):
+            self.assertEqual(rollups.activity.refresh(), 2)
+        self.assertEqual(rollups.activity.last_id(), late.id)
+
+        # Callers about to delete rows get them counted regardless.
+        row = ActivityLog.objects.create(action='read', status_code=200)
+        rollups.ensure_counted(ActivityLog, row.id)
+        self.assertEqual(rollups.activity.last_id(), row.id)
+
+    def test_stats_count_rows_past_the_checkpoint(self):
+        self.client.force_authenticate(self.admin)
+        rollups.refresh()
+        ActivityLog.objects.create(action='create', status_code=201)
+        ErrorLog.objects.create(message='boom', endpoint='/api/x', status_code=500)
+        caching.invalidate(ActivityLog)
+        resp = self.client.get(reverse('log-stats'), {'granularity': 'minute'})
+        self.assertEqual(resp.data['by_action'], [{'action': 'create', 'total': 2}, {'action': 'read', 'total': 2}])
+        self.assertEqual([row['total'] for row in resp.data['activity']], [1])
+        self.assertEqual(resp.data['daily_errors'][-1], {'date': now().astimezone(dt_timezone.utc).date(), 'total': 1})
+        self.assertEqual(RollupCheckpoint.objects.get(name='activity').last_id, 3)
+
+        caching.get_cache().clear()
+        with override_settings(LOG_STATS_UNFOLDED_LIMIT=0):
+            resp = self.client.get(reverse('log-stats'))
+        self.assertEqual(resp.data['by_action'], [{'action': 'read', 'total': 2}, {'action': 'create', 'total': 1}])
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command('rollup_logs', stdout=out)
+        ActivityRollup.objects.filter(granularity='day').update(count=99)
+        call_command('rollup_logs', '--rebuild', stdout=out)
+        self.assertEqual(ActivityRollup.objects.filter(granularity='day').count(), 3)
+        self.assertEqual(ActivityRollup.objects.filter(granularity='day').aggregate(n=Sum('count'))['n'], 3)
+        self.assertIn('activity: recounted 3 rows since 2025-09-02', out.getvalue())
+        self.assertIn('activity: 0 rows rolled up', out.getvalue().splitlines()[-2])
+
+    def test_rebuild_refuses_counts_without_rows(self):
+        call_command('rollup_logs', stdout=StringIO())
+        rollups.activity.add({(datetime(2025, 9, 2, 12, 0, tzinfo=dt_timezone.utc), 'read', 2): 5})
+        with self.assertRaisesMessage(CommandError, 'sampled-out requests'):
+            call_command('rollup_logs', '--rebuild', stdout=StringIO())
+        self.assertEqual(ActivityRollup.objects.filter(granularity='day').aggregate(n=Sum('count'))['n'], 8)
+
+        RollupCheckpoint.objects.filter(name='activity:added').delete()
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        with override_settings(LOG_ARCHIVE_DIR=archive_dir):
+            archive.write_segment('error', datetime(2025, 9, 2).date(), [{'id': 1, 'timestamp': '2025-09-02T01:00:00Z'}])
+            with self.assertRaisesMessage(CommandError, 'error: rows from 2025-09-02 on have been archived'):
+                call_command('rollup_logs', '--rebuild', stdout=StringIO())
+
+    def test_stats_from_rollups(self):
+        self.client.force_authenticate(self.admin)
+        rollups.refresh()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('log-stats'), {'granularity': 'hour', 'date_from': '2025-09-02',
+                                                          'date_to': '2025-09-03'})
+        # Nothing is refreshed on read; the request's own activity row is the only write.
+        writes = [q['sql'] for q in queries if not q['sql'].startswith('SELECT')]
+        self.assertEqual([sql.split('(')[0] for sql in writes], ['INSERT INTO "monitoring_activitylog" '])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['by_action'][0], {'action': 'read', 'total': 2})
+        self.assertEqual([row['total'] for row in resp.data['activity']], [2, 1])
+        self.assertEqual([row['total'] for row in resp.data['errors']], [2])
+        self.assertEqual(resp.json()['daily_errors'][0]['date'], '2025-09-02')
+
+    def test_stats_rejects_bad_granularity(self):
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(reverse('log-stats'), {'granularity': 'week'}).status_code, 400)
+
+
+def raise_at(value):
+    raise KeyError(value)
+
+
+class ErrorFingerprintTest(TestCase):
+    def capture(self, value):
+        try:
+            raise_at(value)
+        except KeyError as exc:
+            return exc
+
+    def test_fingerprint_ignores_ids_and_values(self):
+        a, _ = fingerprints.compute("'a'", '/api/items/1/', exception=self.capture('a'))
+        b, exc_type = fingerprints.compute("'b'", '/api/items/2/', exception=self.capture('b'))
+        self.assertEqual(a, b)
+        self.assertEqual(exc_type, 'KeyError')
+        c, _ = fingerprints.compute("'a'", '/api/users/1/', exception=self.capture('a'))
+        self.assertNotEqual(a, c)
+
+    def test_text_stack_matches_exception(self):
+        exc = self.capture('a')
+        stack = ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        self.assertEqual(
+            fingerprints.compute('x', '/api/x', exception=exc),
+            fingerprints.compute('x', '/api/x', stack_trace=stack),
+        )
+
+    def test_sampler_carries_skipped_occurrences(self):
+        sampler = fingerprints.OccurrenceSampler(limit=2, window=60)
+        self.assertEqual([sampler.sample('f', t) for t in (0, 1, 2, 3)], [1, 1, 0, 0])
+        self.assertEqual(sampler.sample('f', 61), 3)
+        self.assertEqual(sampler.sample('g', 61), 1)
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class ErrorGroupingTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.sampler = fingerprints.OccurrenceSampler(limit=2, window=60)
+        patcher = mock.patch.object(utils, 'error_sampler', self.sampler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def log(self, n, path='/api/items/7/'):
+        request = RequestFactory().get(path)
+        request.user = AnonymousUser()
+        for i in range(n):
+            utils.log_error(request, f'bad id {i}', stack_trace='Traceback...\nValueError: bad id', status_code=500)
+
+    @override_settings(LOG_ROLLUP_LAG=0)
+    def test_repeats_update_group_counter(self):
+        self.log(5)
+        group = ErrorGroup.objects.get()
+        self.assertEqual((group.count, group.exception_type, group.endpoint), (5, 'ValueError', '/api/items/{id}/'))
+        self.assertEqual(list(ErrorLog.objects.values_list('occurrences', flat=True)), [1, 1])
+        with self.assertNumQueries(1):
+            self.log(1)
+        rollups.refresh()
+        self.assertEqual(ErrorRollup.objects.get(granularity='day').count, 2)
+
+    def test_grouped_view(self):
+        self.log(3)
+        self.log(1, path='/api/other')
+        self.client.force_authenticate(self.admin)
+        resp = self.client.get(reverse('error-logs'), {'grouped': '1'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(sorted(row['count'] for row in resp.data['results']), [1, 3])
+        fingerprint = ErrorGroup.objects.get(count=3).fingerprint
+        resp = self.client.get(reverse('error-logs'), {'fingerprint': fingerprint})
+        self.assertEqual(resp.data['count'], 2)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.calls += 1
+            fail = server.calls <= server.failures
+            if not fail:
+                server.received.append(body['text'])
+        self.send_response(503 if fail else 200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class NotificationDispatcherTest(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _WebhookHandler)
+        self.server.lock = threading.Lock()
+        self.server.calls = 0
+        self.server.failures = 0
+        self.server.received = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        url = f'http://127.0.0.1:{self.server.server_address[1]}/hook'
+        override = override_settings(SLACK_WEBHOOK_URL=url)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def dispatcher(self, **kwargs):
+        dispatcher = NotificationDispatcher(**{'window': 0.2, 'tick': 0.02, 'backoff': 0.01, **kwargs})
+        self.addCleanup(dispatcher.shutdown)
+        return dispatcher
+
+    def test_storm_is_coalesced(self):
+        dispatcher = self.dispatcher()
+        for i in range(50):
+            dispatcher.notify('500 on /api/items', f'occurrence {i}', key='fp')
+        self.assertTrue(dispatcher.join(1))
+        self.assertEqual(len(self.server.received), 1)
+        deadline = time.monotonic() + 2
+        while len(self.server.received) < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertTrue(dispatcher.join(1))
+        self.assertEqual(len(self.server.received), 2)
+        self.assertIn('occurrence 49', self.server.received[1])
+        self.assertIn('48 more occurrences', self.server.received[1])
+        self.assertEqual(len(mail.outbox), 2)
+        stats = dispatcher.stats()
+        self.assertEqual((stats['sent'], stats['suppressed'], stats['failed']), (2, 49, 0))
+
+    def test_keys_are_limited_independently(self):
+        dispatcher = self.dispatcher(window=60)
+        self.assertTrue(dispatcher.notify('a', 'x', key='a'))
+        self.assertTrue(dispatcher.notify('b', 'x', key='b'))
+        self.assertFalse(dispatcher.notify('a', 'x', key='a'))
+        dispatcher.join(1)
+        self.assertEqual(dispatcher.stats()['sent'], 2)
+
+    def test_webhook_retried_with_backoff(self):
+        self.server.failures = 2
+        dispatcher = self.dispatcher()
+        dispatcher.notify('down', 'db unreachable')
+        self.assertTrue(dispatcher.join(2))
+        self.assertEqual(self.server.received, ['*down*\ndb unreachable'])
+        self.assertEqual(dispatcher.stats()['retried'], 2)
+
+    def test_bounded_queue_drops(self):
+        dispatcher = self.dispatcher(max_queue=0)
+        self.assertFalse(dispatcher.notify('a', 'x'))
+        self.assertEqual(dispatcher.stats()['dropped'], 1)
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class RetentionTest(APITestCase):
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+        settings_override = override_settings(LOG_ARCHIVE_DIR=self.archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        self.old_day = (now() - timedelta(days=40)).astimezone(dt_timezone.utc).replace(hour=12)
+        for i in range(3):
+            ActivityLog.objects.create(user=self.admin, action='login' if i else 'read', method='GET',
+                                       path=f'/api/items/{i}', timestamp=self.old_day + timedelta(minutes=i))
+        ActivityLog.objects.create(action='read', method='GET', path='/api/items/')
+        ErrorLog.objects.create(message='old', endpoint='/api/x', status_code=500,
+                                timestamp=self.old_day - timedelta(days=60))
+
+    def retain(self, *args):
+        out = StringIO()
+        call_command('apply_retention', *args, stdout=out)
+        return out.getvalue()
+
+    def test_archives_and_deletes_expired_rows(self):
+        expected = json.loads(json.dumps(ActivityLogSerializer(
+            ActivityLog.objects.filter(timestamp__lt=now() - timedelta(days=30)), many=True).data))
+        out = self.retain()
+        self.assertIn('activity: archived 3 rows', out)
+        self.assertIn('error: archived 1 rows', out)
+        self.assertEqual(ActivityLog.objects.count(), 1)
+        self.assertEqual(ErrorLog.objects.count(), 0)
+
+        days = archive.segments('activity')
+        self.assertEqual(list(days), [self.old_day.date()])
+        self.assertEqual(list(archive.read_rows('activity')), expected)
+        # Stats keep counting archived rows through the rollups; the new row waits for the lag window.
+        self.assertEqual(ActivityRollup.objects.filter(granularity='day').aggregate(n=Sum('count'))['n'], 3)
+
+    def test_archive_counts_rollups_and_writes_manifest(self):
+        for days in (1, 2):
+            ActivityLog.objects.create(action='read', path=f'/api/older/{days}',
+                                       timestamp=self.old_day - timedelta(days=days))
+        cutoff = now() - timedelta(days=30)
+        archived, deleted = archive.archive_before(ActivityLog, 'activity', exports.ACTIVITY_EXPORT.row_format, cutoff)
+        self.assertEqual((archived, deleted), (5, 5))
+        # Counted before deletion, without a separate rollup run.
+        self.assertEqual(ActivityRollup.objects.filter(granularity='day').aggregate(n=Sum('count'))['n'], 6)
+        manifest = archive.read_manifest('activity')
+        self.assertEqual(sorted(entry['rows'] for entry in manifest.values()), [1, 1, 3])
+
+        rows = archive.ArchivedRows('activity', self.old_day - timedelta(days=5))
+        with mock.patch.object(archive, '_read_segment', side_effect=AssertionError('decompressed')):
+            self.assertEqual(rows.count(), 5)
+        read = []
+        real_read = archive._read_segment
+        with mock.patch.object(archive, '_read_segment', side_effect=lambda p: read.append(p.name) or real_read(p)):
+            page = rows.slice(3, 5)
+        self.assertEqual([r['path'] for r in page], ['/api/older/1', '/api/older/2'])
+        self.assertNotIn(f'{self.old_day.date()}.ndjson.gz', read)
+        # A range that cuts into a day reads that day to count it.
+        self.assertEqual(archive.ArchivedRows('activity', self.old_day + timedelta(minutes=1)).count(), 2)
+
+    def test_rerun_after_interrupted_delete_does_not_duplicate(self):
+        cutoff = now() - timedelta(days=30)
+        row_format = exports.ACTIVITY_EXPORT.row_format
+
+        def interrupted(model, queryset, chunk_size):
+            model.objects.filter(id__in=list(queryset.values_list('id', flat=True)[:1])).delete()
+            raise RuntimeError('killed')
+
+        with mock.patch.object(archive, '_delete_in_chunks', side_effect=interrupted), \
+                self.assertRaises(RuntimeError):
+            archive.archive_before(ActivityLog, 'activity', row_format, cutoff)
+        self.assertEqual(ActivityLog.objects.filter(timestamp__lt=cutoff).count(), 2)
+        [entry] = archive.read_manifest('activity').values()
+        self.assertEqual(entry['max_id'] - entry['min_id'], 2)
+
+        # The next run only finishes the delete.
+        self.assertEqual(archive.archive_before(ActivityLog, 'activity', row_format, cutoff), (0, 2))
+        self.assertEqual(len(archive.segments('activity')[self.old_day.date()]), 1)
+        self.assertEqual(archive.ArchivedRows('activity').count(), 3)
+        self.assertEqual(ActivityRollup.objects.filter(granularity='day').aggregate(n=Sum('count'))['n'], 3)
+
+        # Later rows for the archived day go into a new part.
+        ActivityLog.objects.create(action='read', path='/api/late', timestamp=self.old_day + timedelta(hours=1))
+        self.assertEqual(archive.archive_before(ActivityLog, 'activity', row_format, cutoff, chunk_size=1), (1, 1))
+        self.assertEqual([r['path'] for r in archive.read_rows('activity')][0], '/api/late')
+
+    def test_dry_run_keeps_rows(self):
+        self.assertIn('activity: would archive 3 rows', self.retain('--dry-run'))
+        self.assertEqual(ActivityLog.objects.count(), 4)
+        self.assertEqual(archive.segments('activity'), {})
+
+    def test_list_and_export_read_archive(self):
+        self.retain('--only', 'activity')
+        params = {'date_from': f'{(self.old_day - timedelta(days=1)).date()}T00:00:00Z'}
+
+        resp = self.client.get(reverse('activity-logs'), params)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['count'], 4)
+        self.assertEqual([r['path'] for r in resp.data['results'][1:]],
+                         ['/api/items/2', '/api/items/1', '/api/items/0'])
+
+        resp = self.client.get(reverse('activity-logs'), {**params, 'action': 'login', 'user_id': self.admin.id})
+        self.assertEqual([r['path'] for r in resp.data['results']], ['/api/items/2', '/api/items/1'])
+
+        resp = self.client.get(reverse('activity-logs'), {**params, 'export': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(resp.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), ActivityLog.objects.count() + 3)
+        self.assertEqual(rows[-1]['path'], '/api/items/0')
+
+        resp = self.client.get(reverse('activity-logs'), {**params, 'export': 'csv', 'action': 'login'})
+        lines = b''.join(resp.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn(f',{self.admin.id},login,GET,/api/items/2,', lines[1])
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class FullTextSearchTest(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        ErrorLog.objects.create(message='Database timeout while saving invoice', endpoint='/api/invoices/7',
+                                status_code=500, stack_trace='File "billing/views.py", line 3, in save')
+        ErrorLog.objects.create(message='Invoice not found', endpoint='/api/invoices/8', status_code=404)
+        ErrorLog.objects.create(message='Permission denied', endpoint='/api/items/1', status_code=403)
+        ActivityLog.objects.bulk_create([
+            ActivityLog(action='read', method='GET', path='/api/invoices/7'),
+            ActivityLog(action='read', method='GET', path='/api/items/1'),
+        ])
+
+    def search_errors(self, q, **params):
+        resp = self.client.get(reverse('error-logs'), {'q': q, **params})
+        self.assertEqual(resp.status_code, 200)
+        results = resp.data['results'] if isinstance(resp.data, dict) else resp.data
+        return [r['message'] for r in results]
+
+    def test_matches_all_words_ranked(self):
+        self.assertEqual(self.search_errors('invoice'), ['Invoice not found', 'Database timeout while saving invoice'])
+        self.assertEqual(self.search_errors('invoice timeout'), ['Database timeout while saving invoice'])
+        self.assertEqual(self.search_errors('billing'), ['Database timeout while saving invoice'])
+        self.assertEqual(self.search_errors('invoice', status_code=404), ['Invoice not found'])
+        self.assertEqual(self.search_errors('"unbalanced (query'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        ErrorLog.objects.filter(status_code=403).update(message='Invoice locked')
+        self.assertEqual(len(self.search_errors('invoice')), 3)
+        ErrorLog.objects.filter(status_code=404).delete()
+        self.assertEqual(len(self.search_errors('invoice')), 2)
+        self.assertEqual(self.search_errors('denied'), [])
+
+    def test_activity_paths_and_cursor_mode(self):
+        resp = self.client.get(reverse('activity-logs'), {'q': 'invoices'})
+        self.assertEqual([r['path'] for r in resp.data['results']], ['/api/invoices/7'])
+        resp = self.client.get(reverse('activity-logs'), {'q': 'items', 'pagination': 'cursor'})
+        self.assertEqual([r['path'] for r in resp.data['results']], ['/api/items/1'])
+
+    def test_admin_changelist_uses_index(self):
+        # force_login's bare HttpRequest has no method to log.
+        with mock.patch('monitoring.signals.log_activity'):
+            self.client.force_login(User.objects.create_superuser('root', password='pass'))
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get('/admin/monitoring/errorlog/', {'q': 'invoice'})
+        self.assertContains(resp, 'Invoice not found')
+        self.assertNotContains(resp, 'Permission denied')
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+    def test_admin_search_matches_usernames(self):
+        alice = User.objects.create_user('alice', password='pass')
+        ActivityLog.objects.create(user=alice, action='read', method='GET', path='/api/orders/3')
+        with mock.patch('monitoring.signals.log_activity'):
+            self.client.force_login(User.objects.create_superuser('root', password='pass'))
+        resp = self.client.get('/admin/monitoring/activitylog/', {'q': 'alice'})
+        self.assertContains(resp, '/api/orders/3')
+        self.assertNotContains(resp, '/api/items/1')
+        resp = self.client.get('/admin/monitoring/activitylog/', {'q': 'invoices'})
+        self.assertContains(resp, '/api/invoices/7')
+        self.assertNotContains(resp, '/api/orders/3')
+
+    def test_query_plan_uses_fts(self):
+        qs = search.errors.filter(ErrorLog.objects.all(), 'invoice')
+        plan = ' '.join(str(row) for row in connection.cursor().execute(
+            'EXPLAIN QUERY PLAN ' + str(qs.query), []).fetchall())
+        self.assertIn('VIRTUAL TABLE', plan)
+        self.assertNotIn('SCAN monitoring_errorlog ', plan + ' ')
+
+    def test_install_skips_missing_tables(self):
+        with mock.patch.object(connection.introspection, 'table_names', return_value=['auth_user']), \
+                CaptureQueriesContext(connection) as queries:
+            search.install()
+        self.assertEqual(len(queries), 0)
+
+
+class LogHistogramTest(SimpleTestCase):
+    def test_percentiles_within_bucket_error(self):
+        hist = latency.LogHistogram()
+        for v in range(1, 1001):
+            hist.record(v / 10)
+        for p, expected in ((50, 50.0), (95, 95.0), (99, 99.0)):
+            self.assertAlmostEqual(hist.percentile(p), expected, delta=expected * 0.05)
+        self.assertEqual(hist.percentile(100), 100.0)
+        self.assertLess(len(hist.counts), 100)
+
+    def test_merge_matches_single_histogram(self):
+        a, b, both = latency.LogHistogram(), latency.LogHistogram(), latency.LogHistogram()
+        for i, v in enumerate([0.2, 3, 3, 40, 41, 250, 900, 5]):
+            (a if i % 2 else b).record(v)
+            both.record(v)
+        merged = latency.LogHistogram().merge(a).merge(b)
+        self.assertEqual(merged.summary(), both.summary())
+
+    def test_recorder_buckets_and_expiry(self):
+        recorder = latency.LatencyRecorder(bucket_seconds=60, retention=600)
+        recorder.record('GET /a', 10, now=1000)
+        recorder.record('GET /a', 20, now=1010)
+        recorder.record('GET /a', 30, now=1030)
+        recorder.record('GET /b', 5, now=1030)
+        minutes = recorder.snapshot(endpoint='GET /a')
+        self.assertEqual(sorted((k[1], h.total) for k, h in minutes.items()), [(960, 2), (1020, 1)])
+        hours = recorder.snapshot(bucket_seconds=3600)
+        self.assertEqual(hours[('GET /a', 0)].total, 3)
+        recorder.record('GET /a', 1, now=1700)
+        self.assertEqual(sorted(k[1] for k in recorder.snapshot()), [1680])
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class LatencyCaptureTest(APITestCase):
+    def setUp(self):
+        latency.recorder.clear()
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def test_activity_records_timing(self):
+        Item.objects.create(name='a', owner=self.admin)
+        self.client.get('/api/items/')
+        log = ActivityLog.objects.get(path='/api/items/')
+        self.assertGreater(log.duration_ms, 0)
+        self.assertGreaterEqual(log.duration_ms, log.db_time_ms)
+        # Page count and page query; the log write itself is not counted.
+        self.assertEqual(log.db_queries, 2)
+
+    def test_latency_endpoint(self):
+        for i in (1, 2, 3):
+            self.client.get(f'/api/items/{i}/')
+        self.client.get(reverse('error-logs'))
+        resp = self.client.get(reverse('log-latency'), {'granularity': 'hour'})
+        self.assertEqual(resp.status_code, 200)
+        endpoints = {e['endpoint']: e for e in resp.data['endpoints']}
+        item = endpoints['GET /api/items/<pk>/']
+        self.assertEqual(item['overall']['count'], 3)
+        self.assertEqual(len(item['buckets']), 1)
+        self.assertLessEqual(item['overall']['p50_ms'], item['overall']['p99_ms'])
+        self.assertIn('GET /api/logs/errors', endpoints)
+
+        resp = self.client.get(reverse('log-latency'), {'endpoint': 'GET /api/logs/errors'})
+        self.assertEqual([e['endpoint'] for e in resp.data['endpoints']], ['GET /api/logs/errors'])
+        self.assertEqual(self.client.get(reverse('log-latency'), {'granularity': 'week'}).status_code, 400)
+
+
+class RoutePolicyTest(SimpleTestCase):
+    def test_first_matching_rule_wins(self):
+        table = policy.RoutePolicy([
+            {'route': 'login', 'action': 'login'},
+            {'route': 'item-*', 'methods': ['get'], 'sample_rate': 0.1, 'capture_body': True},
+        ])
+        self.assertEqual(table.match('login', 'POST').action_for('POST'), 'login')
+        self.assertEqual(table.match('item-detail', 'GET').sample_rate, 0.1)
+        self.assertTrue(table.match('item-list', 'GET').capture_body)
+        rule = table.match('item-list', 'POST')
+        self.assertEqual((rule.sample_rate, rule.action_for('POST'), rule.capture_body), (1.0, 'create', False))
+        self.assertEqual(table.match('', 'DELETE').action_for('DELETE'), 'delete')
+        self.assertIs(table.match('item-detail', 'GET'), table.match('item-detail', 'GET'))
+        with self.assertRaises(ImproperlyConfigured):
+            policy.RoutePolicy([{'route': 'health', 'action': 'healthcheck'}])
+
+    def test_sampling_is_deterministic(self):
+        ids = [f'req-{i}' for i in range(10000)]
+        kept = [i for i in ids if policy.sampled(i, 0.1)]
+        self.assertAlmostEqual(len(kept) / len(ids), 0.1, delta=0.02)
+        self.assertEqual(kept, [i for i in ids if policy.sampled(i, 0.1)])
+        self.assertTrue(set(kept) <= {i for i in ids if policy.sampled(i, 0.5)})
+
+
+@override_settings(LOG_BUFFER_ENABLED=False, LOG_ROUTE_POLICY=[
+    {'route': 'item-*', 'methods': ['GET'], 'sample_rate': 0},
+    {'route': 'me-profile', 'methods': ['PATCH'], 'action': 'profile_update', 'sample_rate': 0,
+     'always_log_errors': False},
+])
+class SamplingMiddlewareTest(APITestCase):
+    def setUp(self):
+        rollups.pending.drain()
+        self.user = User.objects.create_user('bob', password='pass')
+        self.client.force_authenticate(self.user)
+
+    @override_settings(LOG_ROLLUP_LAG=0)
+    def test_sampled_out_requests_are_counted(self):
+        self.client.get('/api/items/')
+        self.client.get('/api/items/')
+        self.client.get('/api/items/999/')
+        self.client.post('/api/items/', {'name': 'N', 'description': 'D'}, format='json')
+
+        # Reads are dropped, the 404 and the write are kept.
+        self.assertEqual(sorted(ActivityLog.objects.values_list('action', 'status_code')),
+                         [('create', 201), ('read', 404)])
+        self.assertEqual(rollups.pending.total(), 2)
+        rollups.refresh()
+        totals = ActivityRollup.objects.filter(granularity='day').values_list('action', 'status_class', 'count')
+        self.assertEqual(sorted(totals), [('create', 2, 1), ('read', 2, 2), ('read', 4, 1)])
+        self.assertEqual(rollups.pending.total(), 0)
+
+    def test_errors_follow_rule(self):
+        resp = self.client.patch(reverse('me-profile'), {'email': 'not-an-email'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(ActivityLog.objects.exists())
+        self.assertEqual(rollups.pending.drain(), Counter({
+            (rollups.truncate(now(), 'minute'), 'profile_update', 4): 1,
+        }))
+
+    def test_request_id_header_drives_sampling(self):
+        with override_settings(LOG_ROUTE_POLICY=[{'route': 'item-list', 'sample_rate': 0.5}]):
+            self.client = self.client_class()
+            self.client.force_authenticate(self.user)
+            ids = [f'req-{i}' for i in range(40)]
+            for request_id in ids:
+                self.client.get('/api/items/', headers={'X-Request-ID': request_id})
+        self.assertEqual(ActivityLog.objects.count(), sum(policy.sampled(i, 0.5) for i in ids))
+
+    def test_untrusted_request_id_is_replaced(self):
+        self.addCleanup(rollups.pending.drain)
+        dropped = next(f'req-{i}' for i in range(100) if not policy.sampled(f'req-{i}', 0.5))
+        with override_settings(LOG_ROUTE_POLICY=[{'route': 'item-list', 'sample_rate': 0.5}],
+                               LOG_TRUSTED_PROXIES=['10.0.0.0/8']):
+            self.client = self.client_class()
+            self.client.force_authenticate(self.user)
+            for _ in range(40):
+                resp = self.client.get('/api/items/', headers={'X-Request-ID': dropped}, REMOTE_ADDR='203.0.113.9')
+                self.assertNotEqual(resp['X-Request-ID'], dropped)
+            # Reads cannot all be kept out of the log by reusing a sampled-out id.
+            self.assertGreater(ActivityLog.objects.count(), 0)
+            resp = self.client.get('/api/items/', headers={'X-Request-ID': dropped}, REMOTE_ADDR='10.1.2.3')
+            self.assertEqual(resp['X-Request-ID'], dropped)
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class CompactStorageTest(APITestCase):
+    UA = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0 Safari/537.36'
+
+    def setUp(self):
+        ActivityLog._meta.get_field('user_agent').interner.clear()
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def raw(self, table, columns):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {", ".join(f"typeof({c}), {c}" for c in columns)} FROM {table} ORDER BY id')
+            return cursor.fetchall()
+
+    def test_columns_are_coded(self):
+        ActivityLog.objects.create(action='update', method='PATCH', ip_address='10.1.2.3', user_agent=self.UA)
+        ActivityLog.objects.create(action='read', method='GET', ip_address='2001:db8::1', user_agent=self.UA)
+        ErrorLog.objects.create(message='boom', method='POST', ip_address='10.1.2.3', user_agent=self.UA)
+        rows = self.raw('monitoring_activitylog', ['action', 'method', 'ip_address', 'user_agent'])
+        ua_id = UserAgent.objects.get().pk
+        self.assertEqual(rows[0], ('integer', 6, 'integer', 4, 'blob', bytes([10, 1, 2, 3]), 'integer', ua_id))
+        self.assertEqual(len(rows[1][5]), 16)
+        self.assertEqual(self.raw('monitoring_errorlog', ['user_agent'])[0], ('integer', ua_id))
+
+        log = ActivityLog.objects.get(method='PATCH')
+        self.assertEqual((log.action, log.ip_address, log.user_agent), ('update', '10.1.2.3', self.UA))
+        self.assertEqual(ActivityLog.objects.filter(ip_address='2001:db8::1').get().method, 'GET')
+        self.assertEqual(ActivityLog.objects.filter(action__in=['read', 'delete']).count(), 1)
+        self.assertEqual(ActivityLog.objects.filter(user_agent=self.UA).count(), 2)
+
+    def test_output_format_unchanged(self):
+        ActivityLog.objects.create(user=self.admin, action='login', method='POST', path='/api/auth/login',
+                                   ip_address='10.0.0.1', user_agent=self.UA)
+        ActivityLog.objects.create(action='read', method='GET', path='/api/items/')
+        expected = [
+            {'action': 'read', 'method': 'GET', 'ip_address': None, 'user_agent': ''},
+            {'action': 'login', 'method': 'POST', 'ip_address': '10.0.0.1', 'user_agent': self.UA},
+        ]
+        for data in (ActivityLogSerializer(ActivityLog.objects.all(), many=True).data,
+                     list(exports.ACTIVITY_EXPORT.row_format.rows(ActivityLog.objects.all()))):
+            self.assertEqual([{k: row[k] for k in expected[0]} for row in data], expected)
+
+    def test_interning_survives_rollback(self):
+        interner = ActivityLog._meta.get_field('user_agent').interner
+        # Test methods run inside a transaction: ids created here are not cached.
+        ActivityLog.objects.create(user_agent='agent/1')
+        self.assertNotIn('agent/1', interner._ids)
+        self.assertEqual(ActivityLog.objects.get().user_agent, 'agent/1')
+
+    def test_filters_only_look_up(self):
+        ActivityLog.objects.create(action='read', user_agent=self.UA)
+        self.assertFalse(ActivityLog.objects.filter(user_agent='never/1.0').exists())
+        self.assertEqual(ActivityLog.objects.filter(user_agent__in=['never/1.0', self.UA]).count(), 1)
+        self.assertEqual(ActivityLog.objects.filter(user_agent='').count(), 0)
+        self.assertEqual(list(UserAgent.objects.values_list('value', flat=True)), [self.UA])
+        with self.assertRaises(FieldError):
+            ActivityLog.objects.filter(user_agent__icontains='mozilla')
+
+    def test_page_resolves_agents_in_one_query(self):
+        ActivityLog.objects.bulk_create(
+            ActivityLog(action='read', path=f'/api/items/{i}', user_agent=f'agent/{i}') for i in range(20)
+        )
+        ActivityLog._meta.get_field('user_agent').interner.clear()
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('activity-logs'), {'page_size': 50})
+        agents = {row['user_agent'] for row in resp.data['results']}
+        self.assertLessEqual({f'agent/{i}' for i in range(20)}, agents)
+        self.assertEqual(sum('monitoring_useragent' in q['sql'] for q in queries), 1)
+
+
+class CompactStorageMigrationTest(TransactionTestCase):
+    """0007 re-encodes rows written with the plain text columns."""
+    before = [('monitoring', '0006_activitylog_timing')]
+    after = [('monitoring', '0007_compact_storage')]
+    UA = 'legacy/1.0'
+
+    def setUp(self):
+        ActivityLog._meta.get_field('user_agent').interner.clear()
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.executor.loader.build_graph()
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('monitoring'))
+        # Rebuilding the tables dropped the index triggers; rows written
+        # meanwhile are not indexed.
+        search.install()
+        with connection.cursor() as cursor:
+            for index in search.INDEXES:
+                cursor.execute(f"INSERT INTO {index.fts_table}({index.fts_table}) VALUES ('rebuild')")
+
+    def test_text_rows_are_converted(self):
+        apps = self.executor.loader.project_state(self.before).apps
+        OldActivityLog = apps.get_model('monitoring', 'ActivityLog')
+        OldErrorLog = apps.get_model('monitoring', 'ErrorLog')
+        OldActivityLog.objects.create(action='delete', method='DELETE', path='/a', ip_address='10.0.0.2',
+                                      user_agent=self.UA)
+        OldActivityLog.objects.create(action='read', method='GET', path='/b', ip_address='2001:db8::1')
+        OldErrorLog.objects.create(message='boom', method='PUT', user_agent=self.UA)
+
+        self.executor.migrate(self.after)
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT typeof(action), action, typeof(method), method, ip_address '
+                           'FROM monitoring_activitylog ORDER BY id')
+            rows = cursor.fetchall()
+        self.assertEqual(rows[0], ('integer', 7, 'integer', 5, bytes([10, 0, 0, 2])))
+        self.assertEqual(len(rows[1][4]), 16)
+        ua_id = UserAgent.objects.get(value=self.UA).pk
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes('monitoring'))
+        converted = ActivityLog.objects.get(path='/a')
+        self.assertEqual((converted.action, converted.method, converted.ip_address, converted.user_agent),
+                         ('delete', 'DELETE', '10.0.0.2', self.UA))
+        self.assertEqual(ActivityLog.objects.get(path='/b').ip_address, '2001:db8::1')
+        error = ErrorLog.objects.get()
+        self.assertEqual((error.method, error.user_agent), ('PUT', self.UA))
+        self.assertEqual(UserAgent.objects.get().pk, ua_id)
+
+    def test_reverse_restores_text(self):
+        self.executor.migrate(self.after)
+        NewActivityLog = self.executor.loader.project_state(self.after).apps.get_model('monitoring', 'ActivityLog')
+        NewActivityLog.objects.create(action='update', method='PATCH', path='/c', ip_address='10.1.2.3',
+                                      user_agent=self.UA)
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.before)
+        apps = self.executor.loader.project_state(self.before).apps
+        row = apps.get_model('monitoring', 'ActivityLog').objects.values(
+            'action', 'method', 'ip_address', 'user_agent').get()
+        self.assertEqual(row, {'action': 'update', 'method': 'PATCH', 'ip_address': '10.1.2.3',
+                               'user_agent': self.UA})
+
+
+class MigrationsTest(TestCase):
+    def test_models_match_migrations(self):
+        out = StringIO()
+        call_command('makemigrations', 'monitoring', check=True, dry_run=True, stdout=out)
+        self.assertIn('No changes detected', out.getvalue())
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class BulkIngestTest(APITestCase):
+    def setUp(self):
+        ActivityLog._meta.get_field('user_agent').interner.clear()
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def ndjson(self, *records):
+        return b''.join((r if isinstance(r, bytes) else json.dumps(r).encode()) + b'\n' for r in records)
+
+    def ingested(self):
+        # Excludes the middleware's own rows for the ingest requests.
+        return ActivityLog.objects.exclude(path=reverse('log-ingest')).order_by('id')
+
+    def post(self, body, **headers):
+        return self.client.generic('POST', reverse('log-ingest'), body,
+                                   content_type='application/x-ndjson', **headers)
+
+    def test_ingest_counts_and_rejects(self):
+        body = self.ndjson(
+            {'user': {'id': self.admin.id}, 'action': 'create', 'method': 'POST', 'path': '/api/items/',
+             'ip_address': '10.0.0.9', 'user_agent': 'curl/8', 'status_code': 201,
+             'timestamp': '2026-03-01T10:00:00.250Z', 'duration_ms': 4.5},
+            {'user_id': self.admin.id, 'path': '/api/invoices/3', 'timestamp': '2026-03-01T12:00:00+02:00'},
+            b'{not json',
+            {'action': 'explode'},
+            {'user': 999999},
+            {'status_code': 42},
+            {'ip_address': 'nowhere'},
+        )
+        resp = self.post(body)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual((resp.data['accepted'], resp.data['rejected']), (2, 5))
+        self.assertEqual([e['line'] for e in resp.data['errors']], [3, 4, 5, 6, 7])
+
+        first, second = self.ingested()
+        self.assertEqual((first.user, first.action, first.method, first.ip_address, first.user_agent),
+                         (self.admin, 'create', 'POST', '10.0.0.9', 'curl/8'))
+        self.assertEqual(first.timestamp, datetime(2026, 3, 1, 10, 0, 0, 250000, tzinfo=dt_timezone.utc))
+        self.assertEqual((second.action, second.status_code), ('other', 200))
+        self.assertEqual(second.timestamp, datetime(2026, 3, 1, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(list(search.activity.filter(self.ingested(), 'invoices')), [second])
+
+    @override_settings(LOG_INGEST_CHUNK_SIZE=3)
+    def test_gzip_body_and_chunks(self):
+        body = gzip.compress(self.ndjson(*({'path': f'/api/items/{i}'} for i in range(7))))
+        resp = self.post(body, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual((resp.data['accepted'], resp.data['rejected']), (7, 0))
+        self.assertEqual(self.ingested().count(), 7)
+        self.assertEqual(self.post(b'plain', HTTP_CONTENT_ENCODING='gzip').status_code, 400)
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(User.objects.create_user('bob', password='pass'))
+        self.assertEqual(self.post(self.ndjson({'path': '/x'})).status_code, 403)
+        self.assertFalse(self.ingested().exists())
+
+    def test_command(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = f'{tmpdir}/logs.ndjson.gz'
+        with gzip.open(path, 'wb') as out:
+            out.write(self.ndjson({'path': '/a'}, {'path': '/b'}, {'action': 'nope'}))
+        stdout, stderr = StringIO(), StringIO()
+        call_command('ingest_logs', path, chunk_size=1, stdout=stdout, stderr=stderr)
+        self.assertIn('accepted 2, rejected 1', stdout.getvalue())
+        self.assertIn("line 3: unknown action 'nope'", stderr.getvalue())
+        self.assertEqual(sorted(ActivityLog.objects.values_list('path', flat=True)), ['/a', '/b'])
+
+
+class LogDatabaseTest(APITestCase):
+    def test_router(self):
+        router = db.LogRouter()
+        from .views import Item
+        self.assertIsNone(router.db_for_write(ActivityLog))
+        self.assertIsNone(router.allow_migrate('default', 'monitoring', 'activitylog'))
+        with mock.patch('monitoring.db.log_database', return_value='logs'):
+            self.assertEqual(router.db_for_write(ActivityLog), 'logs')
+            self.assertEqual(router.db_for_read(ErrorGroup), 'logs')
+            self.assertIsNone(router.db_for_write(Item))
+            self.assertIsNone(router.db_for_write(User))
+            self.assertTrue(router.allow_migrate('logs', 'monitoring', 'useragent'))
+            self.assertFalse(router.allow_migrate('logs', 'monitoring', 'item'))
+            self.assertFalse(router.allow_migrate('logs', 'auth', None))
+            self.assertFalse(router.allow_migrate('default', 'monitoring', 'errorlog'))
+            self.assertIsNone(router.allow_migrate('default', 'auth', 'user'))
+
+    def test_migrate_log_database(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'logs.sqlite3')
+        env = {**os.environ, 'LOG_DATABASE_PATH': path, 'DJANGO_SETTINGS_MODULE': 'monitor_project.settings'}
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--database', 'logs', '-v', '0'],
+                       cwd=settings.BASE_DIR, env=env, check=True, capture_output=True)
+        with sqlite3.connect(path) as conn:
+            tables = {name for name, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertLessEqual({f'monitoring_{name}' for name in db.LOG_MODELS}, tables)
+        self.assertIn(search.activity.fts_table, tables)
+        self.assertNotIn('monitoring_item', tables)
+        self.assertNotIn('auth_user', tables)
+
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    @override_settings(LOG_BUFFER_ENABLED=False)
+    def test_user_delete_and_cross_database_export(self):
+        bob = User.objects.create_user('bob', password='pass')
+        ActivityLog.objects.create(user=bob, action='read', path='/a')
+        ActivityLog.objects.create(action='read', path='/b')
+        rows = list(exports.ACTIVITY_EXPORT.row_format.rows(ActivityLog.objects.order_by('id')))
+        # Same rows when users have to be looked up separately.
+        with mock.patch('monitoring.db.shares_user_database', return_value=False):
+            self.assertEqual(list(exports.ACTIVITY_EXPORT.row_format.rows(
+                ActivityLog.objects.order_by('id'), chunk_size=1)), rows)
+            self.assertEqual(db.with_users(ActivityLog.objects.all())._prefetch_related_lookups, ('user',))
+        self.assertEqual(rows[0]['user']['username'], 'bob')
+
+        bob.delete()
+        self.assertEqual(list(ActivityLog.objects.order_by('id').values_list('user_id', flat=True)), [None, None])
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class LogTailTest(TransactionTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.token = str(RefreshToken.for_user(self.admin).access_token)
+        self.factory = RequestFactory()
+
+    def record(self, **kwargs):
+        request = self.factory.get(kwargs.pop('path', '/api/items/'))
+        request.user = kwargs.pop('user', AnonymousUser())
+        utils.log_activity(request, **kwargs)
+
+    async def open(self, **params):
+        response = await self.async_client.get(reverse('log-tail'), params, headers={
+            'Authorization': f'Bearer {self.token}',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return response
+
+    async def events(self, stream, count):
+        found = []
+        while len(found) < count:
+            chunk = await asyncio.wait_for(anext(stream), 5)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            found.extend(json.loads(line[6:]) for line in chunk.splitlines() if line.startswith('data: '))
+        return found
+
+    async def test_live_filtered_and_resumed(self):
+        response = await self.open(action='create', status_code='201')
+        stream = response.streaming_content
+        await anext(stream)  # retry hint, sent once subscribed
+        await sync_to_async(self.record)(action='read', status_code=200)
+        await sync_to_async(self.record)(action='create', status_code=201, path='/api/items/new')
+        [row] = await self.events(stream, 1)
+        self.assertEqual((row['action'], row['path'], row['status_code']), ('create', '/api/items/new', 201))
+        # What the server does when the client disconnects.
+        await sync_to_async(response.close)()
+        self.assertEqual(tail.broker.stats()['subscribers']['activity'], 0)
+
+        await sync_to_async(self.record)(action='create', status_code=201, path='/api/items/later')
+        response = await self.open(last_id=str(row['id']), action='create')
+        stream = response.streaming_content
+        await anext(stream)
+        [replayed] = await self.events(stream, 1)
+        self.assertEqual(replayed['path'], '/api/items/later')
+        await sync_to_async(response.close)()
+
+    async def test_slow_consumer_disconnected(self):
+        with override_settings(LOG_TAIL_BUFFER=2):
+            stream = (await self.open()).streaming_content
+            await anext(stream)
+            for _ in range(3):
+                await sync_to_async(self.record)(action='read')
+            chunk = await asyncio.wait_for(anext(stream), 5)
+        self.assertIn(b'event: overflow', chunk)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+        self.assertEqual(tail.broker.stats()['subscribers']['activity'], 0)
+
+    def test_published_after_commit(self):
+        request = self.factory.get('/api/items/')
+        request.user = AnonymousUser()
+        with mock.patch.object(tail, 'publish') as publish:
+            with transaction.atomic():
+                self.record(action='create')
+                utils.log_error(request, 'boom', status_code=500)
+                publish.assert_not_called()
+            self.assertEqual([call.args[0] for call in publish.call_args_list], [ActivityLog, ErrorLog])
+            publish.reset_mock()
+            with self.assertRaises(ValueError), transaction.atomic():
+                self.record(action='create')
+                async_to_sync(utils.alog_activity)(request, action='create')
+                raise ValueError
+            publish.assert_not_called()
+        self.assertEqual(ActivityLog.objects.count(), 1)
+
+    async def test_requires_admin(self):
+        response = await self.async_client.get(reverse('log-tail'))
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(reverse('log-tail'), {'kind': 'nope'},
+                                                headers={'Authorization': f'Bearer {self.token}'})
+        self.assertEqual(response.status_code, 400)
+
+
+# The requests themselves are not logged here: each logged row would be a
+# new activity version (and an INSERT in the query counts).
+@override_settings(LOG_BUFFER_ENABLED=False, LOG_CACHE_TIMEOUT=30,
+                   LOG_ROUTE_POLICY=[{'route': '*', 'sample_rate': 0, 'always_log_errors': False}])
+class ResponseCacheTest(APITestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        # Sampled-out requests are counted; keep them out of other tests' rollups.
+        rollups.pending.drain()
+        self.addCleanup(rollups.pending.drain)
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        ErrorLog.objects.create(message='boom', endpoint='/api/items/1', status_code=500)
+        caching.invalidate(ErrorLog)
+
+    def get(self, name='error-logs', params=None, **headers):
+        return self.client.get(reverse(name), params or {}, **headers)
+
+    def test_hit_miss_and_invalidation(self):
+        before = caching.stats.stats()
+        first = self.get(params={'status_code': '500', 'page': '1'})
+        with self.assertNumQueries(0):
+            # Same parameters in another order: served from the cache.
+            second = self.get(params={'page': '1', 'status_code': '500'})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        after = caching.stats.stats()
+        self.assertEqual((after['misses'] - before['misses'], after['hits'] - before['hits']), (1, 1))
+
+        request = RequestFactory().get('/x')
+        request.user = AnonymousUser()
+        utils.log_error(request, 'second failure', status_code=500)
+        third = self.get(params={'status_code': '500', 'page': '1'})
+        self.assertEqual(third.data['count'], 2)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+
+    def test_conditional_requests(self):
+        first = self.get()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+        self.assertEqual(self.get(params={'export': 'csv'}).get('ETag'), None)
+
+    def test_last_modified_within_a_second(self):
+        with mock.patch.object(caching, 'time') as clock:
+            clock.time.return_value = 1800000000.3
+            caching.invalidate(ErrorLog)
+            first = self.get()
+            # A write later in the same second is not hidden behind a 304.
+            clock.time.return_value = 1800000000.7
+            ErrorLog.objects.create(message='again', endpoint='/api/items/2', status_code=500)
+            caching.invalidate(ErrorLog)
+            resp = self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+            self.assertEqual((resp.status_code, resp.data['count']), (200, 2))
+            # Once the second is over it is claimed, and answered from the cache.
+            clock.time.return_value = 1800000002.0
+            second = self.get()
+            self.assertNotEqual(second['Last-Modified'], first['Last-Modified'])
+            with self.assertNumQueries(0):
+                self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=second['Last-Modified']).status_code, 304)
+
+    def test_stats_aggregates_cached(self):
+        first = self.get('log-stats')
+        with self.assertNumQueries(0):
+            second = self.get('log-stats')
+        self.assertEqual(second.data['daily_errors'], first.data['daily_errors'])
+        self.assertGreater(second.data['response_cache']['hits'], 0)
+
+
+@override_settings(LOG_BUFFER_ENABLED=False, LOG_CACHE_TIMEOUT=30)
+class LogReadsTest(APITestCase):
+    """Reads of the log API are logged, but polling still hits the cache."""
+
+    def setUp(self):
+        caching.get_cache().clear()
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+        ActivityLog.objects.create(action='read', path='/api/items/1')
+        caching.invalidate(ActivityLog)
+
+    def test_polling_hits_the_cache(self):
+        first = self.client.get(reverse('activity-logs'))
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(reverse('activity-logs'))
+            not_modified = self.client.get(reverse('activity-logs'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(not_modified.status_code, 304)
+        # Only the two audit rows are written; nothing is read.
+        self.assertEqual([q['sql'].split()[0] for q in queries], ['INSERT', 'INSERT'])
+
+    def test_reads_and_exports_are_audited(self):
+        self.client.get(reverse('activity-logs'), {'export': 'csv'})
+        self.client.get(reverse('error-logs'))
+        self.client.get(reverse('log-trace', args=['req-1']))
+        paths = list(ActivityLog.objects.order_by('id').values_list('path', flat=True))
+        self.assertEqual(paths, ['/api/items/1', reverse('activity-logs'), reverse('error-logs'),
+                                 reverse('log-trace', args=['req-1'])])
+        self.assertEqual(ActivityLog.objects.get(path=reverse('activity-logs')).user, self.admin)
+
+
+class SeedLogsTest(TestCase):
+    def setUp(self):
+        ActivityLog._meta.get_field('user_agent').interner.clear()
+        ErrorLog._meta.get_field('user_agent').interner.clear()
+
+    def seed(self, **options):
+        stdout = StringIO()
+        call_command('seed_logs', end='2026-03-01', days=2, seed=7, users=5, paths=20, fingerprints=4,
+                     chunk_size=40, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def rows(self):
+        return (list(ActivityLog.objects.order_by('id').values_list(
+                    'user__username', 'action', 'method', 'path', 'ip_address', 'status_code', 'timestamp')),
+                list(ErrorLog.objects.order_by('id').values_list('group__fingerprint', 'endpoint', 'timestamp')))
+
+    def test_deterministic_rows_within_span(self):
+        output = self.seed(activities=300, errors=60, skip_rollups=True)
+        self.assertIn('activity: 300 rows', output)
+        self.assertIn('error: 60 rows', output)
+        first = self.rows()
+        ActivityLog.objects.all().delete()
+        ErrorLog.objects.all().delete()
+        ErrorGroup.objects.all().delete()
+        self.seed(activities=300, errors=60, skip_rollups=True)
+        self.assertEqual(self.rows(), first)
+
+        stamps = [row[-1] for row in first[0]]
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertGreaterEqual(stamps[0], datetime(2026, 2, 27, tzinfo=dt_timezone.utc))
+        self.assertLess(stamps[-1], datetime(2026, 3, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(User.objects.filter(username__startswith='seed-user-').count(), 5)
+        self.assertEqual(ErrorGroup.objects.aggregate(total=Sum('count'))['total'], 60)
+
+    def test_weights_and_rollups(self):
+        output = self.seed(activities=200, errors=0, actions='read=1,delete=1', statuses='404=1')
+        self.assertIn('rollups:', output)
+        self.assertEqual(set(ActivityLog.objects.values_list('action', 'method', 'status_code').distinct()),
+                         {('read', 'GET', 404), ('delete', 'DELETE', 404)})
+        self.assertEqual(ActivityRollup.objects.filter(granularity='day').aggregate(total=Sum('count'))['total'], 200)
+        with self.assertRaisesMessage(CommandError, 'unknown actions: explode'):
+            self.seed(actions='explode=1')
+
+
+class BodyCaptureTest(APITestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.capture = capture.BodyCapture({'Password', 'token'}, max_bytes=200, max_depth=4, max_string=5,
+                                           max_items=2)
+
+    def post(self, body, content_type='application/json'):
+        return self.factory.generic('POST', '/x', body, content_type=content_type)
+
+    def test_redacts_and_truncates_in_one_walk(self):
+        body = {'user': {'PASSWORD': 'p', 'tokens': [{'token': 't'}]}, 'note': 'abcdefgh', 'ids': [1, 2, 3, 4]}
+        self.assertEqual(self.capture.capture(self.post(json.dumps(body))), {
+            'user': {'PASSWORD': '***', 'tokens': [{'token': '***'}]},
+            'note': 'abcde...[3 more chars]',
+            '...': '[1 more keys]',
+        })
+        self.assertEqual(self.capture.capture(self.post('[[["x"]], [[[["deep"]]]], 3]')),
+                         [[['x']], [[['[nested too deep]']]], '[1 more items]'])
+        self.assertIsNone(self.capture.capture(self.post('{broken')))
+
+    def test_skips_without_reading(self):
+        large = self.post(json.dumps({'blob': 'x' * 500}))
+        self.assertEqual(self.capture.capture(large), '[512 bytes not captured]')
+        for request in (large,
+                        self.factory.post('/x', {'password': 'p', 'file': StringIO('data')}),
+                        self.post('password=p', 'application/x-www-form-urlencoded')):
+            self.capture.capture(request)
+            self.assertFalse(request._read_started)
+
+    @override_settings(LOG_REQUEST_BODY=True, LOG_BUFFER_ENABLED=False)
+    def test_middleware_captures_body_the_view_parsed(self):
+        self.client = self.client_class()
+        self.client.force_authenticate(User.objects.create_user('bob', password='pass'))
+        resp = self.client.post('/api/items/', {'name': 'N', 'description': 'D', 'meta': {'password': 'x'}},
+                                format='json')
+        self.assertEqual(resp.status_code, 201)
+        extra = ActivityLog.objects.get(action='create').extra
+        self.assertEqual(extra['body'], {'name': 'N', 'description': 'D', 'meta': {'password': '***'}})
+        self.assertEqual(utils.sanitize_data({'a': [{'new_password': 'x'}]}), {'a': [{'new_password': '***'}]})
+
+
+@override_settings(LOG_BUFFER_ENABLED=False, LOG_METRICS_DIR=None, LOG_METRICS_TOKEN=None)
+class MetricsTest(APITestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def test_scrape_never_queries(self):
+        self.client.get('/api/items/')
+        self.client.get('/api/items/')
+        request = RequestFactory().get('/api/items/7/')
+        request.user = AnonymousUser()
+        utils.log_error(request, 'boom', stack_trace='KeyError: boom', status_code=500)
+        logged = ActivityLog.objects.count()
+
+        with self.assertNumQueries(0):
+            resp = self.client.get('/metrics')
+        self.assertEqual(resp['Content-Type'], metrics.CONTENT_TYPE)
+        text = resp.content.decode()
+        self.assertIn('monitoring_requests_total{route="/api/items/",method="GET",status="401"} 2', text)
+        fingerprint = ErrorGroup.objects.get().fingerprint
+        self.assertIn(f'monitoring_errors_total{{fingerprint="{fingerprint}",exception="KeyError"}} 1', text)
+        self.assertIn('monitoring_log_write_seconds_count{table="activitylog",mode="direct"} 2', text)
+        self.assertIn('monitoring_log_write_seconds_bucket{table="activitylog",mode="direct",le="+Inf"} 2', text)
+        self.assertIn('# TYPE monitoring_log_queue_depth gauge', text)
+        # The scrape itself is counted but not logged.
+        self.assertEqual(ActivityLog.objects.count(), logged)
+        self.assertIn('route="/metrics",method="GET",status="200"} 1', self.client.get('/metrics').content.decode())
+
+    def test_unknown_methods_share_a_label(self):
+        latency.recorder.clear()
+        self.addCleanup(latency.recorder.clear)
+        self.client.generic('FOO', '/api/items/')
+        self.client.generic('BAR', '/api/items/')
+        text = metrics.registry.render()
+        self.assertIn('monitoring_requests_total{route="/api/items/",method="other",status="401"} 2', text)
+        self.assertNotIn('FOO', text)
+        self.assertEqual({name for name, _ in latency.recorder.snapshot()}, {'other /api/items/'})
+
+    @override_settings(LOG_METRICS_TOKEN='s3cret')
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    def test_buffer_queue_depth(self):
+        writer = BufferedLogWriter(ActivityLog, max_size=10)
+        writer.submit(ActivityLog(action='read'))
+        writer.submit(ActivityLog(action='read'))
+        self.assertIn('monitoring_log_queue_depth{table="activitylog"} 2', metrics.registry.render())
+        writer.flush()
+        text = metrics.registry.render()
+        self.assertIn('monitoring_log_queue_depth{table="activitylog"} 0', text)
+        self.assertIn('monitoring_log_write_seconds_count{table="activitylog",mode="buffered"} 1', text)
+
+
+class MultiprocessMetricsTest(SimpleTestCase):
+    def test_workers_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        registry = metrics.Registry(directory)
+        self.addCleanup(registry.reset)
+        hits = registry.counter('hits_total', 'Hits.', ('route',))
+        depth = registry.gauge('depth', 'Depth.')
+        latency_hist = registry.histogram('write_seconds', 'Writes.', buckets=(0.1, 1))
+        hits.inc(('/a',))
+        depth.set((), 3)
+        latency_hist.observe((), 0.05)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                hits.inc(('/a',), 2)
+                hits.inc(('/b "x"',))
+                depth.set((), 5)
+                latency_hist.observe((), 0.5)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(len(os.listdir(directory)), 4)
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP hits_total Hits.',
+            '# TYPE hits_total counter',
+            'hits_total{route="/a"} 3',
+            'hits_total{route="/b \\"x\\""} 1',
+            '# HELP depth Depth.',
+            '# TYPE depth gauge',
+            # The exited worker's gauge is dropped.
+            'depth 3',
+            '# HELP write_seconds Writes.',
+            '# TYPE write_seconds histogram',
+            'write_seconds_bucket{le="0.1"} 1',
+            'write_seconds_bucket{le="1.0"} 2',
+            'write_seconds_bucket{le="+Inf"} 2',
+            'write_seconds_sum 0.55',
+            'write_seconds_count 2',
+        ])
+
+
+# The admin pages' own requests are kept out of the table under test.
+@override_settings(LOG_BUFFER_ENABLED=False, TIME_ZONE='UTC',
+                   LOG_ROUTE_POLICY=[{'route': 'admin:*', 'sample_rate': 0, 'always_log_errors': False}])
+class AdminPerformanceTest(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        rollups.pending.drain()
+        self.addCleanup(rollups.pending.drain)
+        ActivityLog._meta.get_field('user_agent').interner.clear()
+        self.admin = User.objects.create_superuser('root', password='pass')
+        self.client.force_login(self.admin)
+        ActivityLog.objects.all().delete()
+        base = datetime(2026, 2, 27, 12, tzinfo=dt_timezone.utc)
+        rows = [ActivityLog(user=self.admin if i % 2 else None, action='read', method='GET', path=f'/api/items/{i}/',
+                            status_code=500 if i == 3 else 200) for i in range(6)]
+        ActivityLog.objects.bulk_create(rows)
+        for i, row in enumerate(ActivityLog.objects.order_by('id')):
+            ActivityLog.objects.filter(pk=row.pk).update(timestamp=base + timedelta(days=i // 2))
+        rollups.refresh()
+
+    def changelist(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/monitoring/activitylog/{query}')
+        self.assertEqual(response.status_code, 200)
+        log_queries = [q['sql'] for q in queries if 'monitoring_activitylog' in q['sql']]
+        return response, log_queries
+
+    def test_no_table_scans(self):
+        response, log_queries = self.changelist()
+        # Id span, a count capped by LIMIT, the page with users joined, the oldest and newest rows; no DISTINCT.
+        self.assertEqual(len([q for q in log_queries if q.startswith('SELECT')]), 6)
+        self.assertFalse([q for q in log_queries if 'DISTINCT' in q])
+        self.assertTrue(all('LIMIT' in q for q in log_queries if 'COUNT(' in q))
+        self.assertEqual(response.context['cl'].result_count, 6)
+        self.assertContains(response, '2xx (5)')
+        self.assertContains(response, '5xx (1)')
+        # Dates of the drilldown come from the hourly rollups.
+        self.assertContains(response, 'timestamp__month=2')
+        self.assertContains(response, 'timestamp__month=3')
+
+        response, _ = self.changelist('?timestamp__year=2026&timestamp__month=2')
+        self.assertContains(response, 'timestamp__day=27')
+        self.assertContains(response, 'timestamp__day=28')
+        self.assertNotContains(response, 'timestamp__day=1"')
+        response, _ = self.changelist('?timestamp__year=2026&timestamp__month=2&timestamp__day=28&status_class=5')
+        self.assertEqual([r.path for r in response.context['cl'].result_list], ['/api/items/3/'])
+
+    def test_dates_newer_than_rollups(self):
+        for day in (2, 5):
+            row = ActivityLog.objects.create(action='read', method='GET', path=f'/api/items/new-{day}/')
+            ActivityLog.objects.filter(pk=row.pk).update(timestamp=datetime(2026, 4, day, 9, tzinfo=dt_timezone.utc))
+        response, _ = self.changelist()
+        self.assertContains(response, 'timestamp__month=4')
+        response, _ = self.changelist('?timestamp__year=2026&timestamp__month=4')
+        self.assertContains(response, 'timestamp__day=2')
+        self.assertContains(response, 'timestamp__day=5')
+        for day in (1, 3, 4):
+            self.assertNotContains(response, f'timestamp__day={day}"')
+
+        # Without rollups every choice comes from live rows.
+        ActivityRollup.objects.all().delete()
+        response, _ = self.changelist('?timestamp__year=2026&timestamp__month=2')
+        self.assertContains(response, 'timestamp__day=27')
+        self.assertContains(response, 'timestamp__day=28')
+        self.assertNotContains(response, 'timestamp__day=26"')
+
+    @override_settings(LOG_ADMIN_COUNT_LIMIT=3)
+    def test_counts(self):
+        ActivityLog.objects.filter(path='/api/items/1/').delete()
+        # Unfiltered: estimated from the id span while a sampled count agrees, deleted row included.
+        with mock.patch.object(db, 'COUNT_SAMPLE', 1):
+            self.assertEqual(self.changelist()[0].context['cl'].result_count, 6)
+            # Too few rows to sample: counted up to the limit.
+            with mock.patch.object(db, 'COUNT_SAMPLE', 2):
+                self.assertEqual(self.changelist()[0].context['cl'].result_count, 3)
+        # Filtered: counted up to the limit and cached.
+        self.assertEqual(self.changelist('?action__exact=read')[0].context['cl'].result_count, 3)
+        self.assertEqual(self.changelist('?status_class=5')[0].context['cl'].result_count, 1)
+        _, log_queries = self.changelist('?status_class=5')
+        self.assertFalse([q for q in log_queries if 'COUNT(' in q])
+
+        # A gap the sampled count sees: counted instead.
+        ActivityLog.objects.filter(path__in=['/api/items/2/', '/api/items/3/', '/api/items/4/']).delete()
+        caching.get_cache().clear()
+        with mock.patch.object(db, 'COUNT_SAMPLE', 1):
+            self.assertEqual(self.changelist()[0].context['cl'].result_count, 2)
+
+    @override_settings(LOG_ADMIN_PERFORMANCE_MODE=False)
+    def test_stock_mode(self):
+        response, log_queries = self.changelist()
+        self.assertEqual(response.context['cl'].result_count, 6)
+        self.assertTrue([q for q in log_queries if 'COUNT(' in q])
+
+
+@override_settings(LOG_BUFFER_ENABLED=False)
+class RequestTraceTest(APITestCase):
+    def setUp(self):
+        utils.error_sampler.clear()
+        self.admin = User.objects.create_user('admin', password='pass', is_staff=True)
+        self.client.force_authenticate(self.admin)
+
+    def test_request_id_is_stored_and_returned(self):
+        resp = self.client.get('/api/items/', headers={'X-Request-ID': 'edge-42'})
+        self.assertEqual(resp['X-Request-ID'], 'edge-42')
+        self.assertEqual(ActivityLog.objects.get().request_id, 'edge-42')
+
+        # Unusable incoming ids are replaced, not stored.
+        resp = self.client.get('/api/items/', headers={'X-Request-ID': 'no spaces allowed'})
+        self.assertRegex(resp['X-Request-ID'], r'^[0-9a-f]{32}$')
+        self.assertTrue(ActivityLog.objects.filter(request_id=resp['X-Request-ID']).exists())
+
+    def test_trace_joins_activity_and_errors_by_index(self):
+        with override_settings(ROOT_URLCONF='monitoring.tests'):
+            resp = self.client.get('/broken', headers={'X-Request-ID': 'trace-1'})
+        self.assertEqual((resp.status_code, resp['X-Request-ID']), (500, 'trace-1'))
+        self.client.get('/api/items/', headers={'X-Request-ID': 'other'})
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('log-trace', args=['trace-1']))
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([(row['path'], row['status_code']) for row in data['activities']], [('/broken', 500)])
+        self.assertEqual([(row['endpoint'], row['message']) for row in data['errors']], [('/broken', 'boom')])
+        self.assertEqual(data['errors'][0]['request_id'], 'trace-1')
+
+        lookups = [q['sql'] for q in queries if '"request_id" =' in q['sql']]
+        self.assertEqual(len(lookups), 2)
+        if connection.vendor == 'sqlite':
+            for sql in lookups:
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql.replace("'trace-1'", '%s'), ['trace-1'])
+                    plan = [row[-1] for row in cursor.fetchall()]
+                self.assertFalse(any(step.startswith('SCAN') or 'TEMP B-TREE' in step for step in plan), plan)
+
+    def test_invalid_trace_id(self):
+        self.assertEqual(self.client.get(reverse('log-trace', args=['a' * 65])).status_code, 400)
+
+
+class RateDetectorTest(SimpleTestCase):
+    def feed(self, detector, key, start, count, window=60):
+        """``count`` events spread over the window starting at ``start``; the spikes reported."""
+        return [spike for i in range(count) if (spike := detector.observe(key, start + i * window / count))]
+
+    def test_spike_over_baseline(self):
+        detector = anomaly.RateDetector(window=60, alpha=0.5, factor=3, min_count=5, warmup=2)
+        for minute in range(4):
+            self.assertEqual(self.feed(detector, 'checkout', minute * 60, 4), [])
+        # Baseline is 4 per window; 30 events in the next one fire once.
+        spikes = self.feed(detector, 'checkout', 240, 30)
+        self.assertEqual(len(spikes), 1)
+        rate, baseline = spikes[0]
+        self.assertGreater(rate, 3 * baseline)
+        self.assertAlmostEqual(baseline, 3.75)
+        self.assertEqual(detector.stats(), {'keys': 1, 'spikes': 1})
+
+    def test_warmup_and_min_count(self):
+        detector = anomaly.RateDetector(window=60, factor=3, min_count=5, warmup=2)
+        self.assertEqual(self.feed(detector, 'a', 0, 20), [])
+        self.assertEqual(self.feed(detector, 'b', 120, 4), [])
+        self.assertEqual(len(self.feed(detector, 'b', 180, 20)), 1)
+
+    def test_idle_windows_decay_baseline(self):
+        detector = anomaly.RateDetector(window=60, alpha=0.5, factor=3, min_count=5, warmup=0)
+        for minute in range(3):
+            self.feed(detector, 'k', minute * 60, 40)
+        # Ten idle windows later the baseline has decayed to nearly nothing.
+        spikes = self.feed(detector, 'k', 780, 10)
+        self.assertEqual(len(spikes), 1)
+        self.assertLess(spikes[0][1], 0.1)
+
+    def test_cold_keys_are_evicted(self):
+        detector = anomaly.RateDetector(max_keys=2)
+        for i, key in enumerate(['a', 'b', 'a', 'c']):
+            detector.observe(key, i)
+        self.assertEqual(list(detector._keys), ['a', 'c'])
+
+
+@override_settings(ROOT_URLCONF='monitoring.tests', LOG_BUFFER_ENABLED=False)
+class ErrorRateAlertTest(TestCase):
+    def setUp(self):
+        utils.error_sampler.clear()
+        detector = anomaly.RateDetector(min_count=3, warmup=0)
+        patcher = mock.patch.object(anomaly, 'detector', detector)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_failing_endpoint_alerts_once(self):
+        with mock.patch.object(get_dispatcher(), 'notify') as notify:
+            for _ in range(5):
+                self.assertEqual(self.client.get('/broken').status_code, 500)
+        keys = sorted(call.kwargs['key'] for call in notify.call_args_list)
+        fingerprint = ErrorLog.objects.values_list('group__fingerprint', flat=True).first()
+        self.assertEqual(keys, ['error-rate:endpoint:GET /broken', f'error-rate:fingerprint:{fingerprint}'])
+        texts = {call.kwargs['key']: call.args[1] for call in notify.call_args_list}
+        self.assertIn('RuntimeError at /broken: boom', texts[f'error-rate:fingerprint:{fingerprint}'])
+        self.assertEqual(anomaly.detector.stats(), {'keys': 2, 'spikes': 2})
+
+    @override_settings(LOG_ANOMALY_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(5):
+            self.client.get('/broken')
+        self.assertEqual(anomaly.detector.stats(), {'keys': 0, 'spikes': 0})
@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     LoginView, logout_view, MeProfileView,
-    ItemViewSet, ActivityLogListView, ErrorLogListView, LogStatsView
+    ItemViewSet, ActivityLogListView, ErrorLogListView, LogStatsView, LatencyView,
+    LogIngestView, LogTraceView, log_tail,
 )
 
 router = DefaultRouter()
@@ -15,5 +16,9 @@ urlpatterns = [
     path('logs/activities', ActivityLogListView.as_view(), name='activity-logs'),
     path('logs/errors', ErrorLogListView.as_view(), name='error-logs'),
     path('logs/stats', LogStatsView.as_view(), name='log-stats'),
+    path('logs/latency', LatencyView.as_view(), name='log-latency'),
+    path('logs/ingest', LogIngestView.as_view(), name='log-ingest'),
+    path('logs/tail', log_tail, name='log-tail'),
+    path('logs/trace/<str:request_id>', LogTraceView.as_view(), name='log-trace'),
     path('', include(router.urls)),
 ]
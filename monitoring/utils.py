@@ -1,15 +1,23 @@
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject, empty
 from django.utils.timezone import now
-from .models import ActivityLog, ErrorLog
-import json, traceback
-from django.core.mail import mail_admins
-import threading
-try:
-    import requests
-except Exception:
-    requests = None
+from .models import ActivityLog, ErrorLog, ErrorGroup
+from .buffer import buffering_enabled, get_writer
+from .notifications import get_dispatcher
+from . import anomaly, caching, capture, fingerprints, metrics, policy, tail
+import functools, ipaddress, json, re, time, traceback, uuid
 
 SENSITIVE_KEYS = getattr(settings, 'SENSITIVE_KEYS', {'password'})
+_redactor = capture.BodyCapture(SENSITIVE_KEYS)
+
+error_sampler = fingerprints.OccurrenceSampler(
+    limit=getattr(settings, 'LOG_ERROR_SAMPLE_LIMIT', 5),
+    window=getattr(settings, 'LOG_ERROR_SAMPLE_WINDOW', 60.0),
+)
+_error_group_ids = {}
 
 def get_client_ip(request):
     xff = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -17,58 +25,200 @@ def get_client_ip(request):
         return xff.split(',')[0].strip()
     return request.META.get('REMOTE_ADDR')
 
+_REQUEST_ID = re.compile(r'^[\w.:-]{1,64}$')
+
+def is_request_id(value):
+    return isinstance(value, str) and bool(_REQUEST_ID.match(value))
+
+@functools.lru_cache(maxsize=8)
+def _networks(proxies):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+def from_trusted_proxy(request):
+    """Whether the direct peer is one of ``LOG_TRUSTED_PROXIES`` (addresses or CIDR ranges)."""
+    proxies = tuple(getattr(settings, 'LOG_TRUSTED_PROXIES', ()))
+    if not proxies:
+        return False
+    try:
+        peer = ipaddress.ip_address(request.META.get('REMOTE_ADDR') or '')
+    except ValueError:
+        return False
+    return any(peer in network for network in _networks(proxies))
+
+def get_request_id(request):
+    """The ``X-Request-ID`` set by a trusted proxy when it looks sane, else a fresh one.
+
+    Sampling is keyed on this id, so a header straight from a client is
+    ignored: a caller could otherwise pick an id that is always sampled out.
+    """
+    request_id = getattr(request, 'request_id', None)
+    if request_id is None:
+        header = request.META.get('HTTP_X_REQUEST_ID', '')
+        trusted = is_request_id(header) and from_trusted_proxy(request)
+        request_id = header if trusted else uuid.uuid4().hex
+        request.request_id = request_id
+    return request_id
+
 def sanitize_data(data):
+    """Copy of ``data`` with sensitive keys redacted at any depth."""
     if not isinstance(data, dict):
         return None
-    sanitized = {}
-    for k, v in data.items():
-        if k.lower() in SENSITIVE_KEYS:
-            sanitized[k] = '***'
-        else:
-            sanitized[k] = v
-    return sanitized
+    return _redactor.redact(data)
 
-def log_activity(request, action='other', status_code=200, extra=None):
-    try:
-        ActivityLog.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            action=action,
-            method=request.method,
-            path=request.path,
-            ip_address=get_client_ip(request),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            status_code=status_code,
-            extra=extra or {},
+def _request_user(request):
+    user = getattr(request, 'user', None)
+    return user if user is not None and user.is_authenticated else None
+
+async def _arequest_user(request):
+    # An untouched lazy session user would hit the DB from the event loop.
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return await sync_to_async(_request_user)(request)
+    return _request_user(request)
+
+def _activity_record(request, user, action, status_code, extra, timing=None):
+    record = ActivityLog(
+        user=user,
+        action=action,
+        method=request.method or '',
+        path=request.path,
+        ip_address=get_client_ip(request),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        status_code=status_code,
+        timestamp=now(),
+        extra=extra or {},
+        request_id=get_request_id(request),
+    )
+    record.log_read = policy.is_log_read(request)
+    if timing is not None:
+        record.duration_ms = timing.duration_ms
+        record.db_queries = timing.db_queries
+        record.db_time_ms = timing.db_time_ms
+    return record
+
+def _error_record(request, user, message, stack_trace, status_code):
+    return ErrorLog(
+        user=user,
+        message=message,
+        stack_trace=stack_trace[:15000],
+        method=getattr(request, 'method', ''),
+        endpoint=getattr(request, 'path', ''),
+        ip_address=get_client_ip(request) if request else None,
+        user_agent=request.META.get('HTTP_USER_AGENT', '') if request else '',
+        status_code=status_code,
+        timestamp=now(),
+        request_id=get_request_id(request) if request else None,
+    )
+
+def _error_group_id(fingerprint, record, exception_type):
+    # The common case for a repeating error is this single UPDATE.
+    seen = ErrorGroup.objects.filter(fingerprint=fingerprint).update(
+        count=F('count') + 1, last_seen=record.timestamp,
+    )
+    if seen:
+        group_id = _error_group_ids.get(fingerprint)
+        if group_id is None:
+            group_id = ErrorGroup.objects.values_list('id', flat=True).get(fingerprint=fingerprint)
+    else:
+        group, created = ErrorGroup.objects.get_or_create(fingerprint=fingerprint, defaults={
+            'exception_type': exception_type[:255],
+            'message': record.message[:2000],
+            'endpoint': fingerprints.normalize_endpoint(record.endpoint)[:512],
+            'status_code': record.status_code,
+            'first_seen': record.timestamp,
+            'last_seen': record.timestamp,
+        })
+        if not created:
+            ErrorGroup.objects.filter(pk=group.pk).update(count=F('count') + 1, last_seen=record.timestamp)
+        group_id = group.pk
+    if len(_error_group_ids) > 10000:
+        _error_group_ids.clear()
+    _error_group_ids[fingerprint] = group_id
+    return group_id
+
+def _store_error(record, exception=None):
+    fingerprint, exception_type = fingerprints.compute(
+        record.message, record.endpoint, exception=exception, stack_trace=record.stack_trace,
+    )
+    metrics.errors.inc((fingerprint, exception_type))
+    track_error_rate('fingerprint', fingerprint,
+                     f'{exception_type or "Error"} at {record.endpoint}: {record.message[:200]}')
+    weight = error_sampler.sample(fingerprint, time.monotonic())
+    if not weight:
+        ErrorGroup.objects.filter(fingerprint=fingerprint).update(
+            count=F('count') + 1, last_seen=record.timestamp,
         )
+        caching.invalidate(ErrorLog)
+        return
+    started = time.perf_counter()
+    record.group_id = _error_group_id(fingerprint, record, exception_type)
+    record.occurrences = weight
+    record.save()
+    metrics.log_write_seconds.observe(('errorlog', 'direct'), time.perf_counter() - started)
+    caching.invalidate(ErrorLog)
+    # Subscribers only see rows that were committed.
+    transaction.on_commit(lambda: tail.publish(ErrorLog, [record]), using=record._state.db)
+
+def _save_activity(record):
+    started = time.perf_counter()
+    record.save()
+    metrics.log_write_seconds.observe(('activitylog', 'direct'), time.perf_counter() - started)
+    if not record.log_read:
+        caching.invalidate(ActivityLog)
+    # Subscribers only see rows that were committed.
+    transaction.on_commit(lambda: tail.publish(ActivityLog, [record]), using=record._state.db)
+
+def log_activity(request, action='other', status_code=200, extra=None, timing=None):
+    try:
+        record = _activity_record(request, _request_user(request), action, status_code, extra, timing)
+        if buffering_enabled():
+            get_writer(ActivityLog).submit(record)
+        else:
+            _save_activity(record)
     except Exception:
         # Avoid breaking app if logging fails
         pass
 
-def log_error(request, message, stack_trace='', status_code=None):
+async def alog_activity(request, action='other', status_code=200, extra=None, timing=None):
     try:
-        ErrorLog.objects.create(
-            user=request.user if request.user.is_authenticated else None,
-            message=message,
-            stack_trace=stack_trace[:15000],
-            method=getattr(request, 'method', ''),
-            endpoint=getattr(request, 'path', ''),
-            ip_address=get_client_ip(request) if request else None,
-            user_agent=request.META.get('HTTP_USER_AGENT', '') if request else '',
-            status_code=status_code,
-        )
+        record = _activity_record(request, await _arequest_user(request), action, status_code, extra, timing)
+        if buffering_enabled():
+            # Never park the event loop waiting for queue space.
+            get_writer(ActivityLog).submit(record, block=False)
+        else:
+            # One hop to the connection's thread for the save and the commit hook.
+            await sync_to_async(_save_activity)(record)
     except Exception:
         pass
 
-def notify_critical_async(subject, text):
-    def _send():
-        try:
-            mail_admins(subject, text, fail_silently=True)
-        except Exception:
-            pass
-        webhook = getattr(settings, 'SLACK_WEBHOOK_URL', '')
-        if webhook and requests:
-            try:
-                requests.post(webhook, json={'text': f'*{subject}*\n{text}'}, timeout=3)
-            except Exception:
-                pass
-    threading.Thread(target=_send, daemon=True).start()
+def log_error(request, message, stack_trace='', status_code=None, exception=None):
+    try:
+        record = _error_record(request, _request_user(request), message, stack_trace, status_code)
+        _store_error(record, exception)
+    except Exception:
+        pass
+
+def notify_critical_async(subject, text, key=None):
+    """Queue an alert; repeats for the same ``key`` are rate limited and coalesced."""
+    try:
+        return get_dispatcher().notify(subject, text, key=key)
+    except Exception:
+        return False
+
+def track_error_rate(kind, name, detail=''):
+    """Count an error for ``kind`` (``endpoint`` or ``fingerprint``) ``name``; alert on a spike."""
+    if not getattr(settings, 'LOG_ANOMALY_ENABLED', True):
+        return
+    try:
+        detector = anomaly.detector
+        spike = detector.observe((kind, name), time.monotonic())
+        if spike is None:
+            return
+        rate, baseline = spike
+        text = (f'{rate:.0f} errors for {kind} {name} in the last {detector.window:g}s, '
+                f'usually {baseline:.1f}.')
+        if detail:
+            text = f'{text}\n\n{detail}'
+        notify_critical_async(f'Error rate spike: {name}', text, key=f'error-rate:{kind}:{name}')
+    except Exception:
+        pass
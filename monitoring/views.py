@@ -1,12 +1,25 @@
-from datetime import datetime
-from django.utils.dateparse import parse_datetime
+import asyncio
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.db import models
-from django.db.models import Count
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDate
+from django.core.handlers.asgi import ASGIRequest
 from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_safe
+from asgiref.sync import sync_to_async
 
 from rest_framework import serializers, generics, permissions, viewsets
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.exceptions import APIException
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -15,11 +28,14 @@ from django.contrib.auth import get_user_model
 
 from .serializers import (
     UserSerializer, ProfileUpdateSerializer,
-    ActivityLogSerializer, ErrorLogSerializer
+    ActivityLogSerializer, ErrorLogSerializer, ErrorGroupSerializer
 )
-from .models import ActivityLog, ErrorLog
+from .models import ActivityLog, ErrorLog, ErrorGroup, ActivityRollup, ErrorRollup
+from .pagination import KeysetPagination
 from .permissions import IsAdmin
-from .utils import log_activity
+from .notifications import get_dispatcher
+from .utils import is_request_id, log_activity
+from . import anomaly, archive, buffer, caching, db, exports, ingest, latency, metrics, policy, rollups, search, tail
 
 User = get_user_model()
 
@@ -77,12 +93,114 @@ class ItemViewSet(viewsets.ModelViewSet):
 
 
 
-class ActivityLogListView(generics.ListAPIView):
+def parse_bound(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({'detail': f'Invalid date: {value}'})
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def search_queryset(view, index, qs):
+    """Apply ``?q=``; results are ranked unless paginated by cursor or exported."""
+    q = view.request.query_params.get('q')
+    rank = not view.use_keyset_pagination() and 'export' not in view.request.query_params
+    return index.filter(qs, q, rank=rank)
+
+
+class LogPaginationMixin:
+    def use_keyset_pagination(self):
+        return KeysetPagination.is_requested(self.request)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator') and self.use_keyset_pagination():
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+    def paginate_rows(self, queryset, row_format):
+        """A page of ``queryset`` read through ``row_format`` instead of the serializer."""
+        if self.paginator is None:
+            return None
+        if self.use_keyset_pagination():
+            return self.paginator.paginate_queryset(queryset, self.request, view=self, row_format=row_format)
+        return self.paginate_queryset(exports.FormattedRows(queryset, row_format))
+
+    def fast_list(self, row_format):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_rows(queryset, row_format)
+        if page is None:
+            return Response(list(row_format.rows(queryset)))
+        return self.get_paginated_response(page)
+
+
+class ArchiveMixin:
+    """Extends list and export results into archived segments.
+
+    Archived rows are only consulted when the request has a ``date_from`` and
+    segments exist for days in the requested range; they follow the live
+    rows, newest first, and are already in the serializer's output shape.
+    """
+    archive_kind = None
+    search_index = None
+
+    def archive_predicate(self):
+        return None
+
+    def search_predicate(self, predicate):
+        q = self.request.query_params.get('q')
+        if not search.tokens(q):
+            return predicate
+        index = self.search_index
+        return lambda row: index.matches(row, q) and (predicate is None or predicate(row))
+
+    def archived_rows(self):
+        params = self.request.query_params
+        date_from = parse_bound(params.get('date_from'))
+        if date_from is None:
+            return None
+        date_to = parse_bound(params.get('date_to'))
+        predicate = self.search_predicate(self.archive_predicate())
+        return archive.ArchivedRows(self.archive_kind, date_from, date_to, predicate) or None
+
+    def archive_aware_list(self, archived, row_format):
+        results = archive.ArchiveAwareResults(
+            self.filter_queryset(self.get_queryset()), archived,
+            lambda qs: list(row_format.rows(qs)),
+        )
+        page = self.paginate_queryset(results)
+        if page is None:
+            return Response(list(results[0:len(results)]))
+        return self.get_paginated_response(page)
+
+    def export_or_list(self, request, spec, *args, **kwargs):
+        export = request.query_params.get('export')
+        archived = self.archived_rows()
+        if export in exports.FORMATS:
+            return exports.export_response(
+                self.get_queryset(), export, spec,
+                compress=request.query_params.get('gzip') == '1',
+                archived=archived,
+            )
+        if archived is not None and not self.use_keyset_pagination():
+            return self.archive_aware_list(archived, spec.row_format)
+        # Same output as the serializers, from values_list rows.
+        return self.fast_list(spec.row_format)
+
+
+@policy.log_read
+class ActivityLogListView(ArchiveMixin, LogPaginationMixin, generics.ListAPIView):
     serializer_class = ActivityLogSerializer
     permission_classes = [IsAdmin]
 
     def get_queryset(self):
-        qs = ActivityLog.objects.select_related('user')
+        qs = db.with_users(ActivityLog.objects.all())
         user_id = self.request.query_params.get('user_id')
         action = self.request.query_params.get('action')
         date_from = self.request.query_params.get('date_from')
@@ -96,81 +214,323 @@ class ActivityLogListView(generics.ListAPIView):
             qs = qs.filter(timestamp__gte=date_from)
         if date_to:
             qs = qs.filter(timestamp__lte=date_to)
-        return qs
+        return search_queryset(self, search.activity, qs)
+
+    archive_kind = 'activity'
+    search_index = search.activity
+    uncached_params = ('export',)
+
+    def archive_predicate(self):
+        user_id = self.request.query_params.get('user_id')
+        action = self.request.query_params.get('action')
+
+        def predicate(row):
+            if user_id and not (row['user'] and str(row['user']['id']) == user_id):
+                return False
+            return not action or row['action'] == action
+        return predicate
 
+    @caching.cached_response('activity')
     def list(self, request, *args, **kwargs):
-        export = request.query_params.get('export')
-        qs = self.get_queryset()
-        if export == 'csv':
-            import csv
-            from io import StringIO
-            f = StringIO()
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'user_id', 'action', 'method', 'path', 'ip_address', 'status_code'])
-            for log in qs:
-                writer.writerow([
-                    log.timestamp, log.user_id, log.action,
-                    log.method, log.path, log.ip_address, log.status_code
-                ])
-            resp = HttpResponse(f.getvalue(), content_type='text/csv')
-            resp['Content-Disposition'] = 'attachment; filename=activity_logs.csv'
-            return resp
-
-        if export == 'json':
-            data = ActivityLogSerializer(qs, many=True).data
-            return JsonResponse(data, safe=False)
-
-        return super().list(request, *args, **kwargs)
-
-
-class ErrorLogListView(generics.ListAPIView):
+        return self.export_or_list(request, exports.ACTIVITY_EXPORT, *args, **kwargs)
+
+
+@policy.log_read
+class ErrorLogListView(ArchiveMixin, LogPaginationMixin, generics.ListAPIView):
     serializer_class = ErrorLogSerializer
     permission_classes = [IsAdmin]
 
+    def grouped(self):
+        return self.request.query_params.get('grouped') == '1'
+
+    def use_keyset_pagination(self):
+        return not self.grouped() and super().use_keyset_pagination()
+
+    def get_serializer_class(self):
+        return ErrorGroupSerializer if self.grouped() else ErrorLogSerializer
+
     def get_queryset(self):
-        qs = ErrorLog.objects.select_related('user')
+        status_code = self.request.query_params.get('status_code')
         date_from = self.request.query_params.get('date_from')
         date_to = self.request.query_params.get('date_to')
+        if self.grouped():
+            qs = ErrorGroup.objects.all()
+            if status_code:
+                qs = qs.filter(status_code=status_code)
+            if date_from:
+                qs = qs.filter(last_seen__gte=date_from)
+            if date_to:
+                qs = qs.filter(first_seen__lte=date_to)
+            # One row per distinct error, so a plain scan is cheap here.
+            for word in search.tokens(self.request.query_params.get('q')):
+                qs = qs.filter(Q(message__icontains=word) | Q(endpoint__icontains=word))
+            return qs
+
+        qs = db.with_users(ErrorLog.objects.all())
+        fingerprint = self.request.query_params.get('fingerprint')
+        if fingerprint:
+            qs = qs.filter(group__fingerprint=fingerprint)
+        if status_code:
+            qs = qs.filter(status_code=status_code)
         if date_from:
             qs = qs.filter(timestamp__gte=date_from)
         if date_to:
             qs = qs.filter(timestamp__lte=date_to)
-        return qs
+        return search_queryset(self, search.errors, qs)
+
+    archive_kind = 'error'
+    search_index = search.errors
+    uncached_params = ('export',)
 
+    def archive_predicate(self):
+        status_code = self.request.query_params.get('status_code')
+        fingerprint = self.request.query_params.get('fingerprint')
+        group_id = None
+        if fingerprint:
+            group_id = ErrorGroup.objects.filter(fingerprint=fingerprint).values_list('id', flat=True).first()
+
+        def predicate(row):
+            if status_code and str(row['status_code']) != status_code:
+                return False
+            return not fingerprint or (group_id is not None and row.get('group') == group_id)
+        return predicate
+
+    def archived_rows(self):
+        return None if self.grouped() else super().archived_rows()
+
+    @caching.cached_response('error')
     def list(self, request, *args, **kwargs):
-        export = request.query_params.get('export')
-        qs = self.get_queryset()
-        if export == 'csv':
-            import csv
-            from io import StringIO
-            f = StringIO()
-            writer = csv.writer(f)
-            writer.writerow(['timestamp', 'user_id', 'message', 'endpoint', 'status_code'])
-            for log in qs:
-                writer.writerow([log.timestamp, log.user_id, log.message, log.endpoint, log.status_code])
-            resp = HttpResponse(f.getvalue(), content_type='text/csv')
-            resp['Content-Disposition'] = 'attachment; filename=error_logs.csv'
-            return resp
-
-        if export == 'json':
-            data = ErrorLogSerializer(qs, many=True).data
-            return JsonResponse(data, safe=False)
-
-        return super().list(request, *args, **kwargs)
+        if self.grouped():
+            return super(ArchiveMixin, self).list(request, *args, **kwargs)
+        return self.export_or_list(request, exports.ERROR_EXPORT, *args, **kwargs)
 
 
+@policy.log_read
 class LogStatsView(generics.GenericAPIView):
     permission_classes = [IsAdmin]
+    # Series default to a window sized for the granularity; totals span all time.
+    default_windows = {
+        'minute': timedelta(hours=1),
+        'hour': timedelta(days=2),
+        'day': None,
+    }
 
     def get(self, request):
-        by_action = ActivityLog.objects.values('action').annotate(total=Count('id')).order_by('-total')
-        daily_errors = (
-            ErrorLog.objects.extra(select={'date': "date(timestamp)"})
-            .values('date')
-            .annotate(total=Count('id'))
-            .order_by('date')
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in rollups.GRANULARITIES:
+            raise ValidationError({'granularity': f'Expected one of {", ".join(rollups.GRANULARITIES)}'})
+        date_from = parse_bound(request.query_params.get('date_from'))
+        date_to = parse_bound(request.query_params.get('date_to'))
+
+        # Live counters below are always current; the rollup queries are cached.
+        data = caching.cached_data(request, ('activity', 'error'),
+                                   lambda: self.aggregates(granularity, date_from, date_to), scope='stats')
+        return Response({
+            **data,
+            'granularity': granularity,
+            'log_buffer': buffer.stats(),
+            'sampling': {**policy.sampling.stats(), 'pending': rollups.pending.total()},
+            'notifications': get_dispatcher().stats(),
+            'tail': tail.broker.stats(),
+            'anomalies': anomaly.detector.stats(),
+            'response_cache': caching.stats.stats(),
+        })
+
+    def aggregates(self, granularity, date_from, date_to):
+        # Read-only: rollups are brought up to date by buffer flushes and
+        # `rollup_logs`, never by a GET. Rows past their checkpoint are
+        # counted here instead (up to LOG_STATS_UNFOLDED_LIMIT per table).
+        limit = getattr(settings, 'LOG_STATS_UNFOLDED_LIMIT', 10000)
+        unfolded = {ActivityRollup: rollups.activity.unfolded(limit), ErrorRollup: rollups.errors.unfolded(limit)}
+
+        def start_of(granularity, default_window=None):
+            start = date_from
+            if start is None and default_window is not None:
+                start = timezone.now() - default_window
+            return None if start is None else rollups.truncate(start, granularity)
+
+        def in_range(qs, granularity, default_window=None):
+            qs = qs.filter(granularity=granularity)
+            start = start_of(granularity, default_window)
+            if start is not None:
+                qs = qs.filter(bucket__gte=start)
+            if date_to is not None:
+                qs = qs.filter(bucket__lte=date_to)
+            return qs
+
+        def unfolded_in_range(target, granularity, default_window=None):
+            """``((bucket, *dimensions), n)`` of the unfolded rows, like ``in_range``."""
+            start = start_of(granularity, default_window)
+            return [
+                (key[1:], n) for key, n in unfolded[target].items()
+                if key[0] == granularity and (start is None or key[1] >= start)
+                and (date_to is None or key[1] <= date_to)
+            ]
+
+        def merged(rows, field, extra, order):
+            totals = Counter({row[field]: row['total'] for row in rows})
+            for value, n in extra:
+                totals[value] += n
+            return [{field: value, 'total': total} for value, total in sorted(totals.items(), key=order)]
+
+        days = in_range(ActivityRollup.objects, 'day')
+        unfolded_days = unfolded_in_range(ActivityRollup, 'day')
+        by_action = merged(days.values('action').annotate(total=Sum('count')), 'action',
+                           [(key[1], n) for key, n in unfolded_days], order=lambda item: (-item[1], item[0]))
+        by_status_class = merged(days.values('status_class').annotate(total=Sum('count')), 'status_class',
+                                 [(key[2], n) for key, n in unfolded_days], order=lambda item: item[0])
+        daily_errors = merged(
+            in_range(ErrorRollup.objects, 'day')
+            .annotate(date=TruncDate('bucket', tzinfo=dt_timezone.utc))
+            .values('date').annotate(total=Sum('count')),
+            'date', [(key[0].date(), n) for key, n in unfolded_in_range(ErrorRollup, 'day')],
+            order=lambda item: item[0],
+        )
+        window = self.default_windows[granularity]
+        activity, errors = (
+            merged(in_range(target.objects, granularity, window).values('bucket').annotate(total=Sum('count')),
+                   'bucket', [(key[0], n) for key, n in unfolded_in_range(target, granularity, window)],
+                   order=lambda item: item[0])
+            for target in (ActivityRollup, ErrorRollup)
         )
+        return {
+            'by_action': by_action,
+            'by_status_class': by_status_class,
+            'daily_errors': daily_errors,
+            'activity': activity,
+            'errors': errors,
+        }
+
+
+class LogIngestView(generics.GenericAPIView):
+    """Bulk-load NDJSON activity records; send ``Content-Encoding: gzip`` for compressed bodies."""
+    permission_classes = [IsAdmin]
+    # The body is read as a stream, never parsed as a whole.
+    parser_classes = []
+
+    def post(self, request):
+        stream = request.stream
+        if stream is None:
+            return Response(ingest.IngestResult().as_dict())
+        compressed = request.headers.get('Content-Encoding', '').lower() == 'gzip'
+        try:
+            result = ingest.ActivityIngest().run(ingest.open_input(stream, compressed=compressed))
+        except (OSError, EOFError) as exc:
+            raise ValidationError({'detail': f'Could not read request body: {exc}'})
+        return Response(result.as_dict())
+
+
+@policy.log_read
+class LogTraceView(generics.GenericAPIView):
+    """Every activity and error row logged for one request id, oldest first.
+
+    Both reads are range lookups on the ``(request_id, timestamp)`` indexes;
+    archived rows are not included.
+    """
+    permission_classes = [IsAdmin]
+
+    def get(self, request, request_id):
+        if not is_request_id(request_id):
+            raise ValidationError({'request_id': 'Invalid request id'})
+        activities = ActivityLog.objects.filter(request_id=request_id).order_by('timestamp', 'id')
+        errors = ErrorLog.objects.filter(request_id=request_id).order_by('timestamp', 'id')
         return Response({
-            'by_action': list(by_action),
-            'daily_errors': list(daily_errors)
+            'request_id': request_id,
+            'activities': list(exports.ACTIVITY_EXPORT.row_format.rows(activities)),
+            'errors': list(exports.ERROR_EXPORT.row_format.rows(errors)),
         })
+
+
+def _tail_access(request):
+    """Runs the API's authenticators; returns an error response or None."""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        allowed = IsAdmin().has_permission(drf_request, None)
+    except APIException as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+    if not allowed:
+        status = 403 if drf_request.user.is_authenticated else 401
+        return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=status)
+    return None
+
+
+def _tail_params(params, headers):
+    kind = params.get('kind', 'activity')
+    if kind not in tail.MODELS:
+        raise ValueError(f'kind must be one of {sorted(tail.MODELS)}')
+    filters = {}
+    for name in ('user_id', 'status_code'):
+        if params.get(name):
+            filters[name] = int(params[name])
+    if params.get('action'):
+        if kind != 'activity':
+            raise ValueError('action only applies to activity logs')
+        filters['action'] = params['action']
+    last_id = params.get('last_id') or headers.get('Last-Event-ID')
+    return kind, filters, int(last_id) if last_id else None
+
+
+@policy.log_read
+async def log_tail(request):
+    """Server-Sent Events stream of new log rows (``?kind=activity|error``).
+
+    Filters: ``user_id``, ``action`` (activity only), ``status_code``. A
+    ``last_id`` parameter or ``Last-Event-ID`` header replays the rows written
+    after it before going live.
+    """
+    denied = await sync_to_async(_tail_access)(request)
+    if denied is not None:
+        return denied
+    try:
+        kind, filters, last_id = _tail_params(request.GET, request.headers)
+    except ValueError as exc:
+        return JsonResponse({'detail': str(exc)}, status=400)
+
+    is_async = isinstance(request, ASGIRequest)
+    loop = asyncio.get_running_loop() if is_async else None
+    subscriber = tail.broker.subscribe(kind, filters, loop=loop)
+    stream = tail.Stream(subscriber, tail.MODELS[kind].objects.filter(**filters), last_id)
+    return tail.EventStreamResponse(stream, is_async)
+
+
+@policy.unlogged
+@require_safe
+def metrics_view(request):
+    """Prometheus text exposition of the in-process metrics; never queries the database.
+
+    Requires ``Authorization: Bearer <LOG_METRICS_TOKEN>`` when that setting is set.
+    """
+    token = getattr(settings, 'LOG_METRICS_TOKEN', None)
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized\n', status=401, content_type='text/plain')
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+class LatencyView(generics.GenericAPIView):
+    """p50/p95/p99 per endpoint and time bucket from this process's histograms."""
+    permission_classes = [IsAdmin]
+    bucket_seconds = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+    def get(self, request):
+        granularity = request.query_params.get('granularity', 'minute')
+        if granularity not in self.bucket_seconds:
+            raise ValidationError({'granularity': f'Expected one of {", ".join(self.bucket_seconds)}'})
+        date_from = parse_bound(request.query_params.get('date_from'))
+        date_to = parse_bound(request.query_params.get('date_to'))
+        snapshot = latency.recorder.snapshot(
+            start=date_from.timestamp() if date_from else None,
+            end=date_to.timestamp() if date_to else None,
+            endpoint=request.query_params.get('endpoint'),
+            bucket_seconds=self.bucket_seconds[granularity],
+        )
+
+        endpoints = {}
+        for (endpoint, bucket), hist in sorted(snapshot.items()):
+            entry = endpoints.setdefault(endpoint, {
+                'endpoint': endpoint, 'overall': latency.LogHistogram(), 'buckets': [],
+            })
+            entry['overall'].merge(hist)
+            entry['buckets'].append({'bucket': latency.bucket_start(bucket), **hist.summary()})
+        results = [{**entry, 'overall': entry['overall'].summary()} for entry in endpoints.values()]
+        results.sort(key=lambda entry: entry['overall']['p95_ms'], reverse=True)
+        return Response({'granularity': granularity, 'endpoints': results})